@@ -131,4 +131,50 @@ MEDIA_URL = '/media/' # when we upload media files, we have a url to accress the
 MEDIA_ROOT = '/vol/web/media' # it simply tells django where to store the media files (we created this file in our dockerfile)
 STATIC_ROOT = '/vol/web/static' # this is where all the static files will be stored (JS and CSS files)
 
+# resized copies of the uploaded recipe images (see core.images)
+RECIPE_IMAGE_SIZES = (128, 512, 1024) # longest side in pixels
+RECIPE_IMAGE_FORMATS = ('webp', 'jpeg') # the ones Pillow can't write are skipped
+RECIPE_IMAGE_QUALITY = 80
+# /api/recipe/recipes/{id}/image/?w=&h=&fmt= resizes on demand and caches
+# the results on disk (see core.thumbnails)
+RECIPE_IMAGE_MAX_SIZE = 2048 # largest w/h that can be asked for
+RECIPE_IMAGE_CACHE_DIR = 'cache/recipe' # under MEDIA_ROOT
+RECIPE_IMAGE_CACHE_BYTES = 512 * 1024 * 1024 # the least recently used files are deleted past that
+
 AUTH_USER_MODEL = 'core.User'
+
+# the rendered recipe, tag and ingredient lists and the token lookups are
+# cached here. the lists are keyed by the change version, read from the db,
+# so a per process cache never serves a stale one; a cache the processes
+# share (memcached, redis) only saves building the same list in each of them
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_LIST_CACHE_SIZE = 1000 # lists kept in memory by each process, on top of the shared cache
+RECIPE_LIST_CACHE_MAX_BYTES = 512 * 1024 # bigger lists are not cached
+RECIPE_LIST_CACHE_TIMEOUT = 600 # seconds in the shared cache
+
+# tokens (and their users) remembered by CachedTokenAuthentication, a deleted
+# token is forgotten by the shared cache right away but other processes can
+# still accept it for AUTH_TOKEN_CACHE_LOCAL_TTL seconds. the same goes for
+# the signed tokens of a user whose token_version was bumped
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_LOCAL_TTL = 10
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
+# 'db' makes /api/user/token/ return rest_framework tokens (stored in the
+# db), 'signed' short lived signed tokens sent as "Authorization: Bearer ..."
+# and renewed with /api/user/token/refresh/. both are always accepted
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'db')
+AUTH_SIGNED_TOKEN_MAX_AGE = 15 * 60 # seconds
+AUTH_SIGNED_TOKEN_REFRESH_MAX_AGE = 7 * 24 * 60 * 60 # seconds since the login a token can still be refreshed
+
+# build the recipe, tag and ingredient lists as json inside postgres (with
+# json_agg) instead of serializing them in python. ignored on other databases
+RECIPE_LIST_JSON_AGG = os.environ.get('RECIPE_LIST_JSON_AGG') == '1'
@@ -0,0 +1 @@
+default_app_config = 'core.apps.CoreConfig' # makes django use CoreConfig (and its ready method) for the core app
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self): # runs once django has loaded all the models
+        from . import signals  # noqa: F401 (importing it connects the signal handlers)
@@ -0,0 +1,210 @@
+import hashlib
+import pickle
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import LRUCache
+
+
+TOKEN_CACHE_KEY = 'core:auth-token:{}'
+USER_CACHE_KEY = 'core:auth-user:{}'
+SIGNED_TOKEN_SALT = 'core.authentication.signed-token'
+
+user_cache = LRUCache(
+    max_size = settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl = settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+)
+
+
+def dump_user(user):
+    """Pickle a user for the caches, without its password hash"""
+    # the caches are shared by every process (and whoever can read the cache
+    # server), the hash stays in the db. the password of a loaded user is
+    # deferred: read from the db if it's ever used, and left out when it's
+    # saved
+    return pickle.dumps(
+        [getattr(user, name) for name in _cached_user_fields()],
+        pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def load_user(data):
+    """Return a user pickled by dump_user"""
+    model = get_user_model()
+    return model.from_db(
+        model.objects.db, _cached_user_fields(), pickle.loads(data),
+    )
+
+
+def _cached_user_fields():
+    """Return the attnames of the user fields kept in the caches"""
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname != 'password'
+    ]
+
+
+def token_cache_key(key):
+    """Return the cache key of a token"""
+    # the token itself is never used as a key, so it doesn't end up in the
+    # cache server's logs or key listings
+    return TOKEN_CACHE_KEY.format(
+        hashlib.sha256(key.encode('utf-8')).hexdigest()
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication remembering which user a token belongs to"""
+    # TokenAuthentication reads the token and its user from the db on every
+    # request. we keep the token (with its user) in a small in-process LRU in
+    # front of django's cache. the handlers in core.signals drop a token from
+    # both when it is deleted or its user is saved (deactivated, changed).
+    # other processes can't be told about it, their in-process copies expire
+    # after AUTH_TOKEN_CACHE_LOCAL_TTL seconds
+    local_cache = LRUCache(
+        max_size = settings.AUTH_TOKEN_CACHE_SIZE,
+        ttl = settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+    )
+    cache_timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+    shared_hits = 0 # found in django's cache after missing the in-process one
+    db_lookups = 0
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        data = self.local_cache.get(cache_key) # pickled, every request gets its own objects to change
+        if data is None:
+            data = cache.get(cache_key)
+            if data is not None:
+                type(self).shared_hits += 1
+                self.local_cache.set(cache_key, data)
+        if data is not None:
+            token, user_data = pickle.loads(data)
+            token.user = load_user(user_data)
+        else:
+            type(self).db_lookups += 1
+            user, token = super().authenticate_credentials(key) # raises AuthenticationFailed for unknown tokens and inactive users
+            data = pickle.dumps(
+                (Token(key = token.key, user_id = user.pk, created = token.created),
+                 dump_user(user)),
+                pickle.HIGHEST_PROTOCOL,
+            ) # the token without its user, dump_user leaves the password out
+            self.local_cache.set(cache_key, data)
+            cache.set(cache_key, data, self.cache_timeout)
+        if not token.user.is_active: # the cached users are active, just in case
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        return (token.user, token)
+
+    @classmethod
+    def forget(cls, keys):
+        """Drop tokens from the caches"""
+        cache_keys = [token_cache_key(key) for key in keys]
+        for cache_key in cache_keys:
+            cls.local_cache.delete(cache_key)
+        cache.delete_many(cache_keys)
+
+    @classmethod
+    def stats(cls):
+        """Return the hit/miss counters of this process"""
+        return {
+            'local_hits': cls.local_cache.hits,
+            'shared_hits': cls.shared_hits,
+            'misses': cls.db_lookups,
+            'size': len(cls.local_cache),
+        }
+
+
+def get_cached_user(user_id):
+    """Return a user from the caches (or the db), None if there's none"""
+    # like the tokens of CachedTokenAuthentication: pickled in an in-process
+    # LRU in front of django's cache, dropped when the user is saved/deleted
+    cache_key = USER_CACHE_KEY.format(user_id)
+    data = user_cache.get(cache_key)
+    if data is None:
+        data = cache.get(cache_key)
+        if data is not None:
+            user_cache.set(cache_key, data)
+    if data is not None:
+        return load_user(data)
+
+    user = get_user_model().objects.filter(pk = user_id).first()
+    if user is not None:
+        data = dump_user(user)
+        user_cache.set(cache_key, data)
+        cache.set(cache_key, data, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    return user
+
+
+def forget_users(user_ids):
+    """Drop users from the caches"""
+    cache_keys = [USER_CACHE_KEY.format(pk) for pk in user_ids]
+    for cache_key in cache_keys:
+        user_cache.delete(cache_key)
+    cache.delete_many(cache_keys)
+
+
+def create_signed_token(user, issued_at = None):
+    """Return a signed token for a user"""
+    # "<user id>:<token version>:<issued at>:<timestamp>:<signature>",
+    # nothing is stored. the signature is an HMAC made with the SECRET_KEY.
+    # issued at is the time of the login, a refreshed token keeps the one of
+    # the token it replaces (see read_signed_token)
+    if issued_at is None:
+        issued_at = int(time.time())
+    return signing.TimestampSigner(salt = SIGNED_TOKEN_SALT).sign(
+        f'{user.pk}:{user.token_version}:{issued_at}'
+    )
+
+
+def read_signed_token(key):
+    """Return the (user id, token version, issued at) of a signed token"""
+    try:
+        value = signing.TimestampSigner(salt = SIGNED_TOKEN_SALT).unsign(
+            key, max_age = settings.AUTH_SIGNED_TOKEN_MAX_AGE,
+        )
+        user_id, token_version, issued_at = (
+            int(part) for part in value.split(':')
+        ) # the tokens made before issued at was added are rejected too
+    except (signing.BadSignature, ValueError): # SignatureExpired is a BadSignature too
+        raise exceptions.AuthenticationFailed(
+            SignedTokenAuthentication.invalid_message
+        )
+
+    return user_id, token_version, issued_at
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """Authenticate with the signed tokens of create_signed_token"""
+    # clients send "Authorization: Bearer <token>". checking the signature
+    # (in constant time) and the age needs no db, the user comes from the
+    # same caches as the other tokens, so it's only read on a miss. a token
+    # made with an older token version of the user (see
+    # User.revoke_signed_tokens) is rejected: right away by this process and
+    # the shared cache, by the other processes once their in-process copy of
+    # the user expires (AUTH_TOKEN_CACHE_LOCAL_TTL seconds). the refresh
+    # endpoint reads the user from the db, a revoked token is never renewed
+    keyword = 'Bearer'
+    invalid_message = _('Invalid or expired token.')
+
+    def authenticate_credentials(self, key):
+        user_id, token_version = read_signed_token(key)[:2]
+        user = get_cached_user(user_id)
+        if user is None or user.token_version != token_version:
+            raise exceptions.AuthenticationFailed(self.invalid_message)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        return (user, key)
@@ -0,0 +1,116 @@
+"""Reference counting of the recipe image files
+
+With content addressed names (see core.storage) recipes can share an image
+file, and its resized copies. ImageBlob.refs counts the recipes using each
+file: acquire() when a recipe starts using one, release() when it stops
+(its image replaced, the recipe deleted). The files are deleted once the
+last user lets go, after the transaction commits so a rollback never leaves
+a recipe pointing to a deleted file, while holding the ImageBlob row so a
+recipe acquiring the same file meanwhile waits and writes it again.
+
+The images uploaded before the content addressed storage have no ImageBlob
+row, they are deleted when no recipe has them anymore.
+"""
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .images import delete_derivatives, load_images
+from .models import ImageBlob, Recipe
+
+
+def acquire(name, images = ''):
+    """Count one more recipe using an image file, return True if it's there
+
+    The file and its copies (images) are checked once the count is taken: a
+    file released by another recipe meanwhile may have been deleted after it
+    was found already stored, the caller has to write it again.
+    """
+    if not name:
+        return True
+    with transaction.atomic():
+        # the update waits for a _delete_unused() holding the row, and the
+        # insert for one that is creating it, the files are checked after
+        if not ImageBlob.objects.filter(name = name).update(refs = F('refs') + 1):
+            try:
+                with transaction.atomic(): # only this insert is rolled back if another one made the row first
+                    ImageBlob.objects.create(name = name, refs = 1)
+            except IntegrityError:
+                ImageBlob.objects.filter(name = name).update(refs = F('refs') + 1)
+
+        return all(
+            default_storage.exists(file_name)
+            for file_name in [name] + _derivative_names(images)
+        )
+
+
+def release(name, images = '', count = 1):
+    """Count count fewer recipes using an image, delete it if none is left"""
+    # images are the resized copies (Recipe.images) deleted with the file
+    if not name:
+        return
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(name = name).first()
+        if blob is not None and blob.refs > count:
+            blob.refs -= count
+            blob.save(update_fields = ['refs'])
+            return
+        if blob is not None: # deleted with the files, it's what acquire() waits on
+            blob.refs = 0
+            blob.save(update_fields = ['refs'])
+    discard(name, images)
+
+
+def release_recipes(rows):
+    """Release the images of deleted recipes, rows of (image, images, count)"""
+    counts = Counter()
+    copies = {}
+    for name, images, count in rows: # a name can come with different images
+        if name:
+            counts[name] += count
+            copies[name] = images or copies.get(name, '')
+    for name, count in counts.items():
+        release(name, copies[name], count)
+
+
+def discard(name, images = ''):
+    """Delete an image file and its copies, unless a recipe uses it"""
+    transaction.on_commit(lambda: _delete_unused(name, images))
+
+
+def _delete_unused(name, images):
+    """Delete an image file and its copies if nothing uses them"""
+    # checked again, the same content may have been uploaded since. the row
+    # is locked (made if there's none) until the files are deleted, so an
+    # acquire() of the same name waits and finds them gone
+    with transaction.atomic():
+        blob = _lock_blob(name)
+        if blob.refs:
+            return
+        if not Recipe.objects.filter(image = name).exists(): # the images stored before have no row
+            default_storage.delete(name)
+            delete_derivatives(images)
+        blob.delete()
+
+
+def _lock_blob(name):
+    """Return the locked ImageBlob row of a name, made with no refs if missing"""
+    while True:
+        try:
+            with transaction.atomic():
+                ImageBlob.objects.create(name = name, refs = 0) # waits for an acquire() inserting the same name
+        except IntegrityError:
+            pass
+        blob = ImageBlob.objects.select_for_update().filter(name = name).first()
+        if blob is not None: # else deleted by another _delete_unused() meanwhile
+            return blob
+
+
+def _derivative_names(images):
+    """Return the names of the copies stored on a recipe"""
+    return [
+        derivative for names in load_images(images).values()
+        for derivative in names.values()
+    ]
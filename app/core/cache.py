@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Small thread-safe in-process cache dropping the least recently used"""
+    # sits in front of django's cache (which can be shared by every process,
+    # so it costs a network round trip). entries can expire after ttl seconds
+    # and the cache never holds more than max_size of them
+
+    def __init__(self, max_size = 1000, ttl = None):
+        self.max_size = max_size
+        self.ttl = ttl # None keeps the entries until they are pushed out
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict() # key: (expires, value), the most recently used last
+        self._lock = threading.Lock()
+
+    def get(self, key, default = None):
+        """Return the value of a key or default if it's missing/expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and \
+                    entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, dropping the oldest entries if there's no room"""
+        if self.max_size <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last = False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return the hit/miss counters and the number of entries"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
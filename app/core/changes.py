@@ -0,0 +1,18 @@
+from . import search
+from .counters import add_recipe_counts
+from .models import Tag, Ingredient
+from .versions import bump_version
+
+
+def bulk_recipes_changed(recipe_ids, user_ids, tag_changes = None,
+                         ingredient_changes = None):
+    """Do what the signal handlers do, for recipes written in bulk"""
+    # bulk_create(), update() and the raw through table inserts don't send
+    # post_save/m2m_changed, whoever uses them calls this once for the batch:
+    # it re-indexes the recipes, adds the links made (or removed, negative)
+    # to the counts of the tags/ingredients ({id: n}) and bumps the change
+    # version of their owners
+    search.update_search_index(recipe_ids)
+    add_recipe_counts(Tag, tag_changes or {})
+    add_recipe_counts(Ingredient, ingredient_changes or {})
+    bump_version(user_ids)
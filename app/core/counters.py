@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+CHUNK_SIZE = 500 # ids updated per query, keeps the number of query params bounded
+
+
+def _recipe_count(model):
+    """Return the expression counting the recipes of a tag/ingredient"""
+    field = model._meta.get_field('recipe').field # Recipe.tags / Recipe.ingredients
+    column = field.m2m_reverse_name() # tag_id / ingredient_id
+    counts = field.remote_field.through.objects.filter(**{
+        column: OuterRef('pk'),
+    }).order_by().values(column).annotate(count = Count('*')).values('count')
+
+    return Coalesce(
+        Subquery(counts, output_field = IntegerField()), 0 # no links gives no row, not 0
+    )
+
+
+def add_recipe_counts(model, changes):
+    """Add to the recipe counts of tags/ingredients, changes is {id: n}"""
+    # recipe_count + n is computed on the row as it is once the UPDATE holds
+    # its lock, so the links made by concurrent transactions add up, and no
+    # link is read (a recount reads every link of the tag)
+    by_change = defaultdict(list)
+    for pk, change in changes.items():
+        if pk is not None and change:
+            by_change[change].append(pk)
+    updated = 0
+    for change, ids in sorted(by_change.items()):
+        ids.sort() # updating in id order avoids deadlocks between transactions
+        for i in range(0, len(ids), CHUNK_SIZE):
+            updated += model.objects.filter(
+                pk__in = ids[i:i + CHUNK_SIZE]
+            ).update(recipe_count = F('recipe_count') + change)
+
+    return updated
+
+
+def update_recipe_counts(model, ids):
+    """Recount the recipes using some tags/ingredients"""
+    # recomputed from the through table, only to repair counts (see
+    # rebuild_recipe_counts), the writes add to them with add_recipe_counts
+    recipe_count = _recipe_count(model)
+    ids = sorted({pk for pk in ids if pk is not None})
+    updated = 0
+    for i in range(0, len(ids), CHUNK_SIZE):
+        updated += model.objects.filter(
+            pk__in = ids[i:i + CHUNK_SIZE]
+        ).update(recipe_count = recipe_count)
+
+    return updated
+
+
+def rebuild_recipe_counts(model):
+    """Fix the wrong counts of a model, return the (id, user id) fixed"""
+    # only the rows whose count is wrong are written (and their owners' lists
+    # changed), on a healthy table this is a single read
+    wrong = list(
+        model.objects.annotate(actual = _recipe_count(model))
+        .exclude(recipe_count = F('actual'))
+        .values_list('pk', 'user_id')
+    )
+    update_recipe_counts(model, [pk for pk, user_id in wrong])
+
+    return wrong
@@ -0,0 +1,192 @@
+"""Processing of the uploaded recipe images
+
+The image_worker (see core.jobs) turns the EXIF orientation of an upload
+into real rotated pixels and drops its metadata (the camera, often the GPS
+position) by saving it again, under the hash of its new content (see
+core.storage). It then saves resized copies (derivatives) at the sizes of
+RECIPE_IMAGE_SIZES (the longest side in pixels, never enlarged) in each
+format of RECIPE_IMAGE_FORMATS, next to the original:
+uploads/recipe/ab/cd/<hash>_<size>.<ext>. What was written is kept on the
+recipe (Recipe.images) as {size: {format: name}}.
+
+When the original doesn't have to be saved again, JPEGs are decoded at the
+smallest scale (1/2, 1/4 or 1/8) still bigger than the largest size with
+draft(), so a photo isn't decoded at full resolution just to be shrunk.
+Every size is resized from the one above it rather than from the original.
+"""
+import io
+import json
+import os
+
+from PIL import Image, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .models import Recipe
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+ORIGINAL_QUALITY = 95 # JPEG quality of an original saved again
+
+EXIF_ORIENTATION = 0x0112
+# the transposition undoing each EXIF orientation (1 is already upright),
+# this Pillow has no ImageOps.exif_transpose()
+ORIENTATIONS = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+
+def image_formats():
+    """Return the configured formats this Pillow can write"""
+    return [
+        fmt for fmt in settings.RECIPE_IMAGE_FORMATS
+        if fmt != 'webp' or features.check('webp') # needs Pillow built with libwebp
+    ]
+
+
+def derivative_name(name, size, fmt):
+    """Return the storage name of a derivative of an image"""
+    return f'{os.path.splitext(name)[0]}_{size}.{EXTENSIONS[fmt]}'
+
+
+def load_images(value):
+    """Return the {size: {format: name}} stored on a recipe"""
+    return json.loads(value) if value else {}
+
+
+def process_image(name, storage = default_storage):
+    """Clean an uploaded image and make its derivatives
+
+    Return the name of the image to keep (a new one if it had metadata) and
+    its derivatives by size and format.
+    """
+    sizes = sorted(settings.RECIPE_IMAGE_SIZES, reverse = True)
+    with storage.open(name) as file:
+        image = Image.open(file)
+        fmt = image.format
+        orientation = _orientation(image)
+        strip = 'exif' in image.info
+        if sizes and not strip: # the original is kept as it is, only the copies need the pixels
+            image.draft('RGB', (sizes[0], sizes[0])) # only JPEGs can be decoded smaller, ignored for the rest
+        image.load() # read the pixels before the file is closed
+
+    if orientation in ORIENTATIONS:
+        image = image.transpose(ORIENTATIONS[orientation])
+    if strip:
+        name = _save_original(image, name, fmt)
+
+    return name, make_derivatives(image, name, sizes, storage)
+
+
+def make_derivatives(image, name, sizes, storage = default_storage):
+    """Write the derivatives of an image, return them by size and format"""
+    formats = image_formats()
+    if not sizes or not formats:
+        return {}
+
+    image = _to_rgb(image)
+    derivatives = {}
+    for size in sorted(sizes, reverse = True): # largest first, each one is resized from the previous
+        image.thumbnail((size, size), Image.LANCZOS) # keeps the aspect ratio, doesn't enlarge
+        derivatives[str(size)] = {
+            fmt: _save(image, derivative_name(name, size, fmt), fmt, storage)
+            for fmt in formats
+        }
+
+    return derivatives
+
+
+def resize_image(name, width, height, fmt, storage = default_storage):
+    """Return an image fit in width x height (either can be None), encoded"""
+    with storage.open(name) as file:
+        image = Image.open(file)
+        orientation = _orientation(image) # not applied yet while the worker hasn't run
+        turned = orientation in (5, 6, 7, 8) # by a quarter, the sides swap
+        size = image.size[::-1] if turned else image.size
+        ratio = min(
+            limit / side for limit, side in zip((width, height), size) if limit
+        )
+        ratio = min(ratio, 1) # never enlarged
+        target = (max(round(size[0] * ratio), 1), max(round(size[1] * ratio), 1))
+        image.draft('RGB', target[::-1] if turned else target)
+        image.load()
+
+    if orientation in ORIENTATIONS:
+        image = image.transpose(ORIENTATIONS[orientation])
+    image = _to_rgb(image)
+    if image.size != target:
+        image = image.resize(target, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(
+        buffer, format = fmt.upper(), quality = settings.RECIPE_IMAGE_QUALITY,
+    )
+
+    return buffer.getvalue()
+
+
+def delete_derivatives(images, storage = default_storage):
+    """Delete the files of the derivatives stored on a recipe"""
+    for names in load_images(images).values():
+        for name in names.values():
+            storage.delete(name)
+
+
+def _orientation(image):
+    """Return the EXIF orientation of an image, 1 if it has none"""
+    if not hasattr(image, '_getexif'): # only JPEGs (and WebPs) have EXIF
+        return 1
+    try:
+        exif = image._getexif() or {}
+    except Exception: # a broken EXIF block doesn't make the image unusable
+        return 1
+
+    return exif.get(EXIF_ORIENTATION, 1)
+
+
+def _to_rgb(image):
+    """Return an image in RGB, transparency over a white background"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask = image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+
+    return image
+
+
+def _save_original(image, name, fmt):
+    """Save an image again without its metadata, return the new name"""
+    options = {}
+    if image.info.get('icc_profile'): # the colors, not metadata
+        options['icc_profile'] = image.info['icc_profile']
+    if fmt == 'JPEG':
+        options['quality'] = ORIGINAL_QUALITY
+    buffer = io.BytesIO()
+    image.save(buffer, format = fmt, **options) # Pillow only writes the exif it is given
+
+    return Recipe._meta.get_field('image').storage.save(
+        name, ContentFile(buffer.getvalue()),
+    ) # named after its new content
+
+
+def _save(image, name, fmt, storage):
+    """Encode and store one derivative, return its storage name"""
+    # the copies are named after their image, whose name is the hash of its
+    # content: existing ones were made for another recipe using the image
+    if storage.exists(name):
+        return name
+    buffer = io.BytesIO()
+    image.save(
+        buffer, format = fmt.upper(), quality = settings.RECIPE_IMAGE_QUALITY,
+    )
+
+    return storage.save(name, ContentFile(buffer.getvalue()))
@@ -0,0 +1,113 @@
+"""Queue of the uploaded recipe images, kept in the database
+
+upload_image only stores the original and adds an ImageJob, the slow Pillow
+work (see core.images) is done by the image_worker command. Workers claim
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can run
+against the same table without taking the same job, and mark them claimed
+(claimed_at) before the transaction ends: a worker holds no lock while it
+processes, and the jobs of a worker that died are claimed again once
+CLAIM_TIMEOUT has passed.
+
+The files are processed by process_files() in the worker's child processes,
+which never touch the database, the results are written by finish_job() in
+the main process.
+"""
+import json
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import blobs, images
+from .models import ImageJob, Recipe
+
+CLAIM_TIMEOUT = timedelta(minutes = 10) # a job claimed longer ago than that is given to another worker
+MAX_ATTEMPTS = 3 # the image is marked failed after that many errors
+RETRY_DELAY = timedelta(minutes = 1) # between two attempts
+
+
+def enqueue_image(recipe):
+    """Queue the processing of a recipe's new image"""
+    # the jobs of a previous upload that no worker took yet would only
+    # process an image the recipe doesn't have anymore
+    ImageJob.objects.filter(recipe = recipe, claimed_at = None).delete()
+    return ImageJob.objects.create(recipe = recipe, image = recipe.image.name)
+
+
+def claim_jobs(limit):
+    """Claim the next jobs for this worker, return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked = True) # the rows other workers are claiming are skipped, not waited for
+            .filter(Q(claimed_at = None) | Q(claimed_at__lt = now - CLAIM_TIMEOUT))
+            .order_by('id')[:limit]
+        )
+        ImageJob.objects.filter(pk__in = [job.pk for job in jobs]).update(
+            claimed_at = now, attempts = F('attempts') + 1,
+        )
+    for job in jobs:
+        job.claimed_at = now
+        job.attempts += 1
+
+    return jobs
+
+
+def process_files(job):
+    """Process the image of a (job id, recipe id, image name)"""
+    # runs in the worker's child processes, returns the arguments of
+    # finish_job()
+    try:
+        name, derivatives = images.process_image(job[2])
+    except Exception:
+        return job + (None, None, traceback.format_exc())
+
+    return job + (name, derivatives, '')
+
+
+def finish_job(job_id, recipe_id, image, name, derivatives, error = ''):
+    """Write the outcome of a job to its recipe, return the job's status"""
+    with transaction.atomic():
+        job = ImageJob.objects.select_for_update().filter(pk = job_id).first() # None if another worker already finished it
+        recipe = Recipe.objects.select_for_update() \
+            .filter(pk = recipe_id).first()
+        current = job is not None and recipe is not None and \
+            recipe.image.name == image # not replaced while it was processed
+        if current and not error and name != image and \
+                not blobs.acquire(name, json.dumps(derivatives)):
+            # the original saved again (or its copies) was found stored, then
+            # deleted by the last recipe letting the same file go
+            blobs.release(name)
+            error = f'{name} or its copies were deleted while processing\n'
+
+        if error and current and job.attempts < MAX_ATTEMPTS:
+            # claimed again RETRY_DELAY from now, like a job whose
+            # claim is that close to timing out
+            job.claimed_at = timezone.now() - CLAIM_TIMEOUT + RETRY_DELAY
+            job.error = error
+            job.save(update_fields = ['claimed_at', 'error'])
+            return 'retry'
+        if job is not None:
+            job.delete()
+        if current and error:
+            recipe.image_status = 'failed'
+            recipe.save(update_fields = ['image_status', 'updated_at'])
+        elif current:
+            recipe.image = name
+            recipe.images = json.dumps(derivatives)
+            recipe.image_status = 'ready'
+            recipe.save(update_fields = [
+                'image', 'images', 'image_status', 'updated_at',
+            ])
+            if name != image: # the original with its metadata was replaced, the new one acquired above
+                blobs.release(image)
+        elif not error:
+            # made for an image the recipe doesn't have (anymore). the
+            # files are only deleted if no other recipe uses the same ones
+            blobs.discard(name, json.dumps(derivatives))
+    if not current:
+        return 'stale'
+
+    return 'failed' if error else 'ready'
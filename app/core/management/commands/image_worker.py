@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import claim_jobs, finish_job, process_files
+from core.models import ImageJob
+
+
+def _ignore_interrupt():
+    """Leave Ctrl-C to the main process, which stops the pool"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Command(BaseCommand):
+    """Django command processing the uploaded recipe images"""
+    help = 'Process the queued recipe images (orientation, metadata, resized copies)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type = int, default = os.cpu_count(),
+            help = 'Images processed at the same time, 0 to process them in this process',
+        )
+        parser.add_argument(
+            '--batch-size', type = int, default = None,
+            help = 'Jobs claimed at once (twice the processes by default)',
+        )
+        parser.add_argument(
+            '--interval', type = float, default = 1.0,
+            help = 'Seconds to wait when there is nothing to do',
+        )
+        parser.add_argument(
+            '--once', action = 'store_true',
+            help = 'Stop when the queue is empty instead of waiting for jobs',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        batch_size = options['batch_size'] or max(processes, 1) * 2
+        # the child processes only read and write the image files, the
+        # database is used by this process only
+        pool = None
+        if processes:
+            pool = multiprocessing.Pool(processes, _ignore_interrupt)
+        run = pool.imap_unordered if pool else map # results as they are ready
+        pending = set()
+        processed = 0
+        try:
+            while True:
+                jobs = claim_jobs(batch_size)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                pending = {job.pk for job in jobs}
+                for outcome in run(process_files, [
+                    (job.pk, job.recipe_id, job.image) for job in jobs
+                ]):
+                    status = finish_job(*outcome)
+                    pending.discard(outcome[0])
+                    processed += 1
+                    self.stdout.write(f'{outcome[2]}: {status}')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            # handed back to the queue instead of waiting for CLAIM_TIMEOUT
+            ImageJob.objects.filter(pk__in = pending) \
+                .update(claimed_at = None)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images'))
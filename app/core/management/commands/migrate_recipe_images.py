@@ -0,0 +1,90 @@
+import json
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import blobs
+from core.images import derivative_name, load_images
+from core.models import Recipe
+from core.storage import is_blob_name
+from core.versions import bump_version
+
+
+class Command(BaseCommand):
+    """Django command to move the recipe images to content addressed names"""
+    help = 'Store the images uploaded before the content addressed storage under the hash of their content'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type = int, default = 1000,
+            help = 'Recipes read per round trip to the database',
+        )
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        # one pass over the recipes with a server-side cursor, each image is
+        # moved in its own transaction so the command can be stopped and
+        # run again, the images already moved are skipped
+        rows = Recipe.objects.exclude(image = '').exclude(image = None) \
+            .exclude(image_status = 'processing') \
+            .order_by('id').values_list('id', 'user_id', 'image', 'images') \
+            .iterator(chunk_size = options['chunk_size']) # the queued ones are moved by a later run, the worker expects their name
+        counts = {'moved': 0, 'missing': 0, 'changed': 0}
+        for pk, user_id, name, images in rows:
+            if is_blob_name(name):
+                continue
+            try:
+                new_name, new_images = self._copy(storage, name, images)
+            except FileNotFoundError:
+                counts['missing'] += 1
+                self.stderr.write(f'recipe {pk}: {name} not found')
+                continue
+
+            with transaction.atomic():
+                moved = Recipe.objects.filter(pk = pk, image = name).update(
+                    image = new_name, images = json.dumps(new_images),
+                    updated_at = timezone.now(),
+                ) # not if a new image was uploaded meanwhile
+                if moved:
+                    if not blobs.acquire(new_name, json.dumps(new_images)):
+                        self._copy(storage, name, images) # found stored, then deleted by the last recipe letting it go
+                    bump_version([user_id]) # the cached responses have the old urls
+            if moved:
+                blobs.release(name, images) # the old file and its copies
+                counts['moved'] += 1
+            else:
+                blobs.discard(new_name, json.dumps(new_images))
+                counts['changed'] += 1
+            if counts['moved'] and counts['moved'] % 1000 == 0:
+                self.stdout.write(f'{counts["moved"]} images moved')
+
+        self.stdout.write(self.style.SUCCESS(
+            'Moved {moved} images ({missing} missing, {changed} replaced '
+            'while moving)'.format(**counts)
+        ))
+
+    def _copy(self, storage, name, images):
+        """Copy an image and its copies to their new names, return them"""
+        with default_storage.open(name) as file:
+            new_name = storage.save(name, file) # hashed as it is copied
+
+        return new_name, self._copy_derivatives(name, new_name, images)
+
+    def _copy_derivatives(self, name, new_name, images):
+        """Copy the resized copies of an image to the names of the new one"""
+        new_images = {}
+        for size, names in load_images(images).items():
+            new_images[size] = {}
+            for fmt, derivative in names.items():
+                new_derivative = derivative_name(new_name, size, fmt)
+                if not default_storage.exists(new_derivative): # another recipe had the same image
+                    try:
+                        with default_storage.open(derivative) as file:
+                            default_storage.save(new_derivative, file)
+                    except FileNotFoundError:
+                        continue
+                new_images[size][fmt] = new_derivative
+
+        return new_images
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.counters import rebuild_recipe_counts
+from core.models import Tag, Ingredient
+from core.versions import bump_version
+
+
+class Command(BaseCommand):
+    """Django command to recount the recipes of every tag and ingredient"""
+    help = 'Rebuild the recipe_count of tags and ingredients'
+
+    def handle(self, *args, **options):
+        for model in (Tag, Ingredient):
+            with transaction.atomic():
+                fixed = rebuild_recipe_counts(model)
+                bump_version(user_id for pk, user_id in fixed) # their cached lists hold the wrong counts
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: fixed {len(fixed)} counts'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Recipe counts rebuilt'))
@@ -0,0 +1,52 @@
+# Generated by Django 2.1.15 on 2026-10-17 07:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    """Count the recipes using the existing tags and ingredients"""
+    # with the historical models, what this does doesn't change with the
+    # app code (core.counters)
+    recipe = apps.get_model('core', 'Recipe')
+    for model_name, column in (('Tag', 'tag_id'),
+                               ('Ingredient', 'ingredient_id')):
+        model = apps.get_model('core', model_name)
+        through = recipe._meta.get_field(model_name.lower() + 's') \
+            .remote_field.through
+        counts = through.objects.filter(**{column: OuterRef('pk')}) \
+            .order_by().values(column).annotate(count = Count('*')) \
+            .values('count')
+        model.objects.update(recipe_count = Coalesce(
+            Subquery(counts, output_field = models.IntegerField()), 0,
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_ingredient_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_tag_user_count_idx'),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
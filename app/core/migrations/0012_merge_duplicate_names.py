@@ -0,0 +1,64 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge the tags/ingredients a user has twice (ignoring the case)"""
+    # the unique index can't be created while duplicates exist. the oldest
+    # one is kept and takes the recipes of the others. the recounts and the
+    # change version bumps are written against the historical models, not
+    # with core.counters / core.versions, so later app code doesn't change
+    # what this does
+    change_version = apps.get_model('core', 'ChangeVersion')
+    for model_name, column in (('Tag', 'tag_id'),
+                               ('Ingredient', 'ingredient_id')):
+        model = apps.get_model('core', model_name)
+        through = apps.get_model('core', 'Recipe') \
+            ._meta.get_field(model_name.lower() + 's').remote_field.through
+        duplicates = model.objects.annotate(lower_name = Lower('name')) \
+            .values('user_id', 'lower_name') \
+            .annotate(count = Count('id'), keep = Min('id')) \
+            .filter(count__gt = 1).order_by()
+        users = set()
+        for group in duplicates:
+            merged = list(
+                model.objects.annotate(lower_name = Lower('name')).filter(
+                    user_id = group['user_id'],
+                    lower_name = group['lower_name'],
+                ).exclude(id = group['keep']).values_list('id', flat = True)
+            )
+            linked = through.objects.filter(**{column: group['keep']}) \
+                .values('recipe_id')
+            for pk in merged: # one at a time, two of them can share a recipe
+                through.objects.filter(**{column: pk}).filter(
+                    recipe_id__in = linked,
+                ).delete() # recipes already using the one kept
+                through.objects.filter(**{column: pk}).update(**{
+                    column: group['keep'],
+                })
+            model.objects.filter(id__in = merged).delete()
+            users.add(group['user_id'])
+        if not users: # nothing merged
+            continue
+        counts = through.objects.filter(**{column: OuterRef('pk')}) \
+            .order_by().values(column).annotate(count = Count('*')) \
+            .values('count')
+        model.objects.filter(user_id__in = users).update(recipe_count = Coalesce(
+            Subquery(counts, output_field = models.IntegerField()), 0,
+        ))
+        change_version.objects.filter(user_id__in = users).update(
+            version = F('version') + 1, updated_at = timezone.now(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # a migration of its own, postgres can't create the indexes in the
+    # transaction that deleted the duplicates (pending foreign key checks)
+
+    dependencies = [
+        ('core', '0012_merge_duplicate_names'),
+    ]
+
+    operations = [
+        # django 2.1 can't declare an index on an expression, these are
+        # only known to the database (core.names relies on them)
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+             'ON core_tag (user_id, lower(name))'],
+            ['DROP INDEX core_tag_user_lower_name_uniq'],
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_ingredient_user_lower_name_uniq '
+             'ON core_ingredient (user_id, lower(name))'],
+            ['DROP INDEX core_ingredient_user_lower_name_uniq'],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-17 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_unique_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='images',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
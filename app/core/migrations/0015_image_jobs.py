@@ -0,0 +1,43 @@
+# Generated by Django 2.1.15 on 2026-10-17 09:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_images_ready(apps, schema_editor):
+    """The images uploaded before the worker were processed on upload"""
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.exclude(image = '').exclude(image = None) \
+        .update(image_status = 'ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('', 'No image'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Recipe'),
+        ),
+        migrations.RunPython(mark_images_ready, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,18 @@
-import uuid # used to create the name to uniquely identify the image that we assign to the image field
 import os # used to create a valid path for our file destination
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
 
+from .storage import ContentAddressedStorage
+
 
 def recipe_image_file_path(instance, file_name): # A function to create the path to the image on our system, and generate the name for the image on the system after its uploaded
     """generate file path for new recipe image""" # instance is the instance that is creating the path, file_name is the name of the original file uploaded
-    ext = file_name.split('.')[-1] # [-1] means return the last item of the list. here we want to extract the file extension (jpg)
-    filename = f'{uuid.uuid4()}.{ext}' # you can call functions in f strings
-
-    return os.path.join('uploads/recipe/', filename) # this allows you to join to strings to make a valid path, if the path is invalid it will return an error
+    ext = file_name.split('.')[-1].lower() # [-1] means return the last item of the list. here we want to extract the file extension (jpg)
+    # the storage names the file after the hash of its content, only the
+    # directory and the extension are kept from here
+    return os.path.join('uploads/recipe/', f'image.{ext}') # this allows you to join to strings to make a valid path, if the path is invalid it will return an error
 
 
 class UserManager(BaseUserManager):
@@ -42,32 +43,105 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default = True)
     is_staff = models.BooleanField(default = False)
+    token_version = models.PositiveIntegerField(default = 0) # part of the signed tokens, bumping it revokes all of them
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    def revoke_signed_tokens(self):
+        """Make every signed token issued to the user invalid"""
+        self.token_version += 1
+        self.save(update_fields = ['token_version']) # the post_save handler drops the cached user, other processes' copies expire after AUTH_TOKEN_CACHE_LOCAL_TTL
+
+
+class ChangeVersion(models.Model):
+    """Version of a user's recipes, tags and ingredients"""
+    # bumped (by the handlers in core.signals) every time one of them is
+    # created, changed or deleted, so the api can tell clients their copy is
+    # still fresh (ETag / Last-Modified) by reading this row only
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete = models.CASCADE,
+        primary_key = True, # one row per user, looked up by user id
+        related_name = 'change_version',
+    )
+    version = models.BigIntegerField(default = 0)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.version}'
+
+
+class RecipeCountMixin:
+    """Keep save() from writing recipe_count over a newer count"""
+    # the counts are only written by core.counters (when recipes are linked
+    # or deleted), an object loaded before that and saved after it (renamed)
+    # would put the old count back
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and \
+                kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'recipe_count'
+            ]
+        super().save(*args, **kwargs)
+
 
-class Tag(models.Model):
+class Tag(RecipeCountMixin, models.Model):
     """Tag to be used for recipes"""
     name = models.CharField(max_length = 255) # 255 is the maximum possible
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete = models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now = True) # auto_now sets it to the current time every time the object is saved
+    recipe_count = models.PositiveIntegerField(default = 0) # number of recipes using the tag, kept up to date by core.counters
+
+    class Meta:
+        indexes = [
+            # every tag query filters by user and orders by name (with id as
+            # the tie-breaker), so this index serves both the filter and the
+            # ordering without sorting
+            models.Index(
+                fields = ['user', 'name', 'id'],
+                name = 'core_tag_user_name_idx',
+            ),
+            models.Index(
+                fields = ['user', 'recipe_count', 'id'], # ?ordering=-recipe_count (most used first)
+                name = 'core_tag_user_count_idx',
+            ),
+        ]
+        # the names are also unique per user ignoring the case, by the
+        # (user_id, lower(name)) index of the 0013_unique_names migration
 
     def __str__(self):
         """returns the string representation"""
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(RecipeCountMixin, models.Model):
     """Ingredient to be used in a recipe"""
     name = models.CharField(max_length = 255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete = models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now = True)
+    recipe_count = models.PositiveIntegerField(default = 0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields = ['user', 'name', 'id'],
+                name = 'core_ingredient_user_name_idx',
+            ),
+            models.Index(
+                fields = ['user', 'recipe_count', 'id'],
+                name = 'core_ingredient_user_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -85,7 +159,58 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)# the recommended strategy to make it optional is blank=True (if no link is provided set it to blank string). the user can add a link to the recipe optionally
     ingredients = models.ManyToManyField('Ingredient') # A type of foreign keys
     tags = models.ManyToManyField('Tag') # without the quotes around model name(tag), the models should be defined in correct order. So we put them to ignore this issue
-    image = models.ImageField(null=True, upload_to = recipe_image_file_path) # null=true to make this field optional. in the 2nd arg, we dont wanna call the function but to pass a reference to it to be called everytime we upload
+    image = models.ImageField( # null=true to make this field optional. in the 2nd arg, we dont wanna call the function but to pass a reference to it to be called everytime we upload
+        null=True, upload_to = recipe_image_file_path,
+        storage = ContentAddressedStorage(), # stored once per content, the recipes using it are counted by core.blobs
+    )
+    images = models.TextField(blank = True, default = '') # json {size: {format: name}} of the resized copies of image (see core.images)
+    image_status = models.CharField( # where the image_worker is with the uploaded image
+        max_length = 10, blank = True, default = '', choices = (
+            ('', 'No image'),
+            ('processing', 'Processing'),
+            ('ready', 'Ready'),
+            ('failed', 'Failed'),
+        ),
+    )
+    updated_at = models.DateTimeField(auto_now = True)
     # ImageField validates by default that the uploaded object is a valid image
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['user', 'id'], name = 'core_recipe_user_id_idx'), # recipes are listed per user, newest first
+            # range filters and ordering on price and time (id is the
+            # tie-breaker of those orderings)
+            models.Index(
+                fields = ['user', 'price', 'id'],
+                name = 'core_recipe_user_price_idx',
+            ),
+            models.Index(
+                fields = ['user', 'time_minutes', 'id'],
+                name = 'core_recipe_user_time_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class ImageJob(models.Model):
+    """Uploaded recipe image waiting for the image_worker (see core.jobs)"""
+    recipe = models.ForeignKey('Recipe', on_delete = models.CASCADE)
+    image = models.CharField(max_length = 100) # the image to process, the recipe may have another one by the time it runs
+    created_at = models.DateTimeField(auto_now_add = True)
+    claimed_at = models.DateTimeField(null = True) # set while a worker processes it
+    attempts = models.PositiveSmallIntegerField(default = 0)
+    error = models.TextField(blank = True) # traceback of the last failed attempt
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.image}'
+
+
+class ImageBlob(models.Model):
+    """Number of recipes using an image file (see core.blobs)"""
+    name = models.CharField(max_length = 100, primary_key = True) # name of the file in the storage
+    refs = models.PositiveIntegerField(default = 0)
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .versions import bump_version
+
+
+CHUNK_SIZE = 250 # names per query, three params each for the sqlite insert
+
+
+def get_or_create_by_name(model, user_id, names):
+    """Get or create a user's tags/ingredients by name, count the created"""
+    # the missing ones are created with INSERT ... ON CONFLICT DO NOTHING on
+    # the (user_id, lower(name)) unique index, so two requests creating the
+    # same name at once don't fail or duplicate it, then all of them are
+    # read back with one query. they are returned as {name as sent: (id,
+    # name as stored)}, in the order they were sent
+    names = list(OrderedDict.fromkeys(names)) # the first spelling of a name wins, the insert skips the others
+    if not names:
+        return OrderedDict(), 0
+
+    created = _insert_names(model, user_id, names)
+    if created:
+        bump_version([user_id]) # the raw insert doesn't send post_save
+
+    found = OrderedDict()
+    for i in range(0, len(names), CHUNK_SIZE):
+        chunk = names[i:i + CHUNK_SIZE]
+        # the names are matched with the database's lower(), the one of the
+        # unique index: sqlite's (and a C collation postgres') only folds
+        # ascii letters, python's lower() would match names it doesn't
+        keys = _lower(chunk)
+        rows = model.objects.filter(user_id = user_id).annotate(
+            lower_name = Lower('name'),
+        ).filter(lower_name__in = set(keys)).values_list(
+            'lower_name', 'id', 'name',
+        )
+        by_key = {key: (pk, name) for key, pk, name in rows}
+        for name, key in zip(chunk, keys):
+            found[name] = by_key[key]
+
+    return found, created
+
+
+def _lower(names):
+    """Return the names lowered by the database, in order"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ' + ', '.join(['lower(%s)'] * len(names)), names,
+        )
+        return list(cursor.fetchone())
+
+
+def _insert_names(model, user_id, names):
+    """Insert the names a user doesn't have yet, return how many were"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now()) # updated_at, raw queries skip auto_now
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # a single statement whatever the number of names
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, name, updated_at, recipe_count) '
+                'SELECT %s, unnest(%s::varchar[]), %s, 0 '
+                'ON CONFLICT (user_id, lower(name)) DO NOTHING',
+                [user_id, names, now],
+            )
+            return cursor.rowcount
+
+        created = 0
+        for i in range(0, len(names), CHUNK_SIZE): # sqlite limits the number of parameters of a query
+            chunk = names[i:i + CHUNK_SIZE]
+            values = ', '.join(['(%s, %s, %s, 0)'] * len(chunk))
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, name, updated_at, recipe_count) '
+                f'VALUES {values} ON CONFLICT DO NOTHING',
+                [param for name in chunk for param in (user_id, name, now)],
+            )
+            created += cursor.rowcount
+
+        return created
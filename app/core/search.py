@@ -0,0 +1,169 @@
+"""Full-text search index for recipes
+
+On Postgres every recipe has a stored tsvector column (search_vector) with a
+GIN index, built from its title (weight A) and the names of its tags and
+ingredients (weight B). On SQLite (local development and tests) the same text
+is kept in an FTS5 virtual table (core_recipe_fts) whose rowid is the recipe
+id. Both are created by the 0007_recipe_search migration and kept up to date
+by the signal handlers in core.signals.
+"""
+from django.db import connection
+from django.db.models import BooleanField, DecimalField, FloatField, \
+                              QuerySet
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english' # the postgres text search configuration (stemming and stop words)
+SQLITE_CHUNK_SIZE = 500
+
+# the names of the tags and ingredients of the recipe being indexed, as one
+# space separated string
+_TERMS_SQL = """
+    COALESCE((
+        SELECT string_agg(t.name, ' ') FROM core_tag t
+        INNER JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = core_recipe.id
+    ), '') || ' ' || COALESCE((
+        SELECT string_agg(i.name, ' ') FROM core_ingredient i
+        INNER JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = core_recipe.id
+    ), '')
+"""
+
+# the postgres search_vector of a title and the names of a recipe, the
+# params are SEARCH_CONFIG twice
+_VECTOR_SQL = """
+    setweight(to_tsvector(%s, {title}), 'A') ||
+    setweight(to_tsvector(%s, {terms}), 'B')
+"""
+
+# sqlite calls string_agg group_concat
+_SQLITE_TERMS_SQL = _TERMS_SQL.replace('string_agg', 'group_concat')
+
+
+def update_search_index(recipe_ids=None):
+    """Rebuild the search entries of some recipes (all of them if None)"""
+    # recipe_ids is a list of ids, or a queryset of recipes the database
+    # reads as a subquery
+    clauses = [('', [])] if recipe_ids is None else _id_clauses(recipe_ids)
+
+    with connection.cursor() as cursor:
+        for where, params in clauses:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'UPDATE core_recipe SET search_vector = ' +
+                    search_vector_sql('core_recipe.title', _TERMS_SQL) +
+                    (f' WHERE core_recipe.id {where}' if where else ''),
+                    [SEARCH_CONFIG, SEARCH_CONFIG] + params,
+                )
+            elif connection.vendor == 'sqlite':
+                _update_fts(cursor, f'WHERE id {where}' if where else '', params)
+
+
+def _id_clauses(recipe_ids):
+    """Return the (sql, params) of the conditions matching some recipe ids"""
+    # a queryset is read by the database as a subquery. a list is sent as an
+    # array to postgres, in chunks to sqlite (which limits the number of
+    # params of a query)
+    if isinstance(recipe_ids, QuerySet):
+        sql, params = recipe_ids.values('pk').query.sql_with_params()
+        return [(f'IN ({sql})', list(params))]
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    if connection.vendor == 'postgresql':
+        return [('= ANY(%s)', [recipe_ids])]
+    chunks = (
+        recipe_ids[i:i + SQLITE_CHUNK_SIZE]
+        for i in range(0, len(recipe_ids), SQLITE_CHUNK_SIZE)
+    )
+    return [
+        ('IN ({})'.format(', '.join(['%s'] * len(chunk))), chunk)
+        for chunk in chunks
+    ]
+
+
+def search_vector_sql(title, terms):
+    """Return the postgres SQL computing the search_vector of a recipe"""
+    # title and terms are SQL expressions, terms being the names of its
+    # tags and ingredients separated by spaces. the SQL takes SEARCH_CONFIG
+    # twice as params
+    return _VECTOR_SQL.format(title = title, terms = terms)
+
+
+def _update_fts(cursor, where, params):
+    """Replace the FTS5 rows of the recipes matching a where clause"""
+    cursor.execute(
+        'DELETE FROM core_recipe_fts WHERE rowid IN '
+        f'(SELECT id FROM core_recipe {where})',
+        params,
+    )
+    cursor.execute(
+        'INSERT INTO core_recipe_fts (rowid, title, terms) '
+        f'SELECT id, title, {_SQLITE_TERMS_SQL} FROM core_recipe {where}',
+        params,
+    )
+
+
+def remove_from_search_index(recipe_ids):
+    """Remove deleted recipes from the search index"""
+    # the postgres column is deleted with the row, only the separate sqlite
+    # table needs cleaning up
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for where, params in _id_clauses(recipe_ids):
+            cursor.execute(
+                f'DELETE FROM core_recipe_fts WHERE rowid {where}', params,
+            )
+
+
+def _fts5_query(text):
+    """Turn user input into an FTS5 query matching all of its words"""
+    # every word is quoted so characters like * or " are not treated as
+    # FTS5 syntax
+    words = text.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def search_recipes(queryset, text):
+    """Filter a recipe queryset by a search and annotate its search_rank"""
+    if connection.vendor == 'postgresql':
+        tsquery = 'plainto_tsquery(%s, %s)'
+        queryset = queryset.annotate(
+            search_match = RawSQL(
+                f'core_recipe.search_vector @@ {tsquery}',
+                [SEARCH_CONFIG, text],
+                output_field = BooleanField(),
+            ),
+            # ts_rank returns a real, which doesn't survive the round trip
+            # through a python float exactly, as a numeric the pagination
+            # cursor can compare it with the same value it read
+            search_rank = RawSQL(
+                f'ts_rank(core_recipe.search_vector, {tsquery})::numeric',
+                [SEARCH_CONFIG, text],
+                output_field = DecimalField(),
+            ),
+        )
+        return queryset.filter(search_match = True) # WHERE search_vector @@ query, served by the GIN index
+
+    if connection.vendor == 'sqlite':
+        query = _fts5_query(text)
+        if not query:
+            return queryset.none()
+        # bm25 is lower for better matches, the title weighs 10 times more
+        # than the tag and ingredient names
+        return queryset.annotate(
+            search_rank = RawSQL(
+                'SELECT -bm25(core_recipe_fts, 10.0, 1.0) '
+                'FROM core_recipe_fts WHERE core_recipe_fts MATCH %s '
+                'AND core_recipe_fts.rowid = core_recipe.id',
+                [query],
+                output_field = FloatField(),
+            ),
+        ).filter(search_rank__isnull = False)
+
+    # no search index on this database, fall back to a plain title search
+    return queryset.annotate(
+        search_rank = RawSQL('0', [], output_field = FloatField()),
+    ).filter(title__icontains = text)
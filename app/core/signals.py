@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, \
+                                     m2m_changed
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import blobs, search
+from .counters import add_recipe_counts
+from .authentication import CachedTokenAuthentication, forget_users
+from .models import ChangeVersion, Tag, Ingredient, Recipe
+from .versions import bump_version
+
+
+def _link_field(model):
+    """Return the field of Recipe linking it to a Tag or an Ingredient"""
+    return model._meta.get_field('recipe').field # Recipe.tags / Recipe.ingredients
+
+
+def _linked_ids(field, instance, pk_set = None, lock = False):
+    """Return the ids a recipe or a tag/ingredient is linked to by a field"""
+    # the tags/ingredients of a recipe, or the recipes of a tag/ingredient,
+    # only the ones in pk_set if given. lock the links about to be deleted,
+    # another transaction deleting them meanwhile doesn't count them too
+    column = field.m2m_reverse_name() # tag_id / ingredient_id
+    own, other = ('recipe_id', column) if isinstance(instance, Recipe) \
+        else (column, 'recipe_id')
+    links = field.remote_field.through.objects.filter(**{own: instance.pk})
+    if pk_set is not None:
+        links = links.filter(**{f'{other}__in': pk_set})
+    if lock:
+        links = links.select_for_update()
+
+    return list(links.values_list(other, flat = True))
+
+
+@receiver(post_save, sender = Recipe)
+def recipe_saved(sender, instance, raw = False, **kwargs):
+    """Index the title of a saved recipe, bump its owner's version"""
+    if not raw: # raw is True when loading fixtures
+        search.update_search_index([instance.pk])
+    bump_version([instance.user_id])
+
+
+@receiver(pre_delete, sender = Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Remember the tags/ingredients of a recipe about to be deleted"""
+    instance._deleted_link_ids = {
+        field: _linked_ids(field, instance, lock = True)
+        for field in (_link_field(Tag), _link_field(Ingredient))
+    } # the links are deleted with the recipe, without m2m_changed signals
+
+
+@receiver(post_delete, sender = Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Unindex and uncount a deleted recipe, bump its owner's version"""
+    search.remove_from_search_index([instance.pk])
+    for field, ids in getattr(instance, '_deleted_link_ids', {}).items():
+        add_recipe_counts(field.related_model, dict.fromkeys(ids, -1))
+    blobs.release(instance.image.name, instance.images) # its image is deleted if no other recipe uses it
+    bump_version([instance.user_id])
+
+
+@receiver(m2m_changed, sender = Recipe.tags.through)
+@receiver(m2m_changed, sender = Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    """Re-index, recount and bump the versions for changed links"""
+    # reverse is True when the change was made from the tag/ingredient side
+    # (tag.recipe_set.add(...)), then pk_set holds recipe ids. model is the
+    # model of the ids in pk_set
+    field = _link_field(type(instance) if reverse else model)
+    if action in ('pre_remove', 'pre_clear'):
+        # the pk_set of a remove can hold ids that aren't linked and a clear
+        # has none, the links are read before they are deleted
+        instance._unlinked_ids = _linked_ids(
+            field, instance, pk_set, lock = True,
+        )
+        return
+    if action == 'post_add':
+        ids, change = pk_set, 1 # only the ids that weren't linked yet
+    elif action in ('post_remove', 'post_clear'):
+        ids, change = getattr(instance, '_unlinked_ids', ()), -1
+    else:
+        return
+    if not ids:
+        return
+
+    if reverse:
+        recipe_ids = list(ids)
+        changes = {instance.pk: change * len(recipe_ids)}
+        user_ids = {instance.user_id}.union(
+            Recipe.objects.filter(pk__in = recipe_ids)
+            .values_list('user_id', flat = True)
+        ) # the recipes may belong to others
+    else:
+        recipe_ids = [instance.pk]
+        changes = dict.fromkeys(ids, change)
+        user_ids = {instance.user_id}
+    search.update_search_index(recipe_ids)
+    add_recipe_counts(field.related_model, changes)
+    bump_version(user_ids)
+
+
+@receiver(post_save, sender = Tag)
+@receiver(post_save, sender = Ingredient)
+def recipe_attr_saved(sender, instance, created, raw = False, **kwargs):
+    """Re-index the recipes using a renamed tag/ingredient, bump the version"""
+    if not created and not raw:
+        search.update_search_index(
+            _linked_ids(_link_field(sender), instance)
+        )
+    bump_version([instance.user_id])
+
+
+@receiver(pre_delete, sender = Tag)
+@receiver(pre_delete, sender = Ingredient)
+def recipe_attr_deleting(sender, instance, **kwargs):
+    """Remember the recipes using a tag or ingredient about to be deleted"""
+    instance._deleted_recipe_ids = _linked_ids(_link_field(sender), instance)
+
+
+@receiver(post_delete, sender = Tag)
+@receiver(post_delete, sender = Ingredient)
+def recipe_attr_deleted(sender, instance, **kwargs):
+    """Re-index the recipes of a deleted tag/ingredient, bump the version"""
+    search.update_search_index(getattr(instance, '_deleted_recipe_ids', []))
+    bump_version([instance.user_id])
+
+
+@receiver(post_save, sender = settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, raw = False, **kwargs):
+    """Create the change version of a new user, forget the cached ones"""
+    if created and not raw:
+        ChangeVersion.objects.create(user = instance)
+    elif not created:
+        _forget_tokens(
+            Token.objects.filter(user = instance)
+            .values_list('key', flat = True)
+        ) # the cached tokens hold the user as it was
+    _forget_users([instance.pk])
+
+
+@receiver(post_delete, sender = settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    """Stop authenticating a deleted user with signed tokens"""
+    _forget_users([instance.pk])
+
+
+def _forget_users(user_ids):
+    """Drop users from the auth caches, now and after the commit"""
+    forget_users(user_ids)
+    transaction.on_commit(lambda: forget_users(user_ids))
+
+
+@receiver(post_delete, sender = Token)
+def token_deleted(sender, instance, **kwargs):
+    """Stop authenticating with a deleted token"""
+    _forget_tokens([instance.key])
+
+
+def _forget_tokens(keys):
+    """Drop tokens from the auth caches, now and after the commit"""
+    keys = list(keys)
+    if keys:
+        CachedTokenAuthentication.forget(keys)
+        transaction.on_commit(lambda: CachedTokenAuthentication.forget(keys)) # a request may have cached them again before the commit
@@ -0,0 +1,69 @@
+"""Content addressed storage of the recipe images
+
+An image is stored under the SHA-256 of its content, in two levels of
+directories named after the first bytes of the hash so no directory grows
+past a few thousand entries: uploads/recipe/ab/cd/abcd....jpg. The same
+photo uploaded twice is stored once, and as a name never gets another
+content its url can be cached forever. Which recipes use a file is counted
+by core.blobs, the last one to let it go deletes it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024 # bytes read at a time while hashing/writing
+
+BLOB_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def is_blob_name(name):
+    """Return True if a name was given by ContentAddressedStorage"""
+    return bool(BLOB_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming the files after the hash of their content"""
+    # only the directory and the extension of the name asked for are kept
+
+    def save(self, name, content, max_length = None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE): # streamed, a photo is never read whole in memory
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        match = BLOB_NAME.search(name) # a name it gave, written again
+        directory = name[:match.start()] if match else os.path.dirname(name)
+        name = os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{ext}',
+        )
+        if not self.exists(name): # else it's already stored, by this or another recipe
+            self._write(name, content)
+
+        return name
+
+    def _write(self, name, content):
+        """Write a file atomically, it is never seen half written"""
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok = True)
+        fd, temp_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path) # the same content if two uploads race
+        except BaseException:
+            os.remove(temp_path)
+            raise
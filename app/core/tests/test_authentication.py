@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import CachedTokenAuthentication, token_cache_key
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the token authentication keeping users in a cache"""
+
+    def setUp(self):
+        CachedTokenAuthentication.local_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+            name = 'Test',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_cached(self):
+        """Test the token and its user are only read from the db once"""
+        self.client.get(ME_URL)
+        stats = CachedTokenAuthentication.stats()
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(
+            CachedTokenAuthentication.stats()['local_hits'],
+            stats['local_hits'] + 1,
+        )
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops working right away"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test the token of a deactivated user stops working right away"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_changed_user_not_stale(self):
+        """Test changes to the user are seen by the next request"""
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New name')
+
+    def test_stale_cached_user_not_saved(self):
+        """Test an update doesn't write the cached user over the db one"""
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(pk = self.user.pk).update(
+            is_active = False, token_version = 5,
+        ) # not through save(), the cached token isn't dropped
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'New name')
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.token_version, 5)
+
+    def test_password_not_cached(self):
+        """Test the password hash is left out of the cached token"""
+        self.client.get(ME_URL)
+
+        data = CachedTokenAuthentication.local_cache.get(
+            token_cache_key(self.token.key)
+        )
+
+        self.assertNotIn(self.user.password.encode(), data)
@@ -0,0 +1,170 @@
+import io
+import json
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import blobs
+from core.models import ImageBlob, Recipe
+from core.storage import is_blob_name
+
+
+@patch('django.db.transaction.on_commit', lambda func: func()) # the files are deleted after a commit, the test transaction never commits
+class ImageBlobTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT = self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+        self.user = get_user_model().objects.create_user('test@gmail.com', '123456')
+
+    def _recipe(self, content = b'photo', **params):
+        """Create a recipe using an image, with a resized copy"""
+        recipe = Recipe.objects.create(
+            user = self.user, title = 'Curry', time_minutes = 5, price = 2.00,
+            **params
+        )
+        if content is not None:
+            recipe.image.save('photo.jpg', ContentFile(content), save = False)
+            copy = recipe.image.name.replace('.jpg', '_128.jpg')
+            if not default_storage.exists(copy):
+                default_storage.save(copy, ContentFile(b'copy'))
+            recipe.images = json.dumps({'128': {'jpeg': copy}})
+            recipe.save()
+            blobs.acquire(recipe.image.name)
+        return recipe
+
+    def test_shared_image_deleted_with_its_last_recipe(self):
+        """Test an image used by two recipes outlives the first one"""
+        first = self._recipe()
+        second = self._recipe()
+        name = first.image.name
+        copy = json.loads(first.images)['128']['jpeg']
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(ImageBlob.objects.get(name = name).refs, 2)
+
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name = name).refs, 1)
+
+        second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(copy))
+        self.assertFalse(ImageBlob.objects.filter(name = name).exists())
+
+    def test_bulk_delete_releases_images(self):
+        """Test the recipes deleted in bulk let their images go"""
+        shared = [self._recipe(), self._recipe()]
+        kept = self._recipe(content = b'other')
+        self._recipe(content = None)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        client.delete(
+            reverse('recipe:recipe-bulk') + '?ids=' +
+            ','.join(str(recipe.pk) for recipe in shared),
+        )
+
+        self.assertFalse(default_storage.exists(shared[0].image.name))
+        self.assertFalse(ImageBlob.objects.filter(
+            name = shared[0].image.name,
+        ).exists())
+        self.assertTrue(default_storage.exists(kept.image.name))
+
+    def test_discard_keeps_used_image(self):
+        """Test discarding a file another recipe uses keeps it"""
+        recipe = self._recipe()
+
+        blobs.discard(recipe.image.name, recipe.images)
+
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def test_acquired_before_the_delete_kept(self):
+        """Test a file acquired again before it is deleted is kept"""
+        recipe = self._recipe()
+        name = recipe.image.name
+        with patch('django.db.transaction.on_commit') as on_commit:
+            blobs.release(name, recipe.images)
+        (delete,), kwargs = on_commit.call_args # not committed yet
+
+        self.assertTrue(blobs.acquire(name))
+        delete()
+
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name = name).refs, 1)
+
+    def test_acquired_after_the_delete_reported(self):
+        """Test acquiring a file deleted meanwhile tells it's missing"""
+        recipe = self._recipe()
+        recipe.delete() # its image deleted, committed right away here
+
+        self.assertFalse(blobs.acquire(recipe.image.name))
+
+    def test_upload_writes_deleted_file_again(self):
+        """Test an upload whose stored file was deleted meanwhile writes it"""
+        recipe = self._recipe(content = None)
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, format = 'JPEG')
+        acquire = blobs.acquire
+
+        def acquire_after_delete(name, images = ''):
+            default_storage.delete(name) # by the last recipe letting it go
+            return acquire(name, images)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with patch('core.blobs.acquire', acquire_after_delete):
+            buffer.name = 'photo.jpg'
+            buffer.seek(0)
+            client.post(
+                reverse('recipe:recipe-upload-image', args = [recipe.id]),
+                {'image': buffer}, format = 'multipart',
+            )
+
+        recipe.refresh_from_db()
+        with recipe.image.open() as file:
+            self.assertEqual(file.read(), buffer.getvalue())
+
+    def test_migrate_recipe_images(self):
+        """Test the images stored before are moved to their hash"""
+        old = default_storage.save('uploads/recipe/1234.jpg', ContentFile(b'old'))
+        old_copy = default_storage.save(
+            'uploads/recipe/1234_128.jpg', ContentFile(b'copy'),
+        )
+        recipe = self._recipe(content = None)
+        Recipe.objects.filter(pk = recipe.pk).update(
+            image = old, images = json.dumps({'128': {'jpeg': old_copy}}),
+        )
+        queued = default_storage.save('uploads/recipe/5678.jpg', ContentFile(b'new'))
+        Recipe.objects.filter(
+            pk = self._recipe(content = None, image_status = 'processing').pk,
+        ).update(image = queued)
+
+        out = io.StringIO()
+        call_command('migrate_recipe_images', stdout = out, stderr = io.StringIO())
+
+        recipe.refresh_from_db()
+        self.assertIn('Moved 1 images', out.getvalue())
+        self.assertTrue(is_blob_name(recipe.image.name))
+        with recipe.image.open() as file:
+            self.assertEqual(file.read(), b'old')
+        copy = json.loads(recipe.images)['128']['jpeg']
+        self.assertEqual(copy, recipe.image.name.replace('.jpg', '_128.jpg'))
+        self.assertTrue(default_storage.exists(copy))
+        self.assertEqual(ImageBlob.objects.get(name = recipe.image.name).refs, 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(default_storage.exists(old_copy))
+        self.assertTrue(default_storage.exists(queued)) # moved by a later run, once processed
@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.cache import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+    """Test the in-process LRU cache"""
+
+    def test_least_recently_used_dropped(self):
+        """Test the least recently used entry makes room for new ones"""
+        lru = LRUCache(max_size = 2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(lru.stats(), {'hits': 3, 'misses': 1, 'size': 2})
+
+    @patch('core.cache.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        """Test entries are not returned after their ttl"""
+        mock_monotonic.return_value = 100
+        lru = LRUCache(ttl = 10)
+        lru.set('a', 1)
+
+        mock_monotonic.return_value = 109
+        self.assertEqual(lru.get('a'), 1)
+        mock_monotonic.return_value = 110
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
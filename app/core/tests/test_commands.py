@@ -1,8 +1,11 @@
 from unittest.mock import patch # allows us to mock the behaviour of the django get db function by simulating the db being available or not available when we test our command
 from django.core.management import call_command # allows us to call our management command in our source code
 from django.db.utils import OperationalError # this is the error that django throws when the db is unavailable. we will use this to simulate the db being available or not
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
+from core.models import Tag, Ingredient, Recipe
+
 class CommandsTestCase(TestCase):
 
     def test_wait_for_db_ready(self): # our management command will try to retrieve the db connection from django, when it does, it will check if it retrieves an operational error or not. if it didnt, the db is available and vice versa
@@ -14,7 +17,6 @@ class CommandsTestCase(TestCase):
             call_command('wait_for_db') # this is the management command that we will create
             self.assertEqual(gi.call_count, 1) # check that __getitem__ was called only once. call_count is an option for mock objects
 
-
     @patch('time.sleep', return_value=True) # since the db will be checked every 1 second to see if its ready, this decorator is used here to speed up the test and remove the delay (we are mocking the delay by returning something immediately (true or None) as opposed to 'sleeping'). this decorator does the same as the patch command used earlier
     def test_wait_for_db(self, ts): # the patch decorator passes in an arguement (like gi in the previous test)
         """Test waiting for db 5 times with a success in 6th time"""
@@ -23,3 +25,22 @@ class CommandsTestCase(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True] # we will make it raise and OperationalError fives times, there is no reason for choosing 5 times, it could be anything
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_rebuild_recipe_counts(self):
+        """Test wrong recipe counts are fixed"""
+        user = get_user_model().objects.create_user('test@gmail.com', '123456')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=user, name='Tofu')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=2.00
+        )
+        recipe.tags.add(tag)
+        Tag.objects.update(recipe_count=7) # drifted, update() skips the signals
+        Ingredient.objects.update(recipe_count=1)
+
+        call_command('rebuild_recipe_counts')
+
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(ingredient.recipe_count, 0)
@@ -0,0 +1,156 @@
+import io
+import json
+import shutil
+import struct
+import tempfile
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import jobs
+from core.models import ImageJob, Recipe
+
+
+def exif_orientation(orientation):
+    """Return an EXIF block holding only an orientation"""
+    ifd = struct.pack('<H', 1) + struct.pack(
+        '<HHLHH', 0x0112, 3, 1, orientation, 0, # tag, SHORT, count, value
+    ) + struct.pack('<L', 0) # no next IFD
+    return b'Exif\x00\x00' + b'II*\x00' + struct.pack('<L', 8) + ifd
+
+
+@override_settings(RECIPE_IMAGE_SIZES = (64, 32))
+@patch('django.db.transaction.on_commit', lambda func: func()) # the files are deleted after a commit, the test transaction never commits
+class ImageWorkerTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT = self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        user = get_user_model().objects.create_user('test@gmail.com', '123456')
+        self.recipe = Recipe.objects.create(
+            user = user, title = 'Curry', time_minutes = 5, price = 2.00,
+        )
+
+    def _queue(self, content, name = 'photo.jpg'):
+        """Store an uploaded image on the recipe and queue it"""
+        self.recipe.image.save(name, ContentFile(content), save = False)
+        self.recipe.image_status = 'processing'
+        self.recipe.save()
+        return jobs.enqueue_image(self.recipe)
+
+    def _jpeg(self, size, **options):
+        """Return the bytes of a JPEG image"""
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (10, 20, 30)).save(
+            buffer, format = 'JPEG', **options
+        )
+        return buffer.getvalue()
+
+    def _work(self, **options):
+        """Run the worker until the queue is empty"""
+        options.setdefault('processes', 0)
+        call_command('image_worker', once = True, stdout = io.StringIO(), **options)
+        self.recipe.refresh_from_db()
+
+    def test_orientation_applied_and_metadata_stripped(self):
+        """Test a rotated photo is saved upright without its EXIF"""
+        job = self._queue(self._jpeg((100, 50), exif = exif_orientation(6)))
+
+        self._work()
+
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertNotEqual(self.recipe.image.name, job.image) # saved again
+        self.assertFalse(default_storage.exists(job.image)) # the one with the metadata is gone
+        with default_storage.open(self.recipe.image.name) as file:
+            image = Image.open(file)
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+        images = json.loads(self.recipe.images)
+        with default_storage.open(images['64']['jpeg']) as file:
+            self.assertEqual(Image.open(file).size, (32, 64))
+
+    def test_image_without_metadata_kept(self):
+        """Test an image without EXIF is not saved again"""
+        job = self._queue(self._jpeg((100, 50)))
+
+        self._work()
+
+        self.assertEqual(self.recipe.image.name, job.image)
+        self.assertEqual(set(json.loads(self.recipe.images)), {'64', '32'})
+
+    def test_jobs_processed_in_a_pool(self):
+        """Test the worker processes the images in child processes"""
+        self._queue(self._jpeg((100, 50)))
+
+        self._work(processes = 2)
+
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_broken_image_retried_then_failed(self):
+        """Test an image that can't be processed is marked failed"""
+        self._queue(b'not an image')
+
+        for attempt in range(1, jobs.MAX_ATTEMPTS):
+            self._work()
+            job = ImageJob.objects.get()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('Traceback', job.error)
+            self.assertEqual(self.recipe.image_status, 'processing')
+            self.assertEqual(jobs.claim_jobs(1), []) # not before RETRY_DELAY
+            ImageJob.objects.update(claimed_at = None) # the delay passed
+        self._work()
+
+        self.assertEqual(self.recipe.image_status, 'failed')
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_deleted_files_processed_again(self):
+        """Test the files deleted before they were acquired are made again"""
+        self._queue(self._jpeg((100, 50), exif = exif_orientation(6)))
+
+        with patch('core.blobs.acquire', return_value = False): # found stored, then deleted
+            self._work()
+
+        self.assertIn('deleted', ImageJob.objects.get().error)
+        self.assertEqual(self.recipe.image_status, 'processing')
+        ImageJob.objects.update(claimed_at = None) # the retry delay passed
+        self._work()
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+
+    def test_replaced_image_discarded(self):
+        """Test the files made for an image replaced meanwhile are deleted"""
+        self._queue(self._jpeg((100, 50), exif = exif_orientation(3)))
+        job = jobs.claim_jobs(1)[0]
+        outcome = jobs.process_files((job.pk, self.recipe.pk, job.image))
+        self._queue(self._jpeg((80, 80)), name = 'other.jpg') # uploaded again while it was processed
+
+        self.assertEqual(jobs.finish_job(*outcome), 'stale')
+        name, derivatives = outcome[3:5]
+        self.assertFalse(default_storage.exists(name))
+        for names in derivatives.values():
+            for derivative in names.values():
+                self.assertFalse(default_storage.exists(derivative))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'processing') # the other image is still queued
+
+    def test_claimed_jobs_skipped(self):
+        """Test a claimed job isn't claimed again until it times out"""
+        self._queue(self._jpeg((10, 10)))
+
+        self.assertEqual(len(jobs.claim_jobs(5)), 1)
+        self.assertEqual(jobs.claim_jobs(5), [])
+        ImageJob.objects.update(
+            claimed_at = ImageJob.objects.get().claimed_at - jobs.CLAIM_TIMEOUT,
+        ) # its worker died
+        self.assertEqual(len(jobs.claim_jobs(5)), 1)
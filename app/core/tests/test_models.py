@@ -1,9 +1,14 @@
-from unittest.mock import patch # we used this in test_commands file too
+import hashlib
+import os
+import shutil
+import tempfile
 
+from django.core.files.base import ContentFile
 from django.test import TestCase
 from django.contrib.auth import get_user_model # u can import the user model directly from the models but thats not recommended because that might change, so its better to get it from the settings file directly
 
 from core import models
+from core.storage import ContentAddressedStorage
 
 def sample_user(email = 'test@gmail.com', password = '123456'):
     """Create a sample user"""
@@ -73,12 +78,28 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(recipe), recipe.title)
 
-    @patch('uuid.uuid4') # the argument is the function we wanna mock.
-    def test_recipe_file_name_uuid(self, mock_uuid): # the second argument is sent by the patch decorator
-        """Test that image is saved in the correct location"""
-        uuid = 'test-uuid' # set the uuid to a fixed string
-        mock_uuid.return_value = uuid # any time we call uuid4 function in our tests, it will override the default behaviour and return our string instead
-        file_path = models.recipe_image_file_path(None, 'myimage.jpg') # we dont need to provide the instance(1st arg) here so we just pass None, the second argument is the file name for the original file being added (uploaded by user)
+    def test_new_user_change_version(self):
+        """Test users get a change version that writes bump"""
+        user = sample_user()
+        self.assertEqual(user.change_version.version, 0)
+
+        models.Tag.objects.create(user=user, name='Vegan')
+        user.change_version.refresh_from_db()
 
-        expected_path = f'uploads/recipe/{uuid}.jpg' # uuid.jpg is the new name assigned to the file after its uploaded
-        self.assertEqual(file_path, expected_path)
+        self.assertEqual(user.change_version.version, 1)
+
+    def test_recipe_file_name_hash(self):
+        """Test that image is saved in the correct location"""
+        file_path = models.recipe_image_file_path(None, 'myimage.JPG') # we dont need to provide the instance(1st arg) here so we just pass None, the second argument is the file name for the original file being added (uploaded by user)
+        self.assertEqual(file_path, 'uploads/recipe/image.jpg') # only the directory and the extension are used by the storage
+
+        storage = ContentAddressedStorage(location = tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, storage.location)
+        name = storage.save(file_path, ContentFile(b'image'))
+        digest = hashlib.sha256(b'image').hexdigest()
+
+        self.assertEqual(
+            name, f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg',
+        ) # sharded by the hash of the content
+        self.assertEqual(storage.save(file_path, ContentFile(b'image')), name) # stored once
+        self.assertEqual(len(os.listdir(os.path.dirname(storage.path(name)))), 1)
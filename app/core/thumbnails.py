@@ -0,0 +1,159 @@
+"""Recipe images resized on demand, cached on disk
+
+/api/recipe/recipes/{id}/image/?w=&h=&fmt= resizes the image of a recipe
+the first time a size is asked for and keeps the result under
+MEDIA_ROOT/RECIPE_IMAGE_CACHE_DIR, named after a hash of the image name, the
+size and the format. The image name changes with every upload, so a cached
+file never goes stale and is only ever removed to keep the cache within
+RECIPE_IMAGE_CACHE_BYTES: the least recently used files go first (their
+mtime, refreshed when they are read).
+
+A request that has to resize takes an flock first, so identical requests
+arriving together resize once, the others wait and read the file it wrote.
+The locks are striped by the first byte of the hash (256 lock files), which
+keeps their number bounded.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from .images import EXTENSIONS, resize_image
+
+TOUCH_INTERVAL = 3600 # seconds, how stale the recency of a file read can get (saves a write per hit)
+EVICT_INTERVAL = 60 # seconds between two size checks of the cache by a process
+EVICT_TO = 0.9 # part of the budget left used after an eviction
+
+_last_evict = None # when this process last checked the size of the cache
+
+
+def image_version(name):
+    """Return the version of an image, the v param of its cached urls"""
+    return hashlib.sha256(name.encode()).hexdigest()[:12]
+
+
+def cache_key(name, width, height, fmt):
+    """Return the hash a resized image is cached under"""
+    return hashlib.sha256(
+        f'{name}:{width}:{height}:{fmt}:{settings.RECIPE_IMAGE_QUALITY}'
+        .encode()
+    ).hexdigest()
+
+
+def cache_dir():
+    """Return the directory of the cached images"""
+    return os.path.join(settings.MEDIA_ROOT, settings.RECIPE_IMAGE_CACHE_DIR)
+
+
+def open_resized(name, width, height, fmt):
+    """Return the resized image file (opened), resized now if not cached"""
+    key = cache_key(name, width, height, fmt)
+    path = os.path.join(cache_dir(), key[:2], f'{key}.{EXTENSIONS[fmt]}')
+    resized = False
+    for attempt in range(2): # evicted between being found and opened, resize it again
+        if not _hit(path):
+            with _locked(os.path.join(cache_dir(), 'locks', f'{key[:2]}.lock')):
+                if not _hit(path): # not written while this request waited
+                    _write(path, resize_image(name, width, height, fmt))
+                    resized = True
+        try:
+            file = open(path, 'rb')
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+    if resized:
+        maybe_evict()
+
+    return file
+
+
+def maybe_evict():
+    """Evict from the cache if this process didn't check it lately"""
+    global _last_evict
+    now = time.monotonic()
+    if _last_evict is not None and now - _last_evict < EVICT_INTERVAL:
+        return
+    _last_evict = now
+    with _locked(os.path.join(cache_dir(), 'locks', 'evict.lock'),
+                 blocking = False) as locked:
+        if locked: # else another process is at it
+            evict()
+
+
+def evict(budget = None):
+    """Delete the least recently used files over the budget, return how many"""
+    budget = settings.RECIPE_IMAGE_CACHE_BYTES if budget is None else budget
+    files = []
+    total = 0
+    for shard in os.scandir(cache_dir()):
+        if not shard.is_dir() or shard.name == 'locks':
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith('.tmp'): # being written
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError: # evicted by another process meanwhile
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= budget:
+        return 0
+
+    files.sort() # least recently used first
+    removed = 0
+    for mtime, size, path in files:
+        if total <= budget * EVICT_TO: # some room, so the next files don't evict right away
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+            removed += 1
+        total -= size
+
+    return removed
+
+
+def _hit(path):
+    """Return True if a file is cached, marking it as recently used"""
+    try:
+        mtime = os.stat(path).st_mtime
+        if time.time() - mtime > TOUCH_INTERVAL:
+            os.utime(path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+@contextlib.contextmanager
+def _locked(path, blocking = True):
+    """Hold an exclusive flock on a file, yield whether it was taken"""
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'a') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _write(path, content):
+    """Write a file atomically, readers never see it half written"""
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
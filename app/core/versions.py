@@ -0,0 +1,34 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChangeVersion
+
+
+def bump_version(user_ids):
+    """Bump the change version of users whose data changed"""
+    user_ids = {pk for pk in user_ids if pk is not None}
+    if not user_ids:
+        return
+    # one UPDATE, runs in the same transaction as the write so a rolled back
+    # write doesn't change the version. the rows are created with the users
+    # (and by the migration for the existing ones), a missing row means the
+    # user is being deleted
+    ChangeVersion.objects.filter(user_id__in = user_ids).update(
+        version = F('version') + 1,
+        updated_at = timezone.now(), # update() doesn't run auto_now
+    )
+
+
+def get_version(user_id):
+    """Return the (version, updated_at) of a user's data"""
+    # read from the db every time, one primary key lookup. a cached copy
+    # could only be dropped in the process that made the write (the default
+    # cache is per process), the others would go on serving what they built
+    # from the old version
+    row = ChangeVersion.objects.filter(user_id = user_id) \
+        .values_list('version', 'updated_at').first()
+    if row is None: # shouldn't happen, the row is created with the user
+        version = ChangeVersion.objects.get_or_create(user_id = user_id)[0]
+        row = (version.version, version.updated_at)
+
+    return tuple(row)
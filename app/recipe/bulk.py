@@ -0,0 +1,122 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+
+from core.models import Recipe
+
+
+LINK_FIELDS = ('tags', 'ingredients')
+
+MATCHED_TABLE = 'bulk_matched_recipes' # temporary, see matched_recipes()
+
+
+def insert_recipes(user, recipes, batch_size = 500):
+    """Insert recipes with their links, return their ids and the links made"""
+    # the recipes are dicts of Recipe fields with the ids of their tags and
+    # ingredients in lists. nothing is sent to the signal handlers, callers
+    # pass the ids and the number of recipes linked to each tag/ingredient
+    # ({'tags': {id: n}, ...}) to bulk_recipes_changed
+    objs = Recipe.objects.bulk_create(
+        [
+            Recipe(user = user, **{
+                name: value for name, value in recipe.items()
+                if name not in LINK_FIELDS
+            })
+            for recipe in recipes
+        ],
+        batch_size = batch_size,
+    )
+    if connection.features.can_return_ids_from_bulk_insert: # postgres
+        ids = [obj.id for obj in objs]
+    else:
+        # sqlite doesn't give the ids back, but a single writer holds
+        # the database lock until the commit so ours are the last ids
+        ids = list(
+            Recipe.objects.filter(user = user).order_by('-id')
+            .values_list('id', flat = True)[:len(objs)]
+        )[::-1]
+
+    linked = {field_name: Counter() for field_name in LINK_FIELDS}
+    for field_name in LINK_FIELDS:
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        column = Recipe._meta.get_field(field_name).m2m_reverse_name() # tag_id / ingredient_id
+        links = []
+        for recipe_id, recipe in zip(ids, recipes):
+            for pk in dict.fromkeys(recipe.get(field_name, ())): # drops the ids sent twice, keeps the order
+                links.append(through(**{
+                    'recipe_id': recipe_id, column: pk,
+                }))
+                linked[field_name][pk] += 1
+        through.objects.bulk_create(links, batch_size = batch_size)
+
+    return ids, linked
+
+
+class _Subquery(RawSQL):
+    """Raw SQL of a subquery, for an __in lookup"""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params # the lookup adds the parentheses, RawSQL's own made sqlite read it as one value
+
+
+@contextmanager
+def matched_recipes(queryset):
+    """Keep the ids a queryset matches in a temporary table for a bulk write"""
+    # deleting the links or changing the titles changes what the filters
+    # (tags, search) match. the ids are copied once with INSERT ... SELECT,
+    # they never go through python, and the statements of the write read
+    # them from there. to be used in a transaction, the table is rolled back
+    # with a failed write
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {MATCHED_TABLE} (id integer PRIMARY KEY)'
+        )
+        cursor.execute(f'INSERT INTO {MATCHED_TABLE} (id) {sql}', params)
+    yield Recipe.objects.filter(
+        pk__in = _Subquery(f'SELECT id FROM {MATCHED_TABLE}', []),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {MATCHED_TABLE}') # the transaction may not end here (a savepoint)
+
+
+def unlinked_counts(recipes, field_name):
+    """Return {id: -n} of the tags/ingredients linked to recipes, n times"""
+    field = Recipe._meta.get_field(field_name)
+    column = field.m2m_reverse_name() # tag_id / ingredient_id
+    rows = field.remote_field.through.objects.filter(
+        recipe_id__in = recipes.values('pk'),
+    ).values_list(column).annotate(count = Count('*')).order_by()
+
+    return {pk: -count for pk, count in rows}
+
+
+def delete_recipes(recipes):
+    """Delete recipes with the rows pointing to them, one DELETE per table"""
+    # Recipe.delete() loads every recipe, then sends the signals of each
+    # one. callers do the signal handlers' work for the batch instead (see
+    # bulk_recipes_changed). the tables are found from the model, every
+    # relation to Recipe has to cascade like the ones deleted here
+    deleted = {}
+    for field in Recipe._meta.many_to_many:
+        links = field.remote_field.through.objects.filter(**{
+            f'{field.m2m_field_name()}__in': recipes.values('pk'),
+        })
+        deleted[field.name] = links.delete()[0] # no signals for link rows, deleted without loading them
+    for relation in Recipe._meta.related_objects: # ImageJob
+        relation.related_model._base_manager.filter(**{
+            f'{relation.field.name}__in': recipes.values('pk'),
+        }).delete()
+    sql, params = recipes.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(Recipe._meta.db_table)} '
+            f'WHERE id IN ({sql})',
+            params,
+        ) # not Recipe.objects.delete(), it would collect the recipes
+        deleted['recipes'] = cursor.rowcount
+
+    return deleted
@@ -0,0 +1,63 @@
+"""Newline-delimited JSON export of a user's recipes
+
+Every line is one recipe with the names of its tags and ingredients, so an
+export can be imported into another account (or database) where the ids are
+different. The recipes are read with a server-side cursor (iterator()) and
+the names are fetched per chunk of recipes, so the memory used doesn't grow
+with the number of recipes.
+"""
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import Recipe
+
+
+CHUNK_SIZE = 1000 # recipes read per round trip, and whose names are fetched at once
+
+FIELDS = ('id', 'title', 'time_minutes', 'price', 'link', 'image',
+          'updated_at')
+
+
+def export_recipes(user_id, chunk_size = CHUNK_SIZE):
+    """Yield the recipes of a user as lines of JSON"""
+    rows = Recipe.objects.filter(user_id = user_id).order_by('id') \
+        .values_list(*FIELDS).iterator(chunk_size = chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _export_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _export_chunk(chunk)
+
+
+def _export_chunk(rows):
+    """Yield the lines of a chunk of recipe rows"""
+    ids = [row[0] for row in rows]
+    names = {
+        field_name: _linked_names(field_name, ids)
+        for field_name in ('tags', 'ingredients')
+    }
+    for row in rows:
+        recipe = dict(zip(FIELDS, row))
+        recipe['image'] = recipe['image'] or None # '' or None when there's no image
+        for field_name, linked in names.items():
+            recipe[field_name] = linked.get(recipe['id'], [])
+        yield json.dumps(recipe, cls = DjangoJSONEncoder) + '\n' # prices as strings, dates in ISO 8601
+
+
+def _linked_names(field_name, recipe_ids):
+    """Return {recipe id: [names]} of the tags/ingredients of some recipes"""
+    field = Recipe._meta.get_field(field_name)
+    target = field.m2m_reverse_field_name() # tag / ingredient
+    links = field.remote_field.through.objects.filter(
+        recipe_id__in = recipe_ids,
+    ).order_by(f'{target}_id').values_list('recipe_id', f'{target}__name') # one join for the whole chunk
+    names = defaultdict(list)
+    for recipe_id, name in links:
+        names[recipe_id].append(name)
+
+    return names
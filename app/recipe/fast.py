@@ -0,0 +1,213 @@
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+
+def _to_int(value):
+    return int(value)
+
+
+def _to_str(value):
+    return str(value)
+
+
+class FastRepresentation:
+    """Read-only representation of a serializer built from values() rows"""
+    # ModelSerializer.to_representation creates model instances and then runs
+    # every attribute through generic field objects. for the list endpoints we
+    # "compile" the serializer once per request instead: each field becomes a
+    # (column, converter) pair applied to plain values() rows, and the M2M
+    # primary key fields are filled from one query on the through table per
+    # relation. the output is the same (byte for byte once rendered) as the
+    # serializer's, serializers with fields we can't compile return None from
+    # compile() and the view falls back to them
+    chunk_size = 500
+    simple_fields = {
+        serializers.IntegerField: _to_int,
+        serializers.CharField: _to_str,
+    }
+
+    def __init__(self, model, plan, sql_casts = None):
+        self.model = model
+        self.plan = plan # (name, source, converter) in the serializer field order, the converter is None for M2M relations
+        self.sql_casts = sql_casts # {column: cast} to build the same json in postgres, None if it can't be done
+        self.columns = [source for name, source, convert in plan if convert]
+        self.relations = [
+            source for name, source, convert in plan if convert is None
+        ]
+
+    @classmethod
+    def compile(cls, serializer):
+        """Return the fast representation of a serializer or None"""
+        if not isinstance(serializer, serializers.ModelSerializer):
+            return None
+        model = serializer.Meta.model
+        plan = []
+        sql_casts = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if len(field.source_attrs) != 1: # dotted sources like 'user.email'
+                return None
+            source = field.source_attrs[0]
+            if isinstance(field, ManyRelatedField):
+                relation = cls._compile_relation(model, source, field)
+                if relation is None:
+                    return None
+                plan.append((name, relation, None))
+                continue
+            convert = cls.simple_fields.get(type(field))
+            if convert is None and isinstance(field, serializers.DecimalField):
+                convert = field.to_representation # formatting decimals has a few settings, let DRF do it
+            if convert is None:
+                return None
+            plan.append((name, source, convert))
+            if sql_casts is not None:
+                sql_casts[source] = cls._sql_cast(model, source, field)
+                if sql_casts[source] is None:
+                    sql_casts = None
+
+        return cls(model, plan, sql_casts)
+
+    @staticmethod
+    def _sql_cast(model, source, field):
+        """Return the cast giving the field's json value in postgres"""
+        if not isinstance(field, serializers.DecimalField):
+            return '' # integers and text are the same in postgres json
+        model_field = model._meta.get_field(source)
+        coerce_to_string = getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+        )
+        # numeric::text keeps the decimal places of the column, the same
+        # string DRF makes as long as the serializer uses the same places
+        if coerce_to_string and not field.localize and \
+                field.decimal_places == model_field.decimal_places:
+            return '::text'
+        return None
+
+    @staticmethod
+    def _compile_relation(model, source, field):
+        """Return the (through model, from column, to column) of an M2M"""
+        child = field.child_relation
+        if not isinstance(child, PrimaryKeyRelatedField) or child.pk_field:
+            return None
+        model_field = model._meta.get_field(source)
+        if not model_field.many_to_many or model_field.model is not model:
+            return None
+
+        return (
+            model_field.remote_field.through,
+            model_field.m2m_column_name(), # recipe_id
+            model_field.m2m_reverse_name(), # tag_id
+        )
+
+    def rows(self, queryset, extra = ()):
+        """Return the values() queryset with the columns needed"""
+        columns = list(dict.fromkeys(['id'] + self.columns + list(extra))) # extra are the ordering fields the pagination reads, dict.fromkeys drops duplicates and keeps the order
+        return queryset.prefetch_related(None).values(*columns) # prefetch_related(None) clears the prefetches set by get_queryset
+
+    def represent(self, rows):
+        """Return the representation of values() rows as a list of dicts"""
+        rows = list(rows)
+        ids = [row['id'] for row in rows]
+        linked = {
+            relation: self._linked_ids(relation, ids)
+            for relation in self.relations
+        }
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert in self.plan:
+                if convert is None: # an M2M relation, source is the relation
+                    item[name] = linked[source].get(row['id'], [])
+                    continue
+                value = row[source]
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+
+        return data
+
+    def _linked_ids(self, relation, ids):
+        """Return {object id: [linked ids]} from the through table"""
+        through, from_column, to_column = relation
+        linked = defaultdict(list)
+        for i in range(0, len(ids), self.chunk_size): # keeps the number of query params bounded
+            links = through.objects.filter(**{
+                f'{from_column}__in': ids[i:i + self.chunk_size],
+            }).order_by(from_column, to_column).values_list(
+                from_column, to_column,
+            )
+            for from_id, to_id in links:
+                linked[from_id].append(to_id)
+
+        return linked
+
+    def json_agg(self, rows, ordering, limit = None):
+        """Build the json list of values() rows inside postgres"""
+        # the whole list comes back as one text value built with json_agg, no
+        # model instances and no serializer. when a limit is given (a page,
+        # rows holds one extra row) it also returns whether there are more
+        # rows and the ordering values of the last row of the page
+        qn = connection.ops.quote_name
+        pairs, params = [], []
+        for name, source, convert in self.plan:
+            params.append(name)
+            if convert is None: # the ids of an M2M relation, like the fast path
+                through, from_column, to_column = source
+                pairs.append(
+                    f'%s, COALESCE((SELECT json_agg(l.{qn(to_column)} '
+                    f'ORDER BY l.{qn(to_column)}) '
+                    f'FROM {qn(through._meta.db_table)} l '
+                    f"WHERE l.{qn(from_column)} = p.id), '[]'::json)"
+                )
+            else:
+                pairs.append(f'%s, p.{qn(source)}{self.sql_casts[source]}')
+        obj = 'json_build_object({})'.format(', '.join(pairs))
+        order = ', '.join(
+            'r.{} {}'.format(
+                qn(name.lstrip('-')), 'DESC' if name.startswith('-') else 'ASC'
+            )
+            for name in ordering
+        )
+        inner_sql, inner_params = rows.query.sql_with_params()
+        page = (
+            f'(SELECT r.*, row_number() OVER (ORDER BY {order}) AS rn '
+            f'FROM ({inner_sql}) r) p'
+        )
+        if limit is None:
+            sql = (
+                f'SELECT COALESCE(json_agg({obj} ORDER BY p.rn), '
+                f"'[]'::json)::text FROM {page}"
+            )
+        else:
+            keys = ', '.join(
+                'p.{}'.format(qn(name.lstrip('-'))) for name in ordering
+            )
+            sql = (
+                f'SELECT COALESCE(json_agg({obj} ORDER BY p.rn) '
+                f"FILTER (WHERE p.rn <= %s), '[]'::json)::text, "
+                f'count(*) > %s, '
+                f'(json_agg(json_build_array({keys})) '
+                f'FILTER (WHERE p.rn = %s))::text '
+                f'FROM {page}'
+            )
+            params += [limit, limit, limit]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + list(inner_params))
+            result = cursor.fetchone()
+        if limit is None:
+            return result[0], None
+
+        text, has_more, last = result
+        position = None
+        if has_more:
+            position = json.loads(last, parse_float = Decimal)[0] # decimals (prices) are kept exact for the cursor
+        return text, position
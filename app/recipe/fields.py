@@ -0,0 +1,94 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+from core.images import load_images
+from core.thumbnails import image_version
+
+
+class BatchedManyRelatedField(ManyRelatedField):
+    """Many related field looking all the submitted primary keys up at once"""
+    # ManyRelatedField runs its child on every item, one SELECT per id. here
+    # all of them are fetched with one id__in query and every unknown id is
+    # reported in the same error
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type = type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                child.fail('incorrect_type', data_type = type(item).__name__)
+            try:
+                pks.append(pk_field.to_python(item))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type = type(item).__name__)
+        pks = list(dict.fromkeys(pks)) # drops the ids sent twice, keeps the order
+
+        found = queryset.in_bulk(pks)
+        unknown = [pk for pk in pks if pk not in found]
+        if unknown:
+            raise serializers.ValidationError([
+                child.error_messages['does_not_exist'].format(pk_value = pk)
+                for pk in unknown
+            ])
+
+        return [found[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key of an object owned by the user making the request"""
+    # with many=True the ids are checked by BatchedManyRelatedField
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is not None: # without a request (shell, tests) every object is allowed
+            queryset = queryset.filter(user = request.user)
+
+        return queryset
+
+
+class RecipeImagesField(serializers.ReadOnlyField):
+    """URLs of the resized copies of a recipe image, by size and format"""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        images = {}
+        for size, names in load_images(value).items():
+            images[size] = {}
+            for fmt, name in names.items():
+                url = default_storage.url(name)
+                if request is not None: # absolute like the url of the image field
+                    url = request.build_absolute_uri(url)
+                images[size][fmt] = url
+
+        return images
+
+
+class ImageVersionField(serializers.ReadOnlyField):
+    """Version of a recipe image, the v param of its /image/ urls"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return image_version(value.name) if value else None
@@ -0,0 +1,211 @@
+"""Import of recipes exported as newline-delimited JSON (see recipe.export)
+
+The lines are read, checked and written in chunks, each chunk in its own
+transaction. The tag and ingredient names are turned into ids with a map of
+the user's names kept in memory, only the names it doesn't know yet go to
+the database. On Postgres the recipes and their links are loaded with COPY
+(the recipe ids are reserved from the sequence first, to write the links in
+the same pass, and the recipes are indexed for search as they are
+inserted), elsewhere they go through the bulk_create path of the bulk
+create endpoint.
+"""
+import io
+import json
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import search
+from core.counters import add_recipe_counts
+from core.models import Recipe
+from core.names import get_or_create_by_name
+from core.versions import bump_version
+
+from .bulk import LINK_FIELDS, insert_recipes
+
+
+CHUNK_SIZE = 5000 # recipes written per transaction
+
+FIELDS = ('title', 'time_minutes', 'price', 'link') # the rest of an exported line (id, image, ...) is not imported
+
+
+class InvalidLine(ValueError):
+    """Raised for a line that isn't a valid recipe"""
+
+
+def _copy_text(value):
+    """Escape a value for the text format of COPY"""
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+class RecipeImporter:
+    """Import exported recipes into the account of a user"""
+
+    def __init__(self, user, chunk_size = CHUNK_SIZE, batch_size = 500):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size # rows per INSERT when COPY isn't used
+        self.names = {} # {'tags': {name: id}, ...} of the user, by exact spelling
+        self.imported = 0
+
+    def run(self, lines):
+        """Import the lines, yield the number imported after every chunk"""
+        self._load_names()
+        try:
+            for chunk in self._chunks(lines):
+                with transaction.atomic():
+                    self._import_chunk(chunk)
+                self.imported += len(chunk)
+                yield self.imported
+        finally:
+            bump_version([self.user.pk] if self.imported else ()) # once for the whole import
+
+    def _load_names(self):
+        """Map the names of the user's tags/ingredients to their ids"""
+        for field_name in LINK_FIELDS:
+            model = Recipe._meta.get_field(field_name).related_model
+            names = self.names[field_name] = {}
+            rows = model.objects.filter(user = self.user) \
+                .values_list('name', 'id').iterator()
+            names.update(rows) # the other spellings are looked up (once) like new names
+
+    def _chunks(self, lines):
+        """Yield lists of checked recipes of chunk_size lines"""
+        chunk = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            chunk.append(self._clean(number, line))
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _clean(self, number, line):
+        """Return the recipe of a line, checked like the model would"""
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            raise InvalidLine(f'line {number}: not JSON ({error})')
+        if not isinstance(data, dict):
+            raise InvalidLine(f'line {number}: not a JSON object')
+
+        recipe = {}
+        for name in FIELDS:
+            field = Recipe._meta.get_field(name)
+            value = data.get(name, field.get_default()) # only link has a default ('')
+            try:
+                recipe[name] = field.clean(value, None) # the field's checks, no model instance needed
+            except ValidationError as error:
+                raise InvalidLine(
+                    f'line {number}: {name}: {" ".join(error.messages)}'
+                )
+        for field_name in LINK_FIELDS:
+            names = data.get(field_name, [])
+            if not isinstance(names, list) or not all(
+                isinstance(name, str) and 0 < len(name.strip()) <= 255
+                for name in names
+            ):
+                raise InvalidLine(
+                    f'line {number}: {field_name}: must be a list of names'
+                )
+            recipe[field_name] = [name.strip() for name in names]
+
+        return recipe
+
+    def _import_chunk(self, recipes):
+        """Write a chunk of recipes with their links"""
+        for recipe in recipes: # what the search vector is built from
+            recipe['terms'] = ' '.join(
+                recipe['tags'] + recipe['ingredients']
+            )
+        for field_name in LINK_FIELDS:
+            known = self.names[field_name]
+            missing = [
+                name for recipe in recipes for name in recipe[field_name]
+                if name not in known
+            ]
+            if missing:
+                model = Recipe._meta.get_field(field_name).related_model
+                found = get_or_create_by_name(model, self.user.pk, missing)[0]
+                known.update((name, pk) for name, (pk, stored) in found.items())
+            for recipe in recipes:
+                recipe[field_name] = [
+                    known[name] for name in recipe[field_name]
+                ]
+
+        if connection.vendor == 'postgresql':
+            self._copy(recipes) # indexed as they are inserted
+        else:
+            ids = insert_recipes(self.user, [
+                {name: recipe[name] for name in FIELDS + LINK_FIELDS}
+                for recipe in recipes
+            ], self.batch_size)[0]
+            search.update_search_index(ids)
+        for field_name in LINK_FIELDS: # in the chunk's transaction
+            add_recipe_counts(
+                Recipe._meta.get_field(field_name).related_model,
+                Counter(
+                    pk for recipe in recipes
+                    for pk in set(recipe[field_name]) # a link once per recipe
+                ),
+            )
+
+    def _copy(self, recipes):
+        """Load recipes and their links with COPY"""
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [Recipe._meta.db_table, 'id', len(recipes)],
+            ) # the ids are taken now so the links can be written right away
+            ids = sorted(row[0] for row in cursor.fetchall())
+
+            # the recipes go through a temporary table so their search
+            # vector is computed as they are inserted, updating them after
+            # would write every row twice
+            cursor.execute(
+                'CREATE TEMPORARY TABLE recipe_import (id integer, '
+                'title text, time_minutes integer, price numeric, '
+                'link text, terms text)'
+            )
+            rows = io.StringIO()
+            for pk, recipe in zip(ids, recipes):
+                rows.write('\t'.join([str(pk)] + [
+                    _copy_text(recipe[name]) for name in FIELDS + ('terms',)
+                ]) + '\n')
+            rows.seek(0)
+            cursor.copy_expert(
+                f'COPY recipe_import (id, {", ".join(FIELDS)}, terms) '
+                'FROM STDIN',
+                rows,
+            )
+            cursor.execute(
+                f'INSERT INTO {quote(Recipe._meta.db_table)} '
+                f'(id, user_id, {", ".join(FIELDS)}, images, image_status, '
+                'updated_at, search_vector) '
+                f'SELECT id, %s, {", ".join(FIELDS)}, \'\', \'\', %s, '
+                f'{search.search_vector_sql("title", "terms")} '
+                'FROM recipe_import',
+                [self.user.pk, timezone.now(),
+                 search.SEARCH_CONFIG, search.SEARCH_CONFIG],
+            )
+            cursor.execute('DROP TABLE recipe_import') # the transaction may not end here (a savepoint)
+
+            for field_name in LINK_FIELDS:
+                field = Recipe._meta.get_field(field_name)
+                rows = io.StringIO()
+                for pk, recipe in zip(ids, recipes):
+                    for linked_pk in dict.fromkeys(recipe[field_name]): # a link once per recipe
+                        rows.write(f'{pk}\t{linked_pk}\n')
+                rows.seek(0)
+                cursor.copy_expert(
+                    f'COPY {quote(field.m2m_db_table())} '
+                    f'(recipe_id, {field.m2m_reverse_name()}) FROM STDIN',
+                    rows,
+                )
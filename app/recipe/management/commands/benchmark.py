@@ -0,0 +1,206 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Tag, Ingredient, Recipe
+from recipe.export import export_recipes
+from recipe.fast import FastRepresentation
+from recipe.serializers import RecipeSerializer
+from recipe.views import TagViewSet
+
+
+class Rollback(Exception):
+    """Raised to roll back the sample data once a benchmark is done"""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the hot paths of the recipe api"""
+    help = 'Benchmark the recipe api on generated data (rolled back after)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario', choices = sorted(self.scenarios),
+            help = 'What to benchmark',
+        )
+        parser.add_argument(
+            '--rows', type = int, nargs = '+', default = [10000, 100000],
+            help = 'Number of recipes to generate (one run per number)',
+        )
+        parser.add_argument(
+            '--repeat', type = int, default = 3,
+            help = 'Runs per measure, the best one is reported',
+        )
+
+    @property
+    def scenarios(self):
+        return {
+            'serializers': self.bench_serializers,
+            'assigned': self.bench_assigned,
+            'export': self.bench_export,
+        }
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            try:
+                with transaction.atomic(): # everything created is rolled back
+                    user = self.create_sample_data(rows)
+                    self.scenarios[options['scenario']](
+                        user, rows, options['repeat']
+                    )
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def create_sample_data(self, rows, tags = 20, ingredients = 50,
+                           batch_size = 500):
+        """Create a user with recipes linked to a few tags/ingredients"""
+        self.stdout.write(f'Creating {rows} recipes...')
+        user = get_user_model().objects.create_user(
+            'benchmark@example.com', 'benchmark'
+        )
+        tag_ids = [
+            Tag.objects.create(user = user, name = f'tag {i}').id
+            for i in range(tags)
+        ]
+        ingredient_ids = [
+            Ingredient.objects.create(user = user, name = f'ingredient {i}').id
+            for i in range(ingredients)
+        ]
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user = user, title = f'recipe {i}', time_minutes = i % 90,
+                    price = i % 100, link = f'https://example.com/{i}',
+                )
+                for i in range(rows)
+            ),
+            batch_size = batch_size,
+        )
+        recipe_ids = Recipe.objects.filter(user = user) \
+            .values_list('id', flat = True) # bulk_create doesn't set the ids on every database
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(
+                    recipe_id = recipe_id, tag_id = tag_ids[i % tags]
+                )
+                for i, recipe_id in enumerate(recipe_ids)
+            ),
+            batch_size = batch_size,
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            (
+                Recipe.ingredients.through(
+                    recipe_id = recipe_id,
+                    ingredient_id = ingredient_ids[(i + n) % ingredients],
+                )
+                for i, recipe_id in enumerate(recipe_ids) for n in range(3)
+            ),
+            batch_size = batch_size,
+        )
+
+        return user
+
+    def measure(self, label, func, repeat):
+        """Run a function a few times, print and return the best time"""
+        best, result = None, None
+        for i in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(f'  {label}: {best * 1000:.1f} ms')
+
+        return best, result
+
+    def bench_serializers(self, user, rows, repeat):
+        """Compare RecipeSerializer with the fast list representation"""
+        queryset = Recipe.objects.filter(user = user).order_by('-id')
+        renderer = JSONRenderer()
+
+        def serializer():
+            recipes = queryset.prefetch_related(
+                Prefetch('tags', queryset = Tag.objects.only('id')
+                         .order_by('id')),
+                Prefetch('ingredients', queryset = Ingredient.objects
+                         .only('id').order_by('id')),
+            )
+            return renderer.render(RecipeSerializer(recipes, many = True).data)
+
+        def fast():
+            representation = FastRepresentation.compile(RecipeSerializer())
+            return renderer.render(
+                representation.represent(representation.rows(queryset))
+            )
+
+        self.stdout.write(f'{rows} recipes (query + serialize + render):')
+        slow_time, slow_json = self.measure('RecipeSerializer', serializer,
+                                            repeat)
+        fast_time, fast_json = self.measure('FastRepresentation', fast,
+                                            repeat)
+        self.stdout.write(
+            f'  {slow_time / fast_time:.1f}x faster, identical json: '
+            f'{slow_json == fast_json}'
+        )
+
+    def bench_assigned(self, user, rows, repeat):
+        """Compare the join + DISTINCT and semi-join assigned tag filters"""
+        tags = Tag.objects.filter(user = user)
+        ordering = TagViewSet.ordering
+        recipe_ids = list(
+            Recipe.objects.filter(user = user).order_by('-id')
+            .values_list('id', flat = True)[:1000]
+        )
+
+        def ids(queryset):
+            return list(queryset.order_by(*ordering).values_list('id', flat = True))
+
+        cases = [
+            (
+                'assigned_only',
+                lambda: ids(tags.filter(recipe__isnull = False).distinct()),
+                lambda: ids(TagViewSet()._filter_assigned(tags)),
+            ),
+            (
+                f'assigned_to_recipes ({len(recipe_ids)} ids)',
+                lambda: ids(tags.filter(recipe__in = recipe_ids).distinct()),
+                lambda: ids(TagViewSet()._filter_assigned(tags, recipe_ids)),
+            ),
+        ]
+        self.stdout.write(f'{rows} recipes:')
+        for label, join, semi in cases:
+            self.stdout.write(f' {label}')
+            join_time, join_ids = self.measure('join + DISTINCT', join, repeat)
+            semi_time, semi_ids = self.measure('semi-join', semi, repeat)
+            self.stdout.write(
+                f'  {join_time / semi_time:.1f}x faster, same tags: '
+                f'{join_ids == semi_ids}'
+            )
+
+    def bench_export(self, user, rows, repeat):
+        """Compare the peak memory of the list and the streamed export"""
+        renderer = JSONRenderer()
+
+        def listed():
+            recipes = Recipe.objects.filter(user = user).order_by('id') \
+                .prefetch_related('tags', 'ingredients')
+            return len(renderer.render(
+                RecipeSerializer(recipes, many = True).data
+            ))
+
+        def exported():
+            return sum(len(line) for line in export_recipes(user.pk))
+
+        self.stdout.write(f'{rows} recipes (peak python memory):')
+        for label, func in (('list endpoint', listed),
+                            ('streamed export', exported)):
+            tracemalloc.start()
+            self.measure(label, func, 1) # tracing makes the timings meaningless
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(f'  {label}: {peak / 2 ** 20:.1f} MiB peak')
@@ -0,0 +1,51 @@
+import gzip
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.export import CHUNK_SIZE, export_recipes
+
+
+class Command(BaseCommand):
+    """Django command to export the recipes of a user as NDJSON"""
+    help = 'Export the recipes of a user as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help = 'Email of the user to export')
+        parser.add_argument(
+            '--output', '-o',
+            help = 'File to write (gzipped if it ends in .gz), stdout if not given',
+        )
+        parser.add_argument(
+            '--chunk-size', type = int, default = CHUNK_SIZE,
+            help = 'Recipes read per round trip to the database',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email = options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with the email {options["email"]}')
+
+        lines = export_recipes(user.pk, options['chunk_size'])
+        output = options['output']
+        if not output:
+            self._write(
+                lambda line: self.stdout.write(line, ending = ''), lines,
+            )
+        else:
+            opener = gzip.open if output.endswith('.gz') else open
+            with opener(output, 'wt', encoding = 'utf-8') as file:
+                count = self._write(file.write, lines)
+            self.stderr.write(self.style.SUCCESS(
+                f'Exported {count} recipes to {output}'
+            ))
+
+    def _write(self, write, lines):
+        """Write the lines as they come, return how many were written"""
+        count = 0
+        for line in lines:
+            write(line)
+            count += 1
+
+        return count
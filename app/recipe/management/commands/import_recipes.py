@@ -0,0 +1,55 @@
+import gzip
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.importer import CHUNK_SIZE, InvalidLine, RecipeImporter
+
+
+class Command(BaseCommand):
+    """Django command to import recipes exported as NDJSON"""
+    help = 'Import newline-delimited JSON recipes (an export) for a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help = 'File to read (gzipped if it ends in .gz)',
+        )
+        parser.add_argument(
+            '--user', required = True,
+            help = 'Email of the user the recipes are imported for',
+        )
+        parser.add_argument(
+            '--chunk-size', type = int, default = CHUNK_SIZE,
+            help = 'Recipes written per transaction',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email = options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with the email {options["user"]}')
+
+        path = options['path']
+        opener = gzip.open if path.endswith('.gz') else open
+        importer = RecipeImporter(user, options['chunk_size'])
+        start = time.perf_counter()
+        try:
+            with opener(path, 'rt', encoding = 'utf-8') as lines:
+                for imported in importer.run(lines):
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f'{imported} recipes imported '
+                        f'({imported / elapsed:.0f} recipes/s)'
+                    )
+        except InvalidLine as error:
+            # the chunks before the invalid line are kept
+            raise CommandError(
+                f'{error}, stopped after {importer.imported} recipes'
+            )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} recipes in {elapsed:.1f} s '
+            f'({importer.imported / max(elapsed, 1e-6):.0f} recipes/s)'
+        ))
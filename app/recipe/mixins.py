@@ -0,0 +1,238 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from core.cache import LRUCache
+from core.versions import get_version
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .fast import FastRepresentation
+
+
+class SparseFieldsViewMixin:
+    """Let clients choose the fields they get back with ?fields=a,b"""
+    # the serializers drop the fields that were not asked for, and the views
+    # use get_requested_fields to load only the columns (and relations)
+    # needed for them
+
+    def get_requested_fields(self):
+        """Return the set of fields asked for, None if all are wanted"""
+        if self.request.method not in SAFE_METHODS: # writes always use every field
+            return None
+        value = self.request.query_params.get('fields')
+        if not value:
+            return None
+
+        requested = {name.strip() for name in value.split(',')} - {''}
+        available = self.get_serializer_class().Meta.fields
+        unknown = requested.difference(available)
+        if unknown or not requested:
+            raise ValidationError({'fields': [
+                f'Must be a comma separated list of: {", ".join(available)}.'
+            ]})
+
+        return requested
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def get_only_fields(self, requested):
+        """Return the model columns to load for the requested fields"""
+        model = self.queryset.model
+        columns = {field.name for field in model._meta.concrete_fields}
+        ordering = {name.lstrip('-') for name in self.get_ordering()} # the pagination reads the ordering values of the last row
+
+        return {'id'} | ((requested | ordering) & columns)
+
+
+class FastListMixin:
+    """List objects with the compiled read-only representation"""
+    fast_list = True # set to False to always list with the serializer
+
+    def list(self, request, *args, **kwargs):
+        fast = None
+        if self.fast_list:
+            fast = FastRepresentation.compile(self.get_serializer())
+        if fast is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = [name.lstrip('-') for name in self.get_ordering()]
+        rows = fast.rows(queryset, extra = ordering) # plain dicts instead of model instances
+        if self.use_json_agg(fast):
+            return self.json_agg_list(fast, rows)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.represent(page))
+
+        return Response(fast.represent(rows))
+
+    def use_json_agg(self, fast):
+        """Return True if the list should be built as json by postgres"""
+        return (
+            getattr(settings, 'RECIPE_LIST_JSON_AGG', False) and
+            connection.vendor == 'postgresql' and
+            fast.sql_casts is not None
+        )
+
+    def json_agg_list(self, fast, rows):
+        """Return the list built by postgres, passed through untouched"""
+        ordering = self.get_ordering()
+        paginator = self.paginator
+        page = None
+        if paginator is not None:
+            page = paginator.get_page_queryset(rows, self.request, view = self)
+        if page is None:
+            text, position = fast.json_agg(rows, ordering)
+            return HttpResponse(text, content_type = 'application/json')
+
+        text, position = fast.json_agg(
+            page, ordering, limit = paginator.page_size
+        )
+        paginator.set_next_position(position)
+        body = '{{"next":{},"results":{}}}'.format(
+            json.dumps(paginator.get_next_link()), text
+        )
+        return HttpResponse(body, content_type = 'application/json')
+
+
+class ChangeVersionMixin:
+    """Read the change version of the user's data once per request"""
+
+    def get_change_version(self):
+        """Return the (version, updated_at) of the user's data"""
+        if not hasattr(self, '_change_version'):
+            self._change_version = get_version(self.request.user.pk)
+        return self._change_version
+
+
+class ConditionalGetMixin(ChangeVersionMixin):
+    """Answer reads with 304 Not Modified when nothing changed"""
+    # every write to a user's recipes, tags or ingredients bumps their change
+    # version (see core.signals), so the version alone tells if a response
+    # they got before is still fresh. we check it (one primary key lookup)
+    # before running the main query or serializing anything
+
+    def get_etag(self, request, version):
+        """Return the ETag of the response for a version of the user's data"""
+        # the same version gives different responses for other urls, query
+        # params and formats (json or the browsable api)
+        key = '{}:{}:{}:{}:{}'.format(
+            request.user.pk,
+            version[0],
+            version[1].isoformat(),
+            request.get_full_path(),
+            request.accepted_media_type,
+        )
+        return '"{}"'.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Return 304 if the client's copy is fresh, else call the handler"""
+        version = self.get_change_version()
+        etag = self.get_etag(request, version)
+        last_modified = int(version[1].timestamp())
+        # http dates are in whole seconds, another write in the second of the
+        # last one would keep the same Last-Modified. we only send it (and
+        # compare If-Modified-Since to it) once that second is over, until
+        # then the ETag alone tells if the client's copy is fresh
+        if last_modified >= int(timezone.now().timestamp()):
+            last_modified = None
+        response = get_conditional_response(
+            request._request, etag = etag, last_modified = last_modified,
+        ) # None when the conditional headers (if any) don't match
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    """Conditional GET for the list action"""
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+
+class ConditionalRetrieveMixin(ConditionalGetMixin):
+    """Conditional GET for the retrieve action"""
+    # kept apart from the list one, the router adds detail routes to every
+    # viewset having a retrieve method
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class CachedListMixin(ChangeVersionMixin):
+    """Serve lists from a cache of their rendered json"""
+    # the key holds the user's change version, so after a write the old
+    # entries are never read again (they just get pushed out). the in-process
+    # LRU answers hot users without asking django's cache, which can be a
+    # network round trip away, or touching the db and the serializers
+    cached_list = True # set to False to always build the list
+    list_cache = LRUCache(max_size = settings.RECIPE_LIST_CACHE_SIZE)
+    list_cache_timeout = settings.RECIPE_LIST_CACHE_TIMEOUT
+    list_cache_max_bytes = settings.RECIPE_LIST_CACHE_MAX_BYTES # bigger lists are not cached, keeps the memory used bounded
+
+    def list(self, request, *args, **kwargs):
+        if not self.cached_list or \
+                request.accepted_renderer.format != 'json': # the browsable api renders forms for the request
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        cached = self.list_cache.get(key)
+        if cached is None:
+            cached = cache.get(key)
+            if cached is not None:
+                self.list_cache.set(key, cached)
+        if cached is not None:
+            content_type, content = cached
+            return HttpResponse(content, content_type = content_type)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        if isinstance(response, Response): # not rendered yet
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+        if len(response.content) <= self.list_cache_max_bytes:
+            cached = (response['Content-Type'], response.content)
+            self.list_cache.set(key, cached)
+            cache.set(key, cached, self.list_cache_timeout)
+
+        return response
+
+    def get_list_cache_key(self, request):
+        """Return the cache key of the list for the request"""
+        version, updated_at = self.get_change_version()
+        params = sorted(request.query_params.lists()) # the same params in another order give the same list
+        key = '{}:{}:{}:{}:{}:{}'.format(
+            request.user.pk,
+            version,
+            updated_at.isoformat(),
+            request.build_absolute_uri(request.path), # the next links hold the host
+            json.dumps(params),
+            request.accepted_media_type,
+        )
+        return 'recipe:list:{}'.format(
+            hashlib.md5(key.encode('utf-8')).hexdigest()
+        )
@@ -0,0 +1,177 @@
+import base64 # used to make the cursors opaque (url safe strings instead of raw values)
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opt-in keyset (cursor) pagination over the ordering of the view"""
+    # instead of using OFFSET (which makes the db read and throw away every
+    # row before the page) we remember the ordering values of the last row
+    # and ask for the rows that come after it. we never run a COUNT(*) either,
+    # we fetch one extra row to know if there is a next page, so a deep page
+    # costs the same as the first one
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = _('Invalid cursor')
+
+    def is_requested(self, request):
+        """Return True if the client asked for a paginated response"""
+        # old clients that don't send any of these params keep getting the
+        # plain list of objects they have always got
+        return (
+            self.cursor_query_param in request.query_params or
+            self.page_size_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request, view)
+        if page is None:
+            return None
+
+        rows = list(page)
+        next_position = None
+        if len(rows) > self.page_size: # we got the extra row, there is a next page
+            rows = rows[:self.page_size]
+            next_position = self._position(rows[-1])
+        self.set_next_position(next_position)
+
+        return rows
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Return the (unevaluated) rows of the page plus one extra row"""
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.ordering = tuple(view.get_ordering()) # the queryset is already ordered by these fields in get_queryset
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        return queryset[:self.page_size + 1] # the extra row tells us if there is a next page
+
+    def set_next_position(self, position):
+        """Set the ordering values of the last row, None on the last page"""
+        self.next_position = position
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        """Return the page size requested by the client (or the default)"""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        """Return the url of the next page, None if this is the last page"""
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(
+            url, self.page_size_query_param, self.page_size
+        )
+
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def encode_cursor(self, position):
+        """Encode the ordering values of a row into an opaque string"""
+        data = json.dumps(
+            {'o': self.ordering, 'v': position},
+            default = str, # decimals are sent as strings
+            separators = (',', ':'),
+        )
+
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, queryset):
+        """Return the ordering values encoded in the cursor param (if any)"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+                .decode('utf-8')
+            )
+            ordering, position = tuple(data['o']), data['v']
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        # a cursor only makes sense for the ordering it was created with
+        if ordering != self.ordering or not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # the values are converted the way the fields would, a value of
+            # the wrong type is a bad cursor, not an error in the query
+            position = [
+                self._ordering_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        if None in position: # none of the ordering fields are nullable
+            raise NotFound(self.invalid_cursor_message)
+
+        return position
+
+    def _ordering_field(self, queryset, field):
+        """Return the model field (or annotation) a queryset is ordered by"""
+        name = field.lstrip('-')
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist: # search_rank is annotated
+            return queryset.query.annotations[name].output_field
+
+    def _position(self, row):
+        """Return the values of the ordering fields for a row"""
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict): # rows can also come from values() querysets
+                values.append(row[name])
+            else:
+                values.append(getattr(row, name))
+
+        return values
+
+    def _after(self, position):
+        """Return a filter matching the rows that come after a position"""
+        # for an ordering (a, b) this builds: a > x OR (a = x AND b > y), using
+        # < instead of > for descending fields
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            equal = {
+                prev.lstrip('-'): value
+                for prev, value in zip(self.ordering[:i], position)
+            }
+            equal[field.lstrip('-') + lookup] = position[i]
+            condition |= Q(**equal)
+
+        return condition
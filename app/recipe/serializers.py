@@ -1,45 +1,231 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+
 from rest_framework import serializers
 
+from core import blobs
+from core.changes import bulk_recipes_changed
 from core.models import Tag, Ingredient, Recipe
+from core.jobs import enqueue_image
+from core.names import get_or_create_by_name
+
+from .fields import ImageVersionField, RecipeImagesField, \
+                    UserPrimaryKeyRelatedField
+
+
+class SparseFieldsMixin:
+    """Only output the fields requested with ?fields= (see the views)"""
+    # the fields listed in Meta.optional_fields are left out unless they are
+    # requested by name
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields') # set by the view, None when all the fields are wanted
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer): # many=True wraps the serializer in a ListSerializer
+            parent = parent.parent
+        # nested serializers (the tags of a recipe detail) share the context
+        # of the top level serializer but keep all their fields
+        if requested is None or parent is not None:
+            optional = getattr(self.Meta, 'optional_fields', ())
+            return OrderedDict(
+                (name, field) for name, field in fields.items()
+                if name not in optional
+            )
+
+        return OrderedDict(
+            (name, field) for name, field in fields.items()
+            if name in requested
+        )
+
+
+class UniqueNameMixin:
+    """Reject a name the user already has, whatever its case"""
+
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is None:
+            return value
+        model = self.Meta.model
+        exists = model.objects.filter(user = request.user).annotate(
+            lower_name = Lower('name'),
+        ).filter(lower_name = Lower(Value(value))).exists() # the same lower() as the unique index
+        if exists:
+            raise serializers.ValidationError(
+                f'You already have a {model._meta.verbose_name} named "{value}".'
+            )
 
-class TagSerializer(serializers.ModelSerializer):
+        return value
+
+
+class TagSerializer(UniqueNameMixin, SparseFieldsMixin,
+                    serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+        optional_fields = ('recipe_count',) # only sent with ?fields=...,recipe_count
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, SparseFieldsMixin,
+                           serializers.ModelSerializer):
     """Serializer for ingredient objects"""
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+        optional_fields = ('recipe_count',) # only sent with ?fields=...,recipe_count
+
 
+class BulkNamesSerializer(serializers.Serializer):
+    """Validate the names of a bulk get-or-create of tags/ingredients"""
+    names = serializers.ListField(
+        child = serializers.CharField(max_length = 255),
+        allow_empty = False,
+        max_length = 1000,
+    )
 
-class RecipeSerializer(serializers.ModelSerializer):
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipe objects"""
     # since ingredients and tags are references to other models, we have to
     # define them as special fields
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many = True, # allow many ingredients
-        queryset = Ingredient.objects.all(),
+        queryset = Ingredient.objects.all(), # only the user's own ones are accepted
+        required = False, # they can be given by name instead
     ) # this lists the ingredients with their IDs(pk) (without names) only since we used (PrimaryKeyRelatedField)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many = True,
         queryset = Tag.objects.all(),
+        required = False,
+    )
+    # tags/ingredients given by name, the ones the user doesn't have yet are
+    # created. together with the ones given by id they replace the recipe's
+    # tags/ingredients, a PATCH with only tag_names sets the tags to those
+    ingredient_names = serializers.ListField(
+        child = serializers.CharField(max_length = 255),
+        write_only = True,
+        required = False,
+    )
+    tag_names = serializers.ListField(
+        child = serializers.CharField(max_length = 255),
+        write_only = True,
+        required = False,
     )
+    images = RecipeImagesField() # urls of the resized copies of the image
+    image_status = serializers.CharField(read_only = True) # processing until the image_worker is done with it
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags', 'time_minutes',
-            'price', 'link',
+            'price', 'link', 'ingredient_names', 'tag_names', 'images',
+            'image_status',
         )
         read_only_fields = ('id',)
+        optional_fields = ('images', 'image_status') # only listed with ?fields=...
+
+    link_fields = ('tags', 'ingredients')
+    name_fields = {'tags': 'tag_names', 'ingredients': 'ingredient_names'}
+
+    def create(self, validated_data):
+        links = self._pop_links(validated_data, validated_data['user'].pk)
+        with transaction.atomic(): # the recipe with its links
+            recipe = super().create(validated_data)
+            self._save_links(recipe, links, created = True)
+
+        return recipe
+
+    def update(self, instance, validated_data):
+        links = self._pop_links(validated_data, instance.user_id)
+        with transaction.atomic():
+            recipe = super().update(instance, validated_data)
+            self._save_links(recipe, links)
+
+        return recipe
+
+    def _pop_links(self, validated_data, user_id):
+        """Take the tag/ingredient ids out of the data ModelSerializer saves"""
+        links = {
+            name: [obj.pk for obj in validated_data.pop(name)]
+            for name in self.link_fields if name in validated_data
+        }
+        for name, names_field in self.name_fields.items():
+            names = validated_data.pop(names_field, None)
+            if names is None:
+                continue
+            model = Recipe._meta.get_field(name).related_model
+            found = get_or_create_by_name(model, user_id, names)[0]
+            links[name] = list(dict.fromkeys(
+                links.get(name, []) + [pk for pk, stored_name in found.values()]
+            )) # drops the ones given both ways
+
+        return links
+
+    def _save_links(self, recipe, links, created = False):
+        """Write the links added/removed straight to the through tables"""
+        # the related objects were already fetched (and checked) by the
+        # fields, so unlike the related managers' set() we don't read them
+        # again. only the current links are read (and locked, so a link
+        # removed by another request meanwhile isn't uncounted twice), and
+        # not for a new recipe
+        changes = {name: {} for name in self.link_fields} # {id: +1/-1} added to the recipe counts
+        for name, ids in links.items():
+            field = Recipe._meta.get_field(name)
+            through = field.remote_field.through
+            column = field.m2m_reverse_name() # tag_id / ingredient_id
+            wanted = set(ids)
+            current = set() if created else set(
+                through.objects.filter(recipe_id = recipe.pk)
+                .select_for_update().values_list(column, flat = True)
+            )
+            removed = current - wanted
+            if removed:
+                through.objects.filter(**{
+                    'recipe_id': recipe.pk, f'{column}__in': removed,
+                }).delete()
+            added = [pk for pk in ids if pk not in current]
+            if added:
+                through.objects.bulk_create([
+                    through(**{'recipe_id': recipe.pk, column: pk})
+                    for pk in added
+                ])
+            changes[name] = dict.fromkeys(removed, -1)
+            changes[name].update(dict.fromkeys(added, 1))
+            getattr(recipe, '_prefetched_objects_cache', {}).pop(name, None) # the response reads the new links
+
+        if any(changes.values()):
+            bulk_recipes_changed( # the m2m_changed handlers are not called
+                [recipe.pk], [recipe.user_id],
+                changes['tags'], changes['ingredients'],
+            )
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """Validate a recipe of a bulk create"""
+    # the tag/ingredient ids are plain integers here, the view checks them
+    # all at once (one query per model) instead of one query per id
+    ingredients = serializers.ListField(
+        child = serializers.IntegerField(), default = list,
+    )
+    tags = serializers.ListField(
+        child = serializers.IntegerField(), default = list,
+    )
+
+
+class RecipeBulkUpdateSerializer(serializers.ModelSerializer):
+    """Validate the values set on recipes by a bulk update"""
+
+    class Meta:
+        model = Recipe
+        fields = ('title', 'time_minutes', 'price', 'link')
 
 
 class RecipeDetailSerializer(RecipeSerializer): # re-use the RecipeSerializer overriding tags and ingredients
@@ -49,11 +235,37 @@ class RecipeDetailSerializer(RecipeSerializer): # re-use the RecipeSerializer ov
     # here we are using serializers as fields (nested relationships) which will
     # allow us to access all the fields of that serializer for detailed view
 
+    image_version = ImageVersionField() # the v of the /image/ urls
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('image_version',)
+        optional_fields = () # the detail always has the images
+
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
 
+    images = RecipeImagesField()
+    image_status = serializers.CharField(read_only = True)
+    image_version = ImageVersionField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'images', 'image_status', 'image_version')
         read_only_fields = ('id',)
+
+    def update(self, instance, validated_data):
+        # only the original is stored here, the image_worker makes the
+        # resized copies (see core.jobs)
+        old_image, old_images = instance.image.name, instance.images
+        validated_data.update(images = '', image_status = 'processing')
+        with transaction.atomic():
+            recipe = super().update(instance, validated_data) # the storage names the file after its content
+            if not blobs.acquire(recipe.image.name): # first, the same photo uploaded again isn't deleted
+                recipe.image.storage.save(
+                    recipe.image.name, validated_data['image'],
+                ) # found stored, then deleted by the last recipe letting it go
+            blobs.release(old_image, old_images) # deleted with its copies if no other recipe uses it
+            enqueue_image(recipe)
+
+        return recipe
@@ -0,0 +1,308 @@
+from unittest.mock import patch
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, models
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ImageJob, Recipe, Tag, Ingredient
+
+from recipe import views
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+class RecipeBulkCreateApiTests(TestCase):
+    """Test creating many recipes in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Tofu'
+        )
+
+    def payload(self, count):
+        """Return the data of a few recipes"""
+        return [
+            {
+                'title': f'recipe {i}',
+                'time_minutes': i,
+                'price': '1.50',
+                'tags': [self.tag.id],
+                'ingredients': [self.ingredient.id] if i % 2 else [],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create_recipes(self):
+        """Test the recipes are created with their tags and ingredients"""
+        res = self.client.post(BULK_URL, self.payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['title'] for item in res.data],
+                         ['recipe 0', 'recipe 1', 'recipe 2'])
+        recipe = Recipe.objects.get(id=res.data[1]['id'])
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(list(recipe.ingredients.all()), [self.ingredient])
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 3)
+
+        searched = self.client.get(RECIPE_URL, {'search': 'tofu'})
+        self.assertEqual([item['id'] for item in searched.data],
+                         [res.data[1]['id']]) # the search index is updated too
+
+    def test_bulk_create_recipes_with_names(self):
+        """Test the names of all the recipes are got or created at once"""
+        payload = self.payload(2)
+        payload[0]['tag_names'] = ['vegan', 'Quick']
+        payload[1]['tag_names'] = ['quick']
+        payload[1]['ingredient_names'] = ['Rice']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        quick = Tag.objects.get(user=self.user, name='Quick')
+        rice = Ingredient.objects.get(user=self.user, name='Rice')
+        self.assertEqual(res.data[0]['tags'], [self.tag.id, quick.id]) # 'vegan' is the existing tag
+        self.assertEqual(res.data[1]['tags'], [self.tag.id, quick.id])
+        self.assertEqual(
+            res.data[1]['ingredients'], [self.ingredient.id, rice.id]
+        )
+        quick.refresh_from_db()
+        self.assertEqual(quick.recipe_count, 2)
+
+    def test_bulk_create_queries_constant(self):
+        """Test the queries made don't grow with the recipes sent"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(BULK_URL, self.payload(2), format='json')
+        few = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(BULK_URL, self.payload(50), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(queries), few)
+
+    def test_bulk_create_errors_per_recipe(self):
+        """Test nothing is created and the errors of each recipe returned"""
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        other_tag = Tag.objects.create(user=user2, name='Not yours')
+        payload = self.payload(3)
+        payload[1]['tags'] = [self.tag.id, other_tag.id]
+        payload[2]['ingredients'] = [0]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn(str(other_tag.id), res.data[1]['tags'][0])
+        self.assertIn('ingredients', res.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_invalid_fields(self):
+        """Test invalid fields are reported for the recipe they are in"""
+        payload = self.payload(2)
+        del payload[1]['title']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @patch.object(views.RecipeViewSet, 'bulk_max_size', 2)
+    def test_bulk_create_size_limited(self):
+        """Test empty, too big and non list batches are rejected"""
+        for payload in ([], self.payload(3), {'title': 'not a list'}):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeBulkChangeApiTests(TestCase):
+    """Test updating and deleting the recipes matched by filters"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Tofu'
+        )
+
+    def _recipe(self, user=None, tagged=True):
+        recipe = Recipe.objects.create(
+            user=user or self.user, title='Curry', time_minutes=5, price=2.00
+        )
+        if tagged:
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+        return recipe
+
+    def test_bulk_delete_by_tag(self):
+        """Test the recipes with a tag are deleted with their links"""
+        tagged = [self._recipe() for i in range(3)]
+        kept = self._recipe(tagged=False)
+
+        res = self.client.delete(f'{BULK_URL}?tags={self.tag.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['deleted'], {'recipes': 3, 'tags': 3, 'ingredients': 3}
+        )
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.assertFalse(
+            Recipe.tags.through.objects.filter(
+                recipe_id__in=[recipe.id for recipe in tagged]
+            ).exists()
+        )
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 0)
+        searched = self.client.get(RECIPE_URL, {'search': 'curry'})
+        self.assertEqual([item['id'] for item in searched.data], [kept.id])
+
+    def test_bulk_delete_limited_to_user(self):
+        """Test only the user's recipes are deleted"""
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        other = self._recipe(user=user2, tagged=False)
+        self._recipe()
+
+        res = self.client.delete(f'{BULK_URL}?all=1')
+
+        self.assertEqual(res.data['deleted']['recipes'], 1)
+        self.assertEqual(list(Recipe.objects.all()), [other])
+
+    def test_bulk_delete_with_queued_image(self):
+        """Test a recipe whose image is queued for the worker is deleted"""
+        recipe = self._recipe()
+        ImageJob.objects.create(recipe = recipe, image = 'uploads/recipe/a.jpg')
+
+        res = self.client.delete(f'{BULK_URL}?all=1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_bulk_delete_covers_every_relation(self):
+        """Test no row is left pointing to the recipes deleted in bulk"""
+        # the bulk delete cleans up every table with a foreign key to
+        # Recipe, which has to cascade like Recipe.delete() would
+        recipe = self._recipe()
+        ImageJob.objects.create(recipe = recipe, image = 'uploads/recipe/a.jpg')
+
+        self.client.delete(f'{BULK_URL}?all=1')
+
+        for model in apps.get_models(include_auto_created=True):
+            for field in model._meta.concrete_fields:
+                if not field.many_to_one or field.related_model is not Recipe:
+                    continue
+                self.assertIs(
+                    field.remote_field.on_delete, models.CASCADE, field
+                )
+                self.assertFalse(
+                    model._base_manager.filter(
+                        **{field.name: recipe.id}
+                    ).exists(),
+                    field,
+                )
+
+    def test_bulk_delete_queries_constant(self):
+        """Test the queries made don't grow with the recipes deleted"""
+        self._recipe()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete(f'{BULK_URL}?all=1')
+        few = len(queries)
+
+        for i in range(30):
+            self._recipe()
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.delete(f'{BULK_URL}?all=1')
+
+        self.assertEqual(res.data['deleted']['recipes'], 30)
+        self.assertEqual(len(queries), few)
+
+    def test_bulk_change_requires_filter(self):
+        """Test updating or deleting every recipe has to be asked for"""
+        self._recipe()
+
+        deleted = self.client.delete(f'{BULK_URL}?tags=&all=0')
+        updated = self.client.patch(BULK_URL, {'price': '1.00'}, format='json')
+
+        self.assertEqual(deleted.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(updated.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.get().price, 2)
+
+    def test_bulk_change_invalid_ids(self):
+        """Test ids that aren't numbers are rejected"""
+        self._recipe()
+
+        res = self.client.delete(f'{BULK_URL}?ids=abc')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ids', res.data)
+        self.assertTrue(Recipe.objects.exists())
+
+    def test_bulk_update_by_ids(self):
+        """Test setting values on the given recipes"""
+        recipe1, recipe2, recipe3 = [self._recipe() for i in range(3)]
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        other = self._recipe(user=user2, tagged=False)
+        ids = f'{recipe1.id},{recipe3.id},{other.id}'
+
+        res = self.client.patch(
+            f'{BULK_URL}?ids={ids}',
+            {'price': '9.50', 'title': 'Tofu stew'},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'updated': 2})
+        for recipe in (recipe1, recipe2, recipe3, other):
+            recipe.refresh_from_db()
+        self.assertEqual([recipe1.price, recipe3.price], [9.5, 9.5])
+        self.assertEqual([recipe2.price, other.price], [2, 2])
+        self.assertGreater(recipe1.updated_at, recipe2.updated_at)
+        searched = self.client.get(RECIPE_URL, {'search': 'stew'})
+        self.assertEqual(
+            sorted(item['id'] for item in searched.data),
+            [recipe1.id, recipe3.id],
+        )
+
+    def test_bulk_update_invalid(self):
+        """Test invalid or missing values are rejected"""
+        self._recipe()
+
+        for payload in ({'price': 'cheap'}, {}, {'tags': [self.tag.id]}):
+            res = self.client.patch(
+                f'{BULK_URL}?all=1', payload, format='json'
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
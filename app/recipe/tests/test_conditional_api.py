@@ -0,0 +1,149 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ChangeVersion, Recipe, Tag, Ingredient
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalGetApiTests(TestCase):
+    """Test the ETag / Last-Modified handling of the recipe api"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=10, price=5.00
+        )
+
+    def assertNotModified(self, url, etag, params=None):
+        """Assert the url answers 304 to the etag reading only its version"""
+        with self.assertNumQueries(1): # the change version
+            res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_lists_not_modified(self):
+        """Test lists and details answer 304 while nothing changed"""
+        for url in (RECIPE_URL, TAGS_URL, INGREDIENTS_URL,
+                    detail_url(self.recipe.id)):
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotModified(url, res['ETag'])
+
+    def test_etag_depends_on_query_params(self):
+        """Test different query params don't share an etag"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+        res = self.client.get(
+            RECIPE_URL, {'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_changes_on_writes(self):
+        """Test saving objects and changing links gives new etags"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        changes = [
+            lambda: self.recipe.tags.add(tag),
+            lambda: tag.recipe_set.clear(),
+            lambda: ingredient.recipe_set.add(self.recipe),
+            lambda: Tag.objects.get(id=tag.id).save(),
+            lambda: Recipe.objects.get(id=self.recipe.id).delete(),
+        ]
+        etag = self.client.get(RECIPE_URL)['ETag']
+        for change in changes:
+            change()
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(res['ETag'], etag)
+            etag = res['ETag']
+
+    def test_other_users_writes_keep_etag(self):
+        """Test changes to another user's data don't change the etag"""
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        etag = self.client.get(TAGS_URL)['ETag']
+        Tag.objects.create(user=user2, name='Vegan')
+
+        self.assertNotModified(TAGS_URL, etag)
+
+    def _last_write(self, seconds_ago):
+        """Date the user's last write some seconds back"""
+        ChangeVersion.objects.filter(user=self.user).update(
+            updated_at=timezone.now() - timedelta(seconds=seconds_ago)
+        )
+
+    def test_if_modified_since(self):
+        """Test an echoed Last-Modified answers 304"""
+        self._last_write(seconds_ago=5)
+        res = self.client.get(RECIPE_URL)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1): # the change version
+            res = self.client.get(
+                RECIPE_URL, HTTP_IF_MODIFIED_SINCE=res['Last-Modified']
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since_after_write(self):
+        """Test a write after the echoed Last-Modified answers 200"""
+        self._last_write(seconds_ago=5)
+        last_modified = self.client.get(RECIPE_URL)['Last-Modified']
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=10, price=5.00
+        )
+        self._last_write(seconds_ago=2)
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()), 2)
+
+    def test_no_last_modified_in_the_write_second(self):
+        """Test Last-Modified is left off in the second of the last write"""
+        # another write in the same second would keep the same date
+        now = ChangeVersion.objects.get(user=self.user).updated_at
+        with patch('django.utils.timezone.now', return_value=now):
+            res = self.client.get(RECIPE_URL)
+            self.assertNotIn('Last-Modified', res)
+            Recipe.objects.create(
+                user=self.user, title='Soup', time_minutes=10, price=5.00
+            )
+
+            res = self.client.get(
+                RECIPE_URL, HTTP_IF_MODIFIED_SINCE=http_date(),
+                HTTP_IF_NONE_MATCH=res['ETag'],
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()), 2)
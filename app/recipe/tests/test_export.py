@@ -0,0 +1,115 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import views
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class RecipeExportTests(TestCase):
+    """Test exporting the recipes of a user as NDJSON"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Tofu'
+        )
+
+    def _recipes(self, count):
+        recipes = []
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'recipe {i}', time_minutes=i,
+                price='1.50',
+            )
+            recipe.tags.add(self.tag)
+            if i % 2:
+                recipe.ingredients.add(self.ingredient)
+            recipes.append(recipe)
+        return recipes
+
+    def _export(self):
+        """Return the lines of an export, parsed"""
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        content = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_recipes(self):
+        """Test every recipe of the user is exported with its names"""
+        recipe1, recipe2 = self._recipes(2)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        Recipe.objects.create(user=other, title='x', time_minutes=1, price=1)
+
+        lines = self._export()
+
+        self.assertEqual([line['id'] for line in lines],
+                         [recipe1.id, recipe2.id])
+        self.assertEqual(lines[1]['title'], 'recipe 1')
+        self.assertEqual(lines[1]['price'], '1.50')
+        self.assertEqual(lines[1]['tags'], ['Vegan'])
+        self.assertEqual(lines[1]['ingredients'], ['Tofu'])
+        self.assertEqual(lines[0]['ingredients'], [])
+        self.assertIsNone(lines[0]['image'])
+
+    @patch.object(views.RecipeViewSet, 'export_chunk_size', 5)
+    def test_export_queries_per_chunk(self):
+        """Test the names are fetched per chunk of recipes, not per recipe"""
+        self._recipes(12)
+
+        with CaptureQueriesContext(connection) as queries:
+            lines = self._export()
+        names = [
+            query for query in queries.captured_queries
+            if 'core_recipe_tags' in query['sql']
+        ]
+
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(len(names), 3) # 3 chunks of 5 recipes
+
+    def test_export_recipes_command(self):
+        """Test the command writes the same lines to a gzipped file"""
+        self._recipes(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.ndjson.gz')
+            call_command(
+                'export_recipes', 'test@gmail.com', output=path,
+                stderr=StringIO(),
+            )
+            with gzip.open(path, 'rt') as file:
+                lines = [json.loads(line) for line in file]
+
+        self.assertEqual(lines, self._export())
+
+    def test_export_recipes_command_stdout(self):
+        """Test the command writes to stdout when no file is given"""
+        self._recipes(2)
+        out = StringIO()
+
+        call_command('export_recipes', 'test@gmail.com', stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
@@ -0,0 +1,135 @@
+import json
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import views
+from recipe.fast import FastRepresentation
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+class FastListTestsMixin:
+    """Sample data shared by the fast list tests"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=f'tag {i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'ing {i}')
+            for i in range(3)
+        ]
+        for i in range(4):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'recipe "{i}" é',
+                time_minutes=i,
+                price='%d.5' % i,
+                link='' if i % 2 else 'https://example.com',
+            )
+            recipe.tags.add(*tags[i:]) # added in decreasing id order for some
+            recipe.ingredients.add(*reversed(ingredients[:i]))
+
+    def get_serializer_list(self, url, params=None):
+        """Get a list with the regular serializers"""
+        with patch.object(views.BaseRecipeAttrViewSet, 'fast_list', False), \
+                patch.object(views.RecipeViewSet, 'fast_list', False), \
+                patch.object(views.BaseRecipeAttrViewSet, 'cached_list', False), \
+                patch.object(views.RecipeViewSet, 'cached_list', False):
+            return self.client.get(url, params)
+
+
+class FastListTests(FastListTestsMixin, TestCase):
+    """Test the compiled list representation matches the serializers"""
+
+    def assertSameJson(self, url, params=None):
+        """Assert the fast and the serializer lists render the same bytes"""
+        fast = self.client.get(url, params)
+        slow = self.get_serializer_list(url, params)
+
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_recipes_same_json(self):
+        """Test listing recipes gives the same json"""
+        self.assertSameJson(RECIPE_URL)
+
+    def test_recipes_sparse_paginated_same_json(self):
+        """Test sparse and paginated recipe lists give the same json"""
+        self.assertSameJson(RECIPE_URL, {'fields': 'tags,price'})
+        self.assertSameJson(
+            RECIPE_URL, {'page_size': 3, 'ordering': 'price'}
+        )
+
+    def test_tags_and_ingredients_same_json(self):
+        """Test listing tags and ingredients gives the same json"""
+        self.assertSameJson(TAGS_URL)
+        self.assertSameJson(INGREDIENTS_URL, {'assigned_only': 1})
+
+    def test_compile_unsupported_serializer(self):
+        """Test serializers with nested fields are not compiled"""
+        self.assertIsNone(FastRepresentation.compile(RecipeDetailSerializer()))
+        self.assertIsNotNone(FastRepresentation.compile(RecipeSerializer()))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'json_agg needs postgres')
+@override_settings(RECIPE_LIST_JSON_AGG=True)
+class JsonAggListTests(FastListTestsMixin, TestCase):
+    """Test the lists built by postgres match the serializers"""
+
+    def assertSameData(self, url, params=None):
+        """Assert the postgres and the serializer lists are the same"""
+        with CaptureQueriesContext(connection) as queries:
+            built = self.client.get(url, params)
+        queries = [ # read before the next request resets them
+            query['sql'] for query in queries.captured_queries
+            if 'core_changeversion' not in query['sql'] # read on a version cache miss
+        ]
+        serialized = self.get_serializer_list(url, params)
+
+        self.assertEqual(built.status_code, 200)
+        self.assertEqual(len(queries), 1) # the whole list is one query
+        self.assertIn('json_agg', queries[0])
+        self.assertEqual(json.loads(built.content), serialized.json())
+        return json.loads(built.content)
+
+    def test_recipes_same_data(self):
+        """Test the recipes built by postgres match the serializer"""
+        self.assertSameData(RECIPE_URL)
+        self.assertSameData(RECIPE_URL, {'fields': 'price,tags'})
+
+    def test_recipes_pages_same_data(self):
+        """Test walking through pages built by postgres"""
+        params = {'page_size': 3, 'ordering': '-price'}
+        page = self.assertSameData(RECIPE_URL, params)
+        self.assertEqual(len(page['results']), 3)
+
+        next_page = self.assertSameData(page['next'])
+        self.assertEqual(len(next_page['results']), 1)
+        self.assertIsNone(next_page['next'])
+
+    def test_tags_and_ingredients_same_data(self):
+        """Test the tags and ingredients built by postgres"""
+        self.assertSameData(TAGS_URL, {'page_size': 2})
+        self.assertSameData(INGREDIENTS_URL, {'assigned_only': 1})
@@ -0,0 +1,181 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import thumbnails
+from core.models import Recipe
+from core.tests.test_image_worker import exif_orientation
+
+
+def image_url(recipe_id):
+    """Return the url of a recipe's resized image"""
+    return reverse('recipe:recipe-image', args = [recipe_id])
+
+
+def read(res):
+    """Return the image of a file response"""
+    return Image.open(io.BytesIO(b''.join(res.streaming_content)))
+
+
+class RecipeImageApiTests(TestCase):
+    """Test the on demand resized recipe images"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT = self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user = self.user, title = 'Curry', time_minutes = 5, price = 2.00,
+        )
+        self._set_image((400, 200))
+
+    def _set_image(self, size, **options):
+        """Give the recipe a JPEG image of a size"""
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (1, 2, 3)).save(
+            buffer, format = 'JPEG', **options
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(buffer.getvalue()))
+
+    def test_resize_to_width(self):
+        """Test the image is fit in the width keeping its aspect ratio"""
+        res = self.client.get(image_url(self.recipe.id), {'w': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(read(res).size, (100, 50))
+
+    def test_resize_to_box(self):
+        """Test the image is fit in both the width and the height"""
+        res = self.client.get(image_url(self.recipe.id), {'w': 100, 'h': 20})
+
+        self.assertEqual(read(res).size, (40, 20))
+
+    def test_resize_not_enlarged(self):
+        """Test a size bigger than the image returns it at its size"""
+        res = self.client.get(image_url(self.recipe.id), {'h': 1000})
+
+        self.assertEqual(read(res).size, (400, 200))
+
+    def test_orientation_applied(self):
+        """Test an image the worker didn't process yet is turned upright"""
+        self._set_image((400, 200), exif = exif_orientation(8))
+
+        res = self.client.get(image_url(self.recipe.id), {'w': 100})
+
+        self.assertEqual(read(res).size, (100, 200))
+
+    def test_resized_once(self):
+        """Test the second request for a size is read from the cache"""
+        with patch(
+            'core.thumbnails.resize_image', wraps = thumbnails.resize_image,
+        ) as resize:
+            first = self.client.get(image_url(self.recipe.id), {'w': 64})
+            second = self.client.get(image_url(self.recipe.id), {'w': 64})
+            read(self.client.get(image_url(self.recipe.id), {'w': 65}))
+
+        self.assertEqual(resize.call_count, 2)
+        self.assertEqual(
+            b''.join(first.streaming_content), b''.join(second.streaming_content),
+        )
+
+    def test_new_image_resized_again(self):
+        """Test the cache isn't used for the image the recipe had before"""
+        read(self.client.get(image_url(self.recipe.id), {'w': 300}))
+        self._set_image((300, 300))
+
+        res = self.client.get(image_url(self.recipe.id), {'w': 300})
+
+        self.assertEqual(read(res).size, (300, 300))
+
+    def test_cache_headers(self):
+        """Test the urls with the image version are cached for good"""
+        version = self.client.get(
+            reverse('recipe:recipe-detail', args = [self.recipe.id])
+        ).data['image_version']
+
+        res = self.client.get(image_url(self.recipe.id), {'w': 50, 'v': version})
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+        res = self.client.get(image_url(self.recipe.id), {'w': 50})
+        self.assertEqual(res['Cache-Control'], 'private, no-cache')
+
+        res = self.client.get(
+            image_url(self.recipe.id), {'w': 50},
+            HTTP_IF_NONE_MATCH = res['ETag'],
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid_params(self):
+        """Test invalid sizes and formats are rejected"""
+        for params in ({}, {'w': 0}, {'w': 'big'}, {'h': 100000},
+                       {'w': 10, 'fmt': 'gif'}):
+            res = self.client.get(image_url(self.recipe.id), params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
+
+    def test_recipe_without_image(self):
+        """Test a recipe without image has no resized image"""
+        recipe = Recipe.objects.create(
+            user = self.user, title = 'Soup', time_minutes = 5, price = 2.00,
+        )
+
+        res = self.client.get(image_url(recipe.id), {'w': 10})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_recipe(self):
+        """Test the images of other users' recipes can't be read"""
+        other = get_user_model().objects.create_user('other@test.com', 'pass')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(image_url(self.recipe.id), {'w': 10})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_evict_least_recently_used(self):
+        """Test the cache is brought back under its budget, oldest first"""
+        for width in (10, 20, 30):
+            read(self.client.get(image_url(self.recipe.id), {'w': width}))
+        paths = {}
+        for root, dirs, files in os.walk(thumbnails.cache_dir()):
+            for name in files:
+                if not name.endswith('.lock'):
+                    path = os.path.join(root, name)
+                    paths[Image.open(path).size[0]] = path
+        now = time.time()
+        for age, width in enumerate((20, 10, 30)): # 30 the least recently used
+            os.utime(paths[width], (now - age * 60, now - age * 60))
+        sizes = {width: os.path.getsize(path) for width, path in paths.items()}
+
+        removed = thumbnails.evict( # the two others fit in what's left after an eviction
+            int((sizes[20] + sizes[10]) / thumbnails.EVICT_TO) + 1,
+        )
+
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(paths[30]))
+        self.assertTrue(os.path.exists(paths[20]))
+        self.assertTrue(os.path.exists(paths[10]))
@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core import search
+from core.models import Tag, Recipe
+
+from recipe.export import export_recipes
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test importing recipes from NDJSON files"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _write(self, recipes, name='recipes.ndjson.gz'):
+        """Write recipes to a file, return its path"""
+        path = os.path.join(self.directory.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as file:
+            for recipe in recipes:
+                file.write(
+                    recipe if isinstance(recipe, str) else json.dumps(recipe)
+                )
+                file.write('\n')
+        return path
+
+    def _import(self, path, **options):
+        out = StringIO()
+        call_command(
+            'import_recipes', path, user='test@gmail.com', stdout=out,
+            **options
+        )
+        return out.getvalue()
+
+    def test_import_recipes(self):
+        """Test the recipes are created with their tags and ingredients"""
+        path = self._write([
+            {'title': 'Tofu\tcurry\\', 'time_minutes': 20, 'price': '4.50',
+             'tags': ['vegan', 'Quick'], 'ingredients': ['Tofu', 'Rice']},
+            {'title': 'Rice', 'time_minutes': 10, 'price': 1,
+             'tags': ['QUICK'], 'ingredients': ['rice', 'Rice']},
+        ])
+
+        out = self._import(path, chunk_size=1)
+
+        self.assertIn('Imported 2 recipes', out)
+        self.assertIn('1 recipes imported', out) # progress per chunk
+        curry, rice = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(curry.title, 'Tofu\tcurry\\')
+        self.assertEqual(str(curry.price), '4.50')
+        self.assertEqual(
+            sorted(curry.tags.values_list('name', flat=True)),
+            ['Quick', 'Vegan'],
+        ) # the existing tag is reused
+        self.assertEqual(list(rice.ingredients.values_list('name', flat=True)),
+                         ['Rice'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        quick = Tag.objects.get(user=self.user, name='Quick')
+        self.assertEqual(quick.recipe_count, 2)
+        found = search.search_recipes(Recipe.objects.all(), 'tofu')
+        self.assertEqual([recipe.id for recipe in found], [curry.id]) # indexed for search
+
+    def test_import_names_not_ascii(self):
+        """Test other spellings of existing names reuse them"""
+        eclair = Tag.objects.create(user=self.user, name='Éclair')
+        path = self._write([
+            {'title': 'Choux', 'time_minutes': 60, 'price': 3,
+             'tags': ['ÉCLAIR', 'Éclair']},
+        ])
+
+        self._import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(list(recipe.tags.all()), [eclair])
+
+    def test_import_export_round_trip(self):
+        """Test importing an export gives the same recipes to another user"""
+        path = self._write([
+            {'title': f'recipe {i}', 'time_minutes': i, 'price': '2.00',
+             'link': 'https://example.com', 'tags': ['Vegan'],
+             'ingredients': [f'ingredient {i % 3}']}
+            for i in range(7)
+        ], name='recipes.ndjson')
+        self._import(path, chunk_size=3)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        exported = self._write(
+            [line.strip() for line in export_recipes(self.user.pk)],
+            name='export.ndjson',
+        )
+
+        call_command('import_recipes', exported, user='other@gmail.com',
+                     stdout=StringIO())
+
+        def content(user):
+            return [
+                {key: value for key, value in json.loads(line).items()
+                 if key not in ('id', 'updated_at')}
+                for line in export_recipes(user.pk)
+            ]
+        self.assertEqual(len(content(other)), 7)
+        self.assertEqual(content(other), content(self.user))
+
+    def test_import_invalid_line(self):
+        """Test an invalid line stops the import, the chunks before stay"""
+        path = self._write([
+            {'title': 'ok', 'time_minutes': 1, 'price': 1},
+            {'title': 'ok too', 'time_minutes': 1, 'price': 1},
+            {'title': 'too expensive', 'time_minutes': 1, 'price': 100000},
+        ], name='recipes.ndjson')
+
+        with self.assertRaisesRegex(CommandError, 'line 3: price'):
+            self._import(path, chunk_size=2)
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_import_not_json(self):
+        """Test a line that isn't a JSON object is reported"""
+        path = self._write(['{"title": "unfinished'], name='recipes.ndjson')
+
+        with self.assertRaisesRegex(CommandError, 'line 1: not JSON'):
+            self._import(path)
+        self.assertFalse(Recipe.objects.exists())
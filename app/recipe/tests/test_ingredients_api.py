@@ -11,6 +11,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+BULK_URL = reverse('recipe:ingredient-bulk-create')
 
 
 class PublicIngredientsApiTests(TestCase):
@@ -124,3 +125,17 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only' : 1})
         self.assertEqual(len(res.data), 1)
+
+    def test_bulk_get_or_create_ingredients(self):
+        """Test getting ingredients by name only creates the missing ones"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(
+            BULK_URL, {'names': ['SALT', 'Pepper']}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0], {'id': salt.id, 'name': 'Salt'})
+        self.assertTrue(
+            Ingredient.objects.filter(user=self.user, name='Pepper').exists()
+        )
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ChangeVersion, Recipe, Tag
+
+from recipe import views
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ListCacheApiTests(TestCase):
+    """Test the cache of the rendered lists"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=10, price=5.00
+        )
+
+    def test_cached_list_not_built_again(self):
+        """Test a list asked for again is served from the cache"""
+        res = self.client.get(RECIPE_URL, {'ordering': 'price', 'fields': 'id'})
+        with self.assertNumQueries(1), \
+                patch.object(views.RecipeViewSet, 'get_queryset') as mock_qs:
+            cached = self.client.get(
+                RECIPE_URL, {'fields': 'id', 'ordering': 'price'}
+            ) # same params in another order
+            mock_qs.assert_not_called() # only the change version was read
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached.json(), [{'id': self.recipe.id}])
+
+    def test_writes_invalidate_cached_lists(self):
+        """Test lists changed by writes are built again"""
+        self.client.get(RECIPE_URL)
+        self.client.get(TAGS_URL)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+
+        self.assertEqual(self.client.get(TAGS_URL).json()[0]['name'], 'Vegan')
+        self.assertEqual(
+            self.client.get(RECIPE_URL).json()[0]['tags'], [tag.id]
+        )
+
+    def test_writes_of_other_processes_seen(self):
+        """Test a version bumped without this process knowing is seen"""
+        self.client.get(TAGS_URL)
+        Tag.objects.bulk_create([Tag(user=self.user, name='Vegan')]) # no signals, like a write made by another process
+        ChangeVersion.objects.filter(user=self.user).update(
+            version=F('version') + 1,
+        ) # bumped there, this process' cache isn't told
+
+        self.assertEqual(self.client.get(TAGS_URL).json()[0]['name'], 'Vegan')
+
+    def test_cache_per_user(self):
+        """Test users don't get each other's cached lists"""
+        self.client.get(TAGS_URL)
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+        self.client.force_authenticate(user2)
+
+        self.assertEqual(len(self.client.get(TAGS_URL).json()), 1)
@@ -0,0 +1,112 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class KeysetPaginationTests(TestCase):
+    """Test the opt-in keyset pagination of the recipe api"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url, params):
+        """Follow the next links and return the ids of every page"""
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in res.data['results']])
+            if not res.data['next']:
+                return pages
+            res = self.client.get(res.data['next'])
+
+    def test_unpaginated_by_default(self):
+        """Test that old clients still get a plain list"""
+        sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data, list)
+
+    def test_paginate_recipes(self):
+        """Test walking through the recipes page by page"""
+        ids = [sample_recipe(user=self.user).id for i in range(5)]
+
+        pages = self._walk(RECIPE_URL, {'page_size': 2})
+
+        self.assertEqual(pages, [ids[4:2:-1], ids[2:0:-1], ids[:1]])
+
+    def test_paginate_tags_with_same_count(self):
+        """Test that tags used by as many recipes are not skipped or repeated"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('b', 'a', 'c', 'e', 'd')
+        ] # the names are unique, the counts (all 0) are the ties
+
+        pages = self._walk(
+            TAGS_URL, {'page_size': 2, 'ordering': '-recipe_count'}
+        )
+
+        expected = sorted(tags, key=lambda t: t.id, reverse=True)
+        self.assertEqual(sum(pages, []), [tag.id for tag in expected])
+        self.assertEqual(len(pages), 3)
+
+    def test_paginate_does_not_count(self):
+        """Test that no COUNT query is run to paginate"""
+        for i in range(3):
+            sample_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'page_size': 2})
+
+        self.assertEqual(len(res.data['results']), 2)
+        for query in queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        res = self.client.get(RECIPE_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_invalid_values(self):
+        """Test that a cursor with values of the wrong type is rejected"""
+        for value in ('abc', {}, None):
+            cursor = base64.urlsafe_b64encode(json.dumps(
+                {'o': ['-id'], 'v': [value]}
+            ).encode('utf-8')).decode('ascii')
+            res = self.client.get(RECIPE_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
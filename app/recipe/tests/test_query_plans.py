@@ -0,0 +1,144 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipe import views
+
+
+def view_queryset(viewset_class, user, params=None, action='list'):
+    """Return the queryset a viewset would use for a request"""
+    view = viewset_class()
+    view.action = action
+    view.request = Request(APIRequestFactory().get('/', params or {}))
+    view.request.user = user
+
+    return view.get_queryset()
+
+
+class QueryPlanTests(TestCase):
+    """Test that the get_queryset paths are served by indexes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        if connection.vendor == 'postgresql':
+            # the test tables are tiny so postgres would always pick a
+            # sequential scan, we want to know which index it would use
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        """Assert that the plan uses an index and never scans a full table"""
+        plan = queryset.explain()
+        full_scan = 'Seq Scan' if connection.vendor == 'postgresql' \
+            else 'SCAN core_'
+
+        self.assertIn(index_name, plan)
+        self.assertNotIn(full_scan, plan)
+
+    def test_tags_list_plan(self):
+        """Test listing tags uses the (user, name) index"""
+        self.assertUsesIndex(
+            view_queryset(views.TagViewSet, self.user),
+            'core_tag_user_name_idx',
+        )
+
+    def test_tags_assigned_only_plan(self):
+        """Test filtering assigned tags uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(views.TagViewSet, self.user, {'assigned_only': 1}),
+            'core_tag_user_name_idx',
+        )
+
+    def test_tags_assigned_to_recipes_plan(self):
+        """Test filtering tags used by some recipes uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.TagViewSet, self.user, {'assigned_to_recipes': '1,2'}
+            ),
+            'core_tag_user_name_idx',
+        )
+
+    def test_tags_by_recipe_count_plan(self):
+        """Test ordering tags by use uses the (user, recipe_count) index"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.TagViewSet, self.user, {'ordering': '-recipe_count'}
+            ),
+            'core_tag_user_count_idx',
+        )
+
+    def test_ingredients_list_plan(self):
+        """Test listing ingredients uses the (user, name) index"""
+        self.assertUsesIndex(
+            view_queryset(views.IngredientViewSet, self.user),
+            'core_ingredient_user_name_idx',
+        )
+
+    def test_ingredients_assigned_only_plan(self):
+        """Test filtering assigned ingredients uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.IngredientViewSet, self.user, {'assigned_only': 1}
+            ),
+            'core_ingredient_user_name_idx',
+        )
+
+    def test_recipes_list_plan(self):
+        """Test listing recipes uses the (user, id) index"""
+        self.assertUsesIndex(
+            view_queryset(views.RecipeViewSet, self.user),
+            'core_recipe_user_id_idx',
+        )
+
+    def test_recipes_filter_by_tags_plan(self):
+        """Test filtering recipes by tags uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(views.RecipeViewSet, self.user, {'tags': '1,2'}),
+            'core_recipe_user_id_idx',
+        )
+
+    def test_recipes_filter_by_ingredients_plan(self):
+        """Test filtering recipes by ingredients uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.RecipeViewSet, self.user, {'ingredients': '1,2'}
+            ),
+            'core_recipe_user_id_idx',
+        )
+
+    def test_recipes_filter_by_all_tags_plan(self):
+        """Test filtering recipes having all the tags uses indexes"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.RecipeViewSet, self.user, {'tags': '1,2', 'match': 'all'}
+            ),
+            'core_recipe_tags_tag_recipe_idx',
+        )
+
+    def test_recipes_order_by_price_plan(self):
+        """Test filtering and ordering recipes by price uses an index"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.RecipeViewSet,
+                self.user,
+                {'min_price': '1', 'ordering': 'price'},
+            ),
+            'core_recipe_user_price_idx',
+        )
+
+    def test_recipes_order_by_time_plan(self):
+        """Test filtering and ordering recipes by time uses an index"""
+        self.assertUsesIndex(
+            view_queryset(
+                views.RecipeViewSet,
+                self.user,
+                {'max_time': '20', 'ordering': '-time_minutes'},
+            ),
+            'core_recipe_user_time_idx',
+        )
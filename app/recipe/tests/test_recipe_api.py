@@ -1,16 +1,24 @@
 import tempfile # allows you to generate temporary files and you can then remove it
+import io
+import json
 import os # to create path name, check if files exists in the system
+from unittest.mock import patch
 
 from PIL import Image # PIL is a pillow requirement. this lets us create test images to upload to our API
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext # records the sql queries run inside a with block
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.images import delete_derivatives, image_formats
+from core.models import ImageBlob, ImageJob, Recipe, Tag, Ingredient
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
@@ -172,6 +180,47 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_names(self):
+        """Test creating a recipe with tags/ingredients given by name"""
+        vegan = sample_tag(user=self.user, name='Vegan')
+        dessert = sample_tag(user=self.user, name='Dessert')
+        payload = {
+            'title': 'Sorbet',
+            'time_minutes': 10,
+            'price': 3.00,
+            'tags': [dessert.id],
+            'tag_names': ['vegan', 'Summer', 'Dessert'],
+            'ingredient_names': ['Lemon'],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('tag_names', res.data)
+        summer = Tag.objects.get(user=self.user, name='Summer')
+        self.assertEqual(
+            sorted(res.data['tags']), sorted([dessert.id, vegan.id, summer.id])
+        ) # the existing ones are reused
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(
+            list(recipe.ingredients.values_list('name', flat=True)), ['Lemon']
+        )
+        summer.refresh_from_db()
+        self.assertEqual(summer.recipe_count, 1)
+
+    def test_update_recipe_names_not_ascii(self):
+        """Test a PATCH with tag_names replaces the tags, whatever the case"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        eclair = sample_tag(user=self.user, name='Éclair')
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tag_names': ['ÉCLAIR']}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.tags.all()), [eclair])
+
     def test_partial_update_recipe(self):
         """Test updating a recipe with patch"""
         recipe = sample_recipe(user=self.user)
@@ -208,6 +257,252 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_create_recipe_ids_checked_at_once(self):
+        """Test the tag/ingredient ids are checked with one query per model"""
+        tags = [sample_tag(user=self.user, name=f'tag {i}') for i in range(2)]
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'ing {i}')
+            for i in range(30)
+        ]
+        payload = {
+            'title': 'Stew',
+            'time_minutes': 60,
+            'price': 12.00,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [ingredient.id for ingredient in ingredients],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(RECIPE_URL, payload, format='json')
+        lookups = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'IN (' in query['sql'] and
+            ('"core_tag"' in query['sql'] or '"core_ingredient"' in query['sql'])
+        ]
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(lookups), 2)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.ingredients.count(), 30)
+
+    def test_create_recipe_other_users_tags_rejected(self):
+        """Test only the user's own tags/ingredients can be used"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        tag = sample_tag(user=user2)
+        payload = {
+            'title': 'Stew', 'time_minutes': 60, 'price': 12.00,
+            'tags': [tag.id, 0], 'ingredients': ['x'],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['tags']), 2) # every unknown id is reported
+        self.assertIn('ingredients', res.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_update_recipe_links_diff(self):
+        """Test updating the tags only adds/removes what changed"""
+        recipe = sample_recipe(user=self.user)
+        kept = sample_tag(user=self.user, name='Kept')
+        removed = sample_tag(user=self.user, name='Removed')
+        added = sample_tag(user=self.user, name='Added')
+        recipe.tags.add(kept, removed)
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tags': [kept.id, added.id]},
+            format='json',
+        )
+
+        self.assertEqual(sorted(res.data['tags']), sorted([kept.id, added.id]))
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)), {kept.id, added.id}
+        )
+        removed.refresh_from_db()
+        added.refresh_from_db()
+        self.assertEqual((removed.recipe_count, added.recipe_count), (0, 1))
+
+    def _assert_constant_queries(self, url_for_recipes):
+        """Assert that the queries made don't grow with the recipes returned"""
+        def add_recipes(count):
+            recipes = []
+            for i in range(count):
+                recipe = sample_recipe(user=self.user, title=f'recipe {i}')
+                name = f'{count} {i}' # the names are unique per user
+                recipe.tags.add(sample_tag(user=self.user, name=f'tag {name}'))
+                recipe.ingredients.add(
+                    sample_ingredient(user=self.user, name=f'ing {name}')
+                )
+                recipes.append(recipe)
+            return recipes
+
+        url = url_for_recipes(add_recipes(1))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        few = len(queries) # counted now, the next request resets the query log
+
+        url = url_for_recipes(add_recipes(10))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertEqual(few, len(queries))
+
+    def test_list_recipes_query_count_constant(self):
+        """Test listing recipes doesn't make a query per recipe"""
+        self._assert_constant_queries(lambda recipes: RECIPE_URL)
+
+    def test_view_recipe_detail_query_count_constant(self):
+        """Test the detail view doesn't make a query per tag/ingredient"""
+        def url_for_recipes(recipes):
+            recipe = recipes[0]
+            recipe.tags.add(*Tag.objects.filter(user=self.user))
+            recipe.ingredients.add(*Ingredient.objects.filter(user=self.user))
+            return detail_url(recipe.id)
+
+        self._assert_constant_queries(url_for_recipes)
+
+    def test_filter_recipes_by_tags_no_duplicates(self):
+        """Test a recipe matching many of the tags is returned once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_filter_recipes_by_all_tags(self):
+        """Test returning recipes that have all of the tags"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe1 = sample_recipe(user=self.user, title='both')
+        recipe1.tags.add(tag1, tag2)
+        recipe2 = sample_recipe(user=self.user, title='one')
+        recipe2.tags.add(tag1)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {'tags': f'{tag1.id},{tag2.id},{tag2.id}', 'match': 'all'}
+        )
+
+        self.assertEqual([item['id'] for item in res.data], [recipe1.id])
+
+    def test_filter_recipes_by_all_tags_and_ingredients(self):
+        """Test matching all tags and all ingredients at the same time"""
+        tag = sample_tag(user=self.user)
+        ingredient1 = sample_ingredient(user=self.user, name='Salt')
+        ingredient2 = sample_ingredient(user=self.user, name='Pepper')
+        recipe1 = sample_recipe(user=self.user, title='all of them')
+        recipe1.tags.add(tag)
+        recipe1.ingredients.add(ingredient1, ingredient2)
+        recipe2 = sample_recipe(user=self.user, title='no tag')
+        recipe2.ingredients.add(ingredient1, ingredient2)
+
+        res = self.client.get(RECIPE_URL, {
+            'tags': f'{tag.id}',
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+            'match': 'all',
+        })
+
+        self.assertEqual([item['id'] for item in res.data], [recipe1.id])
+
+    def test_filter_recipes_invalid_match(self):
+        """Test an unknown match mode is rejected"""
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_by_price_and_time(self):
+        """Test filtering recipes by a price range and a maximum time"""
+        quick = sample_recipe(user=self.user, price=5.00, time_minutes=10)
+        sample_recipe(user=self.user, price=5.00, time_minutes=60)
+        sample_recipe(user=self.user, price=1.00, time_minutes=10)
+        sample_recipe(user=self.user, price=20.00, time_minutes=10)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {'min_price': '2', 'max_price': '10.50', 'max_time': 30}
+        )
+
+        self.assertEqual([item['id'] for item in res.data], [quick.id])
+
+    def test_order_recipes_by_price(self):
+        """Test ordering recipes by price with id as the tie-breaker"""
+        cheap1 = sample_recipe(user=self.user, price=1.00)
+        expensive = sample_recipe(user=self.user, price=9.00)
+        cheap2 = sample_recipe(user=self.user, price=1.00)
+
+        res = self.client.get(RECIPE_URL, {'ordering': 'price'})
+        self.assertEqual(
+            [item['id'] for item in res.data],
+            [cheap1.id, cheap2.id, expensive.id],
+        )
+
+        res = self.client.get(RECIPE_URL, {'ordering': '-price'})
+        self.assertEqual(
+            [item['id'] for item in res.data],
+            [expensive.id, cheap2.id, cheap1.id],
+        )
+
+    def test_order_recipes_by_time_paginated(self):
+        """Test paginating recipes ordered by time"""
+        ids = [
+            sample_recipe(user=self.user, time_minutes=minutes).id
+            for minutes in (5, 30, 5, 30, 5)
+        ]
+
+        res = self.client.get(
+            RECIPE_URL, {'ordering': '-time_minutes', 'page_size': 2}
+        )
+        found = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            found += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(found, [ids[3], ids[1], ids[4], ids[2], ids[0]])
+
+    def test_invalid_ordering_and_ranges(self):
+        """Test that invalid orderings and ranges are rejected"""
+        for params in ({'ordering': 'title'}, {'min_price': 'cheap'},
+                       {'max_price': 'NaN'}, {'max_time': '1.5'}):
+            res = self.client.get(RECIPE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_recipes_sparse_fields(self):
+        """Test only the fields asked for are returned and queried"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'fields': 'id,title,price'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, [{'id': recipe.id, 'title': recipe.title, 'price': '5.00'}]
+        )
+        self.assertEqual(len(queries), 2) # the change version and the recipes, no tag/ingredient prefetch
+        self.assertNotIn('"link"', queries[1]['sql'])
+
+    def test_view_recipe_detail_sparse_fields(self):
+        """Test nested fields are kept whole when picking detail fields"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+
+        res = self.client.get(detail_url(recipe.id), {'fields': 'tags'})
+
+        self.assertEqual(res.data, {'tags': [{'id': tag.id, 'name': tag.name}]})
+
+    def test_sparse_fields_unknown_field(self):
+        """Test asking for a field that doesn't exist is rejected"""
+        res = self.client.get(RECIPE_URL, {'fields': 'id,owner'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -221,8 +516,24 @@ class RecipeImageUploadTests(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self): # runs after all the tests. we use this to clean-up our system after our tests by removing all tests files
+        self.recipe.refresh_from_db()
+        delete_derivatives(self.recipe.images)
         self.recipe.image.delete()
 
+    def _upload(self, size, process = True, color = (200, 100, 50)):
+        """Upload a JPEG image of a size to the recipe"""
+        with tempfile.NamedTemporaryFile(suffix = '.jpg') as ntf:
+            Image.new('RGB', size, color).save(ntf, format = 'JPEG')
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id), {'image': ntf},
+                format = 'multipart',
+            )
+        if process: # what the image_worker does in the background
+            call_command('image_worker', processes = 0, once = True, stdout = io.StringIO())
+
+        return res
+
     def test_upload_image_to_recipe(self):
         """Test uploading an image to recipe"""
         url = image_upload_url(self.recipe.id)
@@ -245,6 +556,105 @@ class RecipeImageUploadTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_upload_image_is_processed_later(self):
+        """Test the upload only stores the image and queues its processing"""
+        res = self._upload((300, 200), process = False)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_status'], 'processing')
+        self.assertEqual(res.data['images'], {})
+        self.recipe.refresh_from_db()
+        job = ImageJob.objects.get(recipe = self.recipe)
+        self.assertEqual(job.image, self.recipe.image.name)
+
+    @override_settings(RECIPE_IMAGE_SIZES = (128, 512, 1024))
+    def test_upload_image_makes_resized_copies(self):
+        """Test the image is saved again at every size and format"""
+        self._upload((2000, 1000))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['image_status'], 'ready')
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(set(res.data['images']), {'128', '512', '1024'})
+        for size, urls in res.data['images'].items():
+            self.assertEqual(set(urls), set(image_formats()))
+            for fmt, url in urls.items():
+                self.assertTrue(url.startswith('http://testserver/media/'))
+                path = os.path.join(
+                    settings.MEDIA_ROOT, url.split('/media/', 1)[1],
+                )
+                with Image.open(path) as img:
+                    self.assertEqual(img.format, fmt.upper())
+                    self.assertEqual(img.size, (int(size), int(size) // 2)) # the aspect ratio is kept
+
+    @override_settings(RECIPE_IMAGE_SIZES = (128, 512))
+    def test_upload_small_image_is_not_enlarged(self):
+        """Test the copies of a small image keep its size"""
+        self._upload((100, 60))
+
+        self.recipe.refresh_from_db()
+        names = json.loads(self.recipe.images)
+        for size in ('128', '512'):
+            with Image.open(
+                os.path.join(settings.MEDIA_ROOT, names[size]['jpeg'])
+            ) as img:
+                self.assertEqual(img.size, (100, 60))
+
+    @patch('django.db.transaction.on_commit', lambda func: func()) # the test transaction never commits
+    def test_upload_image_replaces_resized_copies(self):
+        """Test uploading another image deletes the first with its copies"""
+        self._upload((300, 300))
+        self.recipe.refresh_from_db()
+        first = json.loads(self.recipe.images)
+        first_image = self.recipe.image.path
+
+        self._upload((300, 300), color = (0, 0, 255))
+
+        self.assertFalse(os.path.exists(first_image))
+        for names in first.values():
+            for name in names.values():
+                self.assertFalse(
+                    os.path.exists(os.path.join(settings.MEDIA_ROOT, name))
+                )
+
+    def test_same_image_stored_once(self):
+        """Test recipes with the same photo share its file"""
+        other = sample_recipe(user = self.user, title = 'Other')
+        self._upload((200, 100))
+        self.recipe.refresh_from_db()
+        self.recipe, first = other, self.recipe # upload the same photo to the other recipe
+
+        self._upload((200, 100))
+
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, first.image.name)
+        self.assertRegex(
+            other.image.name, r'^uploads/recipe/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$',
+        )
+        self.assertEqual(ImageBlob.objects.get(name = other.image.name).refs, 2)
+        self.assertEqual(other.images, first.images) # the copies are shared too
+        self.recipe = first # cleaned up by tearDown
+
+    def test_recipe_images_in_detail_and_list(self):
+        """Test the detail has the images, the list only when asked"""
+        self._upload((600, 400))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(set(res.data['images']), {
+            str(size) for size in settings.RECIPE_IMAGE_SIZES
+        })
+
+        res = self.client.get(RECIPE_URL)
+        self.assertNotIn('images', res.data[0])
+
+        res = self.client.get(RECIPE_URL, {'fields': 'id,images'})
+        self.assertEqual(set(res.data[0]), {'id', 'images'})
+        self.assertEqual(
+            res.data[0]['images'], self.client.get(
+                detail_url(self.recipe.id)
+            ).data['images'],
+        )
+
     def test_filter_recipes_by_tags(self):
         """Test returning recipes with specific tags"""
         recipe1 = sample_recipe(user=self.user, title='Vegetable Curry')
@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test the full-text search of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, text, **params):
+        """Search the recipes and return the ids found"""
+        res = self.client.get(RECIPE_URL, dict(params, search=text))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [item['id'] for item in res.data]
+
+    def test_search_by_title(self):
+        """Test searching recipes by the words of their title"""
+        curry = sample_recipe(user=self.user, title='Red Thai curry')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('thai curries'), [curry.id])
+
+    def test_search_limited_to_user(self):
+        """Test searching only returns the user's recipes"""
+        user2 = get_user_model().objects.create_user(
+            email = 'test2@gmail.com',
+            password = '123456',
+        )
+        sample_recipe(user=user2, title='Curry')
+
+        self.assertEqual(self._search('curry'), [])
+
+    def test_search_by_tag_and_ingredient_names(self):
+        """Test searching recipes by the names of their tags/ingredients"""
+        recipe = sample_recipe(user=self.user, title='Dinner')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Tofu')
+        )
+
+        self.assertEqual(self._search('vegan tofu'), [recipe.id])
+
+    def test_search_ranks_title_first(self):
+        """Test that title matches rank above tag matches"""
+        tagged = sample_recipe(user=self.user, title='Dinner')
+        tagged.tags.add(Tag.objects.create(user=self.user, name='Curry'))
+        titled = sample_recipe(user=self.user, title='Curry')
+
+        self.assertEqual(self._search('curry'), [titled.id, tagged.id])
+
+    def test_search_index_follows_changes(self):
+        """Test renaming tags and titles updates the search index"""
+        recipe = sample_recipe(user=self.user, title='Dinner')
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        recipe.tags.add(tag)
+        tag.name = 'Mild'
+        tag.save()
+        recipe.title = 'Supper'
+        recipe.save()
+
+        self.assertEqual(self._search('spicy'), [])
+        self.assertEqual(self._search('dinner'), [])
+        self.assertEqual(self._search('mild supper'), [recipe.id])
+
+        recipe.tags.clear()
+        self.assertEqual(self._search('mild'), [])
+
+    def test_search_with_pagination(self):
+        """Test paginating search results"""
+        ids = [
+            sample_recipe(user=self.user, title='Curry').id
+            for i in range(3)
+        ]
+
+        res = self.client.get(RECIPE_URL, {'search': 'curry', 'page_size': 2})
+        found = [item['id'] for item in res.data['results']]
+        res = self.client.get(res.data['next'])
+        found += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(found, ids[::-1])
+        self.assertIsNone(res.data['next'])
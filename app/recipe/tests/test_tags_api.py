@@ -1,15 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag, Recipe
+from core.models import Tag, Ingredient, Recipe
 
 from recipe.serializers import TagSerializer
 
 
+BULK_URL = reverse('recipe:tag-bulk-create')
 TAGS_URL = reverse('recipe:tag-list') # -list is included here since we are using a viewset (not APIView) which uses a router that automatically appends the action name to the url
 
 
@@ -84,6 +87,78 @@ class PrivateTagsApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_tag_duplicate_name(self):
+        """Test a name the user already has is rejected, whatever the case"""
+        Tag.objects.create(user = self.user, name = 'Vegan')
+        other = get_user_model().objects.create_user('other@gmail.com', '123456')
+        Tag.objects.create(user = other, name = 'Dessert')
+
+        res = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+        created = self.client.post(TAGS_URL, {'name': 'dessert'}) # another user's name is fine
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user = self.user).count(), 2)
+
+    def test_bulk_get_or_create_tags(self):
+        """Test getting many tags by name creates the missing ones at once"""
+        vegan = Tag.objects.create(user = self.user, name = 'Vegan')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                BULK_URL,
+                {'names': ['Dessert', 'vegan', 'Quick', 'dessert']},
+                format = 'json',
+            )
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "core_tag"')
+        ]
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['Dessert', 'Vegan', 'Quick']
+        ) # in the order sent, once each, as stored
+        self.assertEqual(res.data[1]['id'], vegan.id)
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Tag.objects.filter(user = self.user).count(), 3)
+
+        again = self.client.post(
+            BULK_URL, {'names': ['quick', 'VEGAN']}, format = 'json',
+        )
+
+        self.assertEqual(again.status_code, status.HTTP_200_OK) # nothing created
+        self.assertEqual(
+            [tag['id'] for tag in again.data],
+            [res.data[2]['id'], vegan.id],
+        )
+
+    def test_bulk_get_or_create_tags_not_ascii(self):
+        """Test names are matched by the same lower() as the unique index"""
+        eclair = Tag.objects.create(user = self.user, name = 'Éclair')
+
+        res = self.client.post(BULK_URL, {'names': ['ÉCLAIR']}, format = 'json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': eclair.id, 'name': 'Éclair'}])
+
+    def test_bulk_get_or_create_tags_invalid(self):
+        """Test empty lists and names are rejected"""
+        for payload in ({'names': []}, {'names': ['']}, ['Vegan']):
+            res = self.client.post(BULK_URL, payload, format = 'json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_retrieve_tags_sparse_fields(self):
+        """Test retrieving only the names of the tags"""
+        Tag.objects.create(user = self.user, name = 'Vegan')
+
+        res = self.client.get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(res.data, [{'name': 'Vegan'}])
+
     def test_retrieve_tags_assigned_to_recipes(self):
         """Test filtering tags by those assigned to recipes"""
         tag1 = Tag.objects.create(user=self.user, name='Breakfast')
@@ -125,3 +200,103 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1}) # assigned only is the name of our filter, if you assign it to 1, it will evaluate to True, and it will filter by tags/ingredients assigned only
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_assigned_to_given_recipes(self):
+        """Test filtering tags by those used by some recipes"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        Tag.objects.create(user=self.user, name='Dinner')
+        recipe1 = Recipe.objects.create(
+            user=self.user, title='eggs', time_minutes=5, price=2.00,
+        )
+        recipe2 = Recipe.objects.create(
+            user=self.user, title='soup', time_minutes=30, price=4.00,
+        )
+        recipe1.tags.add(tag1, tag2)
+        recipe2.tags.add(tag2)
+
+        res = self.client.get(TAGS_URL, {'assigned_to_recipes': recipe2.id})
+        both = self.client.get(
+            TAGS_URL, {'assigned_to_recipes': f'{recipe1.id},{recipe2.id}'}
+        )
+
+        self.assertEqual([tag['id'] for tag in res.data], [tag2.id])
+        self.assertEqual(
+            [tag['id'] for tag in both.data], [tag2.id, tag1.id] # by name, descending
+        )
+
+    def test_retrieve_tags_assigned_to_invalid_recipes(self):
+        """Test invalid recipe ids are rejected"""
+        res = self.client.get(TAGS_URL, {'assigned_to_recipes': '1,soup'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_tags_assigned_only_invalid(self):
+        """Test an assigned_only that isn't 0 or 1 is rejected"""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _recipe(self, title='recipe'):
+        return Recipe.objects.create(
+            user=self.user, title=title, time_minutes=5, price=2.00,
+        )
+
+    def test_recipe_count_optional(self):
+        """Test recipe_count is only returned when asked for"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self._recipe().tags.add(tag)
+
+        res = self.client.get(TAGS_URL)
+        counted = self.client.get(TAGS_URL, {'fields': 'id,recipe_count'})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Vegan'}])
+        self.assertEqual(counted.data, [{'id': tag.id, 'recipe_count': 1}])
+
+    def test_order_tags_by_recipe_count(self):
+        """Test ordering the tags from the most used"""
+        rare = Tag.objects.create(user=self.user, name='Rare')
+        common = Tag.objects.create(user=self.user, name='Common')
+        unused = Tag.objects.create(user=self.user, name='Unused')
+        for i in range(2):
+            self._recipe().tags.add(common)
+        self._recipe().tags.add(rare, common)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-recipe_count'})
+        bad = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(
+            [tag['id'] for tag in res.data], [common.id, rare.id, unused.id]
+        )
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_counts_follow_changes(self):
+        """Test the counts follow links, clears and deleted recipes"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        recipe1, recipe2 = self._recipe(), self._recipe()
+
+        def counts():
+            tag.refresh_from_db()
+            ingredient.refresh_from_db()
+            return tag.recipe_count, ingredient.recipe_count
+
+        recipe1.tags.add(tag)
+        recipe1.ingredients.add(ingredient)
+        tag.recipe_set.add(recipe2) # from the tag side
+        self.assertEqual(counts(), (2, 1))
+
+        tag.name = 'Vegetarian' # saving a tag keeps its count
+        stale = Ingredient.objects.get(id=ingredient.id)
+        recipe2.ingredients.add(ingredient)
+        stale.save()
+        self.assertEqual(counts(), (2, 2))
+
+        recipe1.tags.remove(tag)
+        recipe1.tags.remove(tag) # not linked anymore, not uncounted again
+        recipe2.ingredients.clear()
+        self.assertEqual(counts(), (1, 1))
+
+        tag.recipe_set.clear()
+        recipe1.delete()
+        self.assertEqual(counts(), (0, 0))
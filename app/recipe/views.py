@@ -1,36 +1,170 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch # Prefetch lets us customize the queryset used to prefetch related objects
+from django.http import FileResponse, Http404, HttpResponseNotModified, \
+                        StreamingHttpResponse
+from django.utils import timezone
+
 from rest_framework.decorators import action # used to add custom actions to viewsets
 from rest_framework.response import Response
 
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PrimaryKeyRelatedField
 
+from core import blobs, search, thumbnails
+from core.authentication import CachedTokenAuthentication, \
+                                SignedTokenAuthentication
+from core.changes import bulk_recipes_changed
+from core.images import image_formats
 from core.models import Tag, Ingredient, Recipe
+from core.names import get_or_create_by_name
 from . import serializers
+from .bulk import LINK_FIELDS, delete_recipes, insert_recipes, \
+                   matched_recipes, unlinked_counts
+from .export import export_recipes
+from .fast import FastRepresentation
+from .mixins import CachedListMixin, ConditionalListMixin, \
+                    ConditionalRetrieveMixin, FastListMixin, \
+                    SparseFieldsViewMixin
+from .pagination import KeysetPagination
+
+
+def requested_ordering(request, ordering_fields):
+    """Return the ordering asked for with ?ordering=, None if there's none"""
+    ordering = request.query_params.get('ordering')
+    if not ordering:
+        return None
+    field = ordering.lstrip('-')
+    if field not in ordering_fields:
+        raise ValidationError({'ordering': [
+            f'Must be one of: {", ".join(ordering_fields)} '
+            '(prefixed with - for descending order).'
+        ]})
+    if field == 'id':
+        return (ordering,)
+    # id breaks the ties in the same direction so the order is stable (and
+    # matches the (user, field, id) indexes)
+    return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+
+def requested_ids(request, name):
+    """Convert a comma separated query param to ids, None if not given"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return [int(str_id) for str_id in value.split(',')] # '1,2,3' to ['1','2','3'] to [1,2,3]
+    except ValueError:
+        raise ValidationError({name: [
+            'Must be a comma separated list of ids.'
+        ]}) # a 400 response, not a 500
+
+
+def requested_flag(request, name):
+    """Convert a 0/1 query param to a bool, False if not given"""
+    value = request.query_params.get(name)
+    if not value:
+        return False
+    try:
+        return bool(int(value))
+    except ValueError:
+        raise ValidationError({name: ['Must be 0 or 1.']})
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ConditionalListMixin, # checked first, so a 304 skips the fast list too
+                            CachedListMixin,
+                            FastListMixin,
+                            SparseFieldsViewMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin): # allows list & create actions (functions)
     """Base Viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,
+                              SignedTokenAuthentication)
     permission_classes = (IsAuthenticated,) # this requires that token authentication is used
+    pagination_class = KeysetPagination
+    ordering = ('-name', '-id') # id is the tie-breaker for objects with the same name so the order (and the pages) are stable
+
+    ordering_fields = ('name', 'recipe_count') # ?ordering=-recipe_count gives the most used first
+
+    def get_ordering(self):
+        """Return the fields used to order (and paginate) the objects"""
+        return requested_ordering(self.request, self.ordering_fields) or \
+            self.ordering
 
     def get_queryset(self): # to filter objects by user currently authenticated. it overrides the default method. when the list function is called from a url, it will call this method to retrieve the objects in the queryset variable (all objects), so we need to filter that to limit it to the authenticated user only (without this our test that makes sure that the tags returned are for the authenticated user only fails)
         """Return objects for the current authenticated user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0)) # if assigned_only does not return a value, it will be None, which cannot be converted to int, so we need to set a default value for it
-        )
+        assigned_only = requested_flag(self.request, 'assigned_only') # ?assigned_only=1
+        recipe_ids = requested_ids(self.request, 'assigned_to_recipes')
         queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull = False) # this will add a filter to eliminate tag/ingredients not assigned to recipes. but if there is duplicates (same tag assigned to two recipes) it will return it twice, so we used distinct() function at the end
+        fields = self.get_requested_fields()
+        if fields is not None:
+            queryset = queryset.only(*self.get_only_fields(fields))
+        if assigned_only or recipe_ids is not None:
+            queryset = self._filter_assigned(queryset, recipe_ids)
         return queryset.filter(
             user = self.request.user
-        ).order_by('-name').distinct() # make sure that the queryset returned is unique
+        ).order_by(*self.get_ordering())
+
+    def _filter_assigned(self, queryset, recipe_ids = None):
+        """Keep the objects assigned to recipes (to some recipes if given)"""
+        # both are semi-joins, an object is returned once however many
+        # recipes use it. joining the recipes returned it once per recipe,
+        # then every row had to be sorted to drop the duplicates with DISTINCT
+        field = queryset.model._meta.get_field('recipe').field # Recipe.tags / Recipe.ingredients
+        column = field.m2m_reverse_name() # tag_id / ingredient_id
+        links = field.remote_field.through.objects.all()
+        if recipe_ids is not None:
+            # start from the links of the given recipes (the (recipe_id,
+            # tag_id) unique index), a few rows, instead of probing every
+            # object's links for the ids
+            return queryset.filter(pk__in = links.filter(
+                recipe_id__in = recipe_ids,
+            ).values(column))
+
+        # a correlated EXISTS on the through table (served by its
+        # (tag_id, recipe_id) index) stops at the first link it finds
+        links = links.filter(**{column: OuterRef('pk')})
+        return queryset.annotate(assigned = Exists(links)).filter(
+            assigned = True
+        ) # django 2.1 can't filter on Exists directly, it has to be annotated first
 
     def perform_create(self, serializer): # to assign the tag to the authorized user. when we create an object, this function is called and the serializer is passed in
         """Create a new object for the authenticated user"""
-        serializer.save(user = self.request.user)
+        try:
+            with transaction.atomic(): # a savepoint, the request's transaction goes on after a failed insert
+                serializer.save(user = self.request.user)
+        except IntegrityError: # created by another request since the name was validated
+            raise ValidationError({'name': [
+                f'You already have a {self.queryset.model._meta.verbose_name} '
+                f'named "{serializer.validated_data["name"]}".'
+            ]})
+
+    @action(methods = ['POST'], detail = False, url_path = 'bulk')
+    def bulk_create(self, request):
+        """Return the ids of many names, creating the ones that are missing"""
+        # replaces a list then create round trip per name, the missing ones
+        # are created with one INSERT ... ON CONFLICT DO NOTHING
+        serializer = serializers.BulkNamesSerializer(data = request.data)
+        serializer.is_valid(raise_exception = True)
+        found, created = get_or_create_by_name(
+            self.queryset.model,
+            request.user.pk,
+            serializer.validated_data['names'],
+        )
+
+        return Response(
+            [
+                {'id': pk, 'name': name}
+                for pk, name in OrderedDict(found.values()).items()
+            ], # two spellings of a name are the same one
+            status = status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -45,30 +179,154 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet): # we used modelviewset because we want to use all functionality (not just list and create)
+class RecipeViewSet(ConditionalListMixin, ConditionalRetrieveMixin,
+                    CachedListMixin, FastListMixin, SparseFieldsViewMixin,
+                    viewsets.ModelViewSet): # we used modelviewset because we want to use all functionality (not just list and create)
     """Manage recipes in the database"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,
+                              SignedTokenAuthentication)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-id',) # newest recipes first
+    ordering_fields = ('id', 'price', 'time_minutes') # the fields clients can order by with ?ordering=
+    bulk_max_size = 5000 # recipes per bulk create
+    bulk_batch_size = 500 # rows per INSERT, sqlite can't take many more
+    export_chunk_size = 1000 # recipes read per round trip by the export
+    bulk_filters = (
+        'ids', 'tags', 'ingredients', 'min_price', 'max_price', 'max_time',
+        'search',
+    ) # one of them (or all=1) is needed to update/delete in bulk
+
+    def get_ordering(self):
+        """Return the fields used to order (and paginate) the recipes"""
+        ordering = requested_ordering(self.request, self.ordering_fields)
+        if ordering:
+            return ordering
+        if self._get_search():
+            return ('-search_rank', '-id') # best matches first
+        return self.ordering
 
-    def _params_to_ints(self, qs): # _ before the name of the function is a common convention for functions intended to be private (we can but wont use it outside this class)
-        """Convert a string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')] # '1,2,3' to ['1','2','3'] to [1,2,3]
+    def _get_search(self):
+        """Return the full-text search requested (if any)"""
+        return self.request.query_params.get('search', '').strip()
+
+    def _param_to_number(self, name, cast):
+        """Convert a query param to a number, None if it is not provided"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            number = cast(value)
+        except (ValueError, ArithmeticError): # Decimal raises InvalidOperation (an ArithmeticError) for invalid input
+            number = None
+        if number is None or not Decimal(number).is_finite(): # rejects 'NaN' and 'Infinity' too
+            raise ValidationError({name: ['A valid number is required.']})
+
+        return number
 
     def get_queryset(self):
         """Retrieve the recipe for the authenticated user only"""
-        tags = self.request.query_params.get('tags') # if we have provided tags as a query string it will be assigned to tags variable, if not this will return None. query_params is a method for request object, which is a dictionary containing all of the query params provided in the request(check tests requests for ref)
-        ingredients = self.request.query_params.get('ingredients') # request.query_params is similar to request.GET but is better to be used
-        queryset = self.queryset #we create this variable to apply the filters to it and return it
-        if tags:
-            tag_ids = self._params_to_ints(tags) # convert to list of ids
-            queryset = queryset.filter(tags__id__in=tag_ids) # django syntax for filtering on foreign key objects. so we have tags field in our recipe queryset, which has a foreinkey to the tags table which has an id, so if u wanna filter by the id in the remote table(Tag) u use '__id'. then 2 more underscores to apply the function 'in'
-        if ingredients:
-            ing_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ing_ids)
-
-        return queryset.filter(user = self.request.user)
+        queryset = self._filter_recipes(self.queryset)
+        queryset = queryset.order_by(*self.get_ordering())
+        fields = self.get_requested_fields()
+        if fields is not None: # only load the columns of the fields asked for
+            queryset = queryset.only(*self.get_only_fields(fields))
+
+        return queryset.prefetch_related(*self._get_prefetches(fields))
+
+    def _filter_recipes(self, queryset):
+        """Apply the user and the filters of the query params to recipes"""
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': ['Must be "any" or "all".']}) # returns a 400 response
+        tag_ids = requested_ids(self.request, 'tags') # if we have provided tags as a query string they are converted to a list of ids, if not this will return None. query_params is a method for request object, which is a dictionary containing all of the query params provided in the request(check tests requests for ref)
+        ing_ids = requested_ids(self.request, 'ingredients')
+        ids = requested_ids(self.request, 'ids') # ?ids=1,2,3
+        if ids is not None:
+            queryset = queryset.filter(id__in = ids)
+        if tag_ids is not None:
+            queryset = self._filter_related(queryset, 'tags', tag_ids, match)
+        if ing_ids is not None:
+            queryset = self._filter_related(
+                queryset, 'ingredients', ing_ids, match
+            )
+
+        queryset = queryset.filter(user = self.request.user)
+        # range filters, served by the (user, price) and (user, time_minutes)
+        # indexes
+        min_price = self._param_to_number('min_price', Decimal)
+        max_price = self._param_to_number('max_price', Decimal)
+        max_time = self._param_to_number('max_time', int)
+        if min_price is not None:
+            queryset = queryset.filter(price__gte = min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte = max_price)
+        if max_time is not None:
+            queryset = queryset.filter(time_minutes__lte = max_time)
+        text = self._get_search()
+        if text:
+            queryset = search.search_recipes(queryset, text) # ranked search over the title, tag names and ingredient names
+
+        return queryset
+
+    def _filter_related(self, queryset, field_name, ids, match):
+        """Filter recipes linked to any/all of the ids of an M2M field"""
+        # joining the through table (tags__id__in) returns a recipe once for
+        # every matching tag, so instead we look the links up in subqueries
+        # against the through table and never get duplicate rows
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through # the auto-created table linking recipes and tags/ingredients
+        target = field.m2m_reverse_name() # the column pointing to the tag/ingredient (tag_id)
+        ids = set(ids)
+        links = through.objects.filter(**{f'{target}__in': ids})
+        if match == 'all':
+            # recipes linked to as many of the ids as were asked for
+            # (GROUP BY recipe_id HAVING COUNT(tag_id) = n)
+            matching = links.values('recipe_id').annotate(
+                matched = Count(target),
+            ).filter(matched = len(ids)).values('recipe_id')
+            return queryset.filter(id__in = matching)
+
+        # any: EXISTS (a link to one of the ids), a semi-join that stops at
+        # the first link it finds
+        annotation = f'has_{field_name}'
+        return queryset.annotate(**{
+            annotation: Exists(links.filter(recipe_id = OuterRef('pk'))),
+        }).filter(**{annotation: True})
+
+    def _get_prefetches(self, fields = None):
+        """Return the M2M prefetches needed by the current action"""
+        # without prefetching, the serializer runs one query per recipe for its
+        # tags and another one for its ingredients (N+1 queries). prefetching
+        # loads all of them in one extra query per relation, no matter how many
+        # recipes are returned
+        if self.action in ('upload_image', 'image'): # uploading/reading an image does not serialize the related objects
+            return ()
+        if self.action == 'retrieve': # the detail serializer nests the tags and ingredients so it needs their names too
+            tag_fields = ingredient_fields = ('id', 'name')
+        else: # the list serializer only shows the primary keys
+            tag_fields = ingredient_fields = ('id',)
+
+        # ordered by id so the lists are always in the same order (the same
+        # as the fast list representation)
+        prefetches = (
+            Prefetch(
+                'tags',
+                queryset = Tag.objects.only(*tag_fields).order_by('id'),
+            ),
+            Prefetch(
+                'ingredients',
+                queryset = Ingredient.objects.only(*ingredient_fields)
+                .order_by('id'),
+            ),
+        )
+        # skip the relations the client didn't ask for
+        return tuple(
+            prefetch for prefetch in prefetches
+            if fields is None or prefetch.prefetch_to in fields
+        )
 
     def get_serializer_class(self): # This is the function thats called to retrieve the serializer class for a request. we override it to change the serializer class for the different actions available in the viewset
         """Return appropriate serializer class"""
@@ -84,6 +342,215 @@ class RecipeViewSet(viewsets.ModelViewSet): # we used modelviewset because we wa
         serializer.save(user = self.request.user)
 
     # the above methods are all default methods that we are overriding, unlike the custom action we define below
+    @action(methods = ['POST', 'PATCH', 'DELETE'], detail = False) # detail=False, it works on the collection
+    def bulk(self, request):
+        """Create, update or delete many recipes in one request"""
+        if request.method == 'POST':
+            return self.bulk_create(request)
+        # updates and deletes act on the recipes the filters of the list
+        # match, which have to be given, /bulk/ alone is rejected
+        filtered = any(
+            request.query_params.get(name) for name in self.bulk_filters
+        ) # an empty ?tags= filters nothing
+        if not filtered and request.query_params.get('all') != '1':
+            raise ValidationError({'non_field_errors': [
+                'Filter the recipes (' + ', '.join(self.bulk_filters) +
+                ') or pass all=1.'
+            ]})
+        queryset = self._filter_recipes(self.queryset).order_by()
+        if request.method == 'PATCH':
+            return self.bulk_update(request, queryset)
+        return self.bulk_destroy(request, queryset)
+
+    def bulk_create(self, request):
+        """Create many recipes at once, all of them or none"""
+        items = request.data
+        if not isinstance(items, list) or not items or \
+                len(items) > self.bulk_max_size:
+            raise ValidationError({'non_field_errors': [
+                f'Expected a list of 1 to {self.bulk_max_size} recipes.'
+            ]})
+        serializer = serializers.RecipeBulkSerializer(data = items, many = True)
+        valid = serializer.is_valid()
+        errors = serializer.errors if not valid else [{} for item in items] # one dict of errors per recipe, in the order they were sent
+        if valid:
+            valid = self._check_bulk_ids(serializer.validated_data, errors)
+        if not valid:
+            return Response(errors, status = status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            ids = self._bulk_insert(serializer.validated_data)
+        fast = FastRepresentation.compile(serializers.RecipeSerializer())
+        data = fast.represent(fast.rows(
+            Recipe.objects.filter(id__in = ids).order_by('id')
+        )) # ids grow in the order the recipes were sent
+
+        return Response(data, status = status.HTTP_201_CREATED)
+
+    def _check_bulk_ids(self, recipes, errors):
+        """Check the tag/ingredient ids of all the recipes with one query each"""
+        valid = True
+        for field_name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            wanted = {pk for recipe in recipes for pk in recipe[field_name]}
+            found = set(
+                model.objects.filter(user = self.request.user, id__in = wanted)
+                .values_list('id', flat = True)
+            ) # only the user's own tags and ingredients can be used
+            message = PrimaryKeyRelatedField.default_error_messages[
+                'does_not_exist'
+            ]
+            for recipe, recipe_errors in zip(recipes, errors):
+                unknown = [pk for pk in recipe[field_name] if pk not in found]
+                if unknown:
+                    valid = False
+                    recipe_errors[field_name] = [
+                        message.format(pk_value = pk) for pk in unknown
+                    ]
+
+        return valid
+
+    def _bulk_insert(self, recipes):
+        """Insert validated recipes with their links, return their ids"""
+        user = self.request.user
+        self._resolve_bulk_names(recipes)
+        ids, linked = insert_recipes(user, recipes, self.bulk_batch_size)
+        bulk_recipes_changed(
+            ids, [user.pk], linked['tags'], linked['ingredients']
+        )
+
+        return ids
+
+    def _resolve_bulk_names(self, recipes):
+        """Add the tags/ingredients given by name to the ids of the recipes"""
+        # the names of all the recipes are looked up (and the missing ones
+        # created) at once, one get-or-create per model
+        for field_name, names_field in \
+                serializers.RecipeSerializer.name_fields.items():
+            recipe_names = [recipe.pop(names_field, ()) for recipe in recipes]
+            names = [name for given in recipe_names for name in given]
+            if not names:
+                continue
+            model = Recipe._meta.get_field(field_name).related_model
+            found = get_or_create_by_name(model, self.request.user.pk, names)[0]
+            for recipe, given in zip(recipes, recipe_names):
+                recipe[field_name] = list(recipe[field_name]) + [
+                    found[name][0] for name in given
+                ]
+
+    def bulk_update(self, request, queryset):
+        """Set the same values on every recipe matched"""
+        serializer = serializers.RecipeBulkUpdateSerializer(
+            data = request.data, partial = True,
+        )
+        serializer.is_valid(raise_exception = True)
+        values = serializer.validated_data
+        if not values:
+            raise ValidationError({'non_field_errors': [
+                'Give at least one of: ' +
+                ', '.join(serializer.Meta.fields) + '.'
+            ]})
+
+        with transaction.atomic(), matched_recipes(queryset) as recipes:
+            updated = recipes.update(
+                updated_at = timezone.now(), # update() doesn't run auto_now
+                **values
+            )
+            bulk_recipes_changed(
+                recipes if 'title' in values else (), # the title is indexed
+                [request.user.pk] if updated else (),
+            )
+
+        return Response({'updated': updated}, status = status.HTTP_200_OK)
+
+    def bulk_destroy(self, request, queryset):
+        """Delete every recipe matched, with its links"""
+        # one statement per table for all the recipes, and the signal
+        # handlers' work done once for the batch (see recipe.bulk)
+        with transaction.atomic(), matched_recipes(queryset) as recipes:
+            changes = {
+                field_name: unlinked_counts(recipes, field_name)
+                for field_name in LINK_FIELDS
+            }
+            images = list(
+                recipes.exclude(image = '').exclude(image = None)
+                .values_list('image', 'images').annotate(count = Count('*'))
+                .order_by()
+            ) # one row per image, however many recipes share it
+            search.remove_from_search_index(recipes)
+            deleted = delete_recipes(recipes)
+            blobs.release_recipes(images)
+            bulk_recipes_changed(
+                (), [request.user.pk] if deleted['recipes'] else (),
+                changes['tags'], changes['ingredients'],
+            )
+
+        return Response({'deleted': {
+            name: deleted[name] for name in ('recipes',) + LINK_FIELDS
+        }}, status = status.HTTP_200_OK)
+
+    @action(methods = ['GET'], detail = False)
+    def export(self, request):
+        """Stream all the recipes of the user as newline-delimited JSON"""
+        # for backups of big accounts, the list serializes the whole page in
+        # memory while this writes the recipes as they are read
+        response = StreamingHttpResponse(
+            export_recipes(request.user.pk, self.export_chunk_size),
+            content_type = 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="recipes.ndjson"'
+
+        return response
+
+    @action(methods = ['GET'], detail = True)
+    def image(self, request, pk=None):
+        """Return the image of a recipe resized to ?w= and/or ?h="""
+        recipe = self.get_object()
+        if not recipe.image:
+            raise Http404
+        width = self._param_to_size('w')
+        height = self._param_to_size('h')
+        if not width and not height:
+            raise ValidationError({'w': ['Give w, h or both.']})
+        fmt = request.query_params.get('fmt', 'jpeg')
+        if fmt not in image_formats():
+            raise ValidationError({'fmt': [
+                f'Must be one of: {", ".join(image_formats())}.'
+            ]})
+
+        name = recipe.image.name
+        etag = f'"{thumbnails.cache_key(name, width, height, fmt)}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            try:
+                file = thumbnails.open_resized(name, width, height, fmt)
+            except FileNotFoundError: # the original is gone
+                raise Http404
+            response = FileResponse(file, content_type = f'image/{fmt}')
+        response['ETag'] = etag
+        # ?v= (image_version of the recipe) changes with the image, so the
+        # urls holding the current one can be cached for good. private, the
+        # same url is a 404 for the other users
+        if request.query_params.get('v') == \
+                thumbnails.image_version(name):
+            response['Cache-Control'] = \
+                'private, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'private, no-cache'
+
+        return response
+
+    def _param_to_size(self, name):
+        """Convert a width/height query param to pixels, None if not given"""
+        size = self._param_to_number(name, int)
+        if size is not None and not 0 < size <= settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError({name: [
+                f'Must be between 1 and {settings.RECIPE_IMAGE_MAX_SIZE}.'
+            ]})
+
+        return size
+
     @action(methods = ['POST'], detail = True, url_path = 'upload-image') # detail=true is used to make the action intended for a single object(true) or a collection(false). so here we need to use the pk in url for detailed view
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
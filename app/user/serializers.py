@@ -22,6 +22,7 @@ class UserSerializer(serializers.ModelSerializer): # since we are basing our ser
 
         if password:
             user.set_password(password)
+            user.token_version += 1 # the signed tokens issued with the old password stop working
             user.save()
 
         return user
@@ -1,12 +1,19 @@
-from django.test import TestCase
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse # to generate our api urls
 
 from rest_framework.test import APIClient # test client used to make requests to our api and get the response
 from rest_framework import status # to generate status codes
 
+from core.authentication import create_signed_token, read_signed_token
+
 CREATE_USER_URL = reverse('user:create') # since we will use it a lot. this will create the user create url
 TOKEN_URL = reverse('user:token')
+REFRESH_TOKEN_URL = reverse('user:token-refresh')
 ME_URL = reverse('user:me') # the account of the user whos authenticated
 
 def create_user(**params): # (**params) is a dynamic list of args, it can take as much args as we want, which are passed directly to create_user model so we have a lot of flexibility
@@ -146,3 +153,103 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenApiTests(TestCase):
+    """Test the signed tokens"""
+
+    def setUp(self):
+        self.user = create_user(
+            email = 'test@gmail.com',
+            password = '123456',
+            name = 'name',
+        )
+        self.client = APIClient()
+        res = self.client.post(
+            TOKEN_URL, {'email': 'test@gmail.com', 'password': '123456'}
+        )
+        self.token = res.data['token']
+
+    def get_me(self, token):
+        """Get the user's profile with a signed token"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get(ME_URL)
+
+    def test_signed_token_authenticates(self):
+        """Test the signed token authenticates without any query"""
+        self.get_me(self.token) # the user is read once, then cached
+        with self.assertNumQueries(0):
+            res = self.get_me(self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_tampered_or_expired_token_rejected(self):
+        """Test changed and expired tokens are rejected"""
+        user_id, rest = self.token.split(':', 1)
+        tampered = f'{int(user_id) + 1}:{rest}'
+        self.assertEqual(
+            self.get_me(tampered).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+        with patch('django.core.signing.time.time', return_value=10 ** 10):
+            res = self.get_me(self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token(self):
+        """Test a signed token can be exchanged for a new one"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        res = self.client.post(REFRESH_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('expires_in', res.data)
+        self.assertEqual(
+            self.get_me(res.data['token']).status_code, status.HTTP_200_OK
+        )
+        self.assertEqual(
+            read_signed_token(res.data['token'])[2],
+            read_signed_token(self.token)[2],
+        ) # the time of the login is kept
+
+    def test_refresh_limited_since_login(self):
+        """Test a token issued too long ago can't be refreshed"""
+        token = create_signed_token(
+            self.user,
+            int(time.time()) - settings.AUTH_SIGNED_TOKEN_REFRESH_MAX_AGE - 1,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = self.client.post(REFRESH_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_token_not_refreshed(self):
+        """Test the refresh checks the token version in the db"""
+        self.get_me(self.token) # the user is cached
+        get_user_model().objects.filter(pk = self.user.pk).update(
+            token_version = 1,
+        ) # by another process, this one's cache still has the old version
+
+        res = self.client.post(REFRESH_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_tokens(self):
+        """Test changing the password revokes the signed tokens"""
+        self.get_me(self.token)
+        self.client.patch(ME_URL, {'password': 'newpassword'})
+
+        res = self.get_me(self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_signed_tokens(self):
+        """Test bumping the token version revokes the tokens issued"""
+        self.get_me(self.token)
+        self.user.revoke_signed_tokens()
+
+        res = self.get_me(self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
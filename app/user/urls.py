@@ -6,5 +6,6 @@ app_name = 'user' # set to identify which app we are creating the url from when
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name = 'create'), # the name is used to identify for the reverse function in tests
     path('token/', views.CreateTokenView.as_view(), name = 'token'),
+    path('token/refresh/', views.RefreshTokenView.as_view(), name = 'token-refresh'),
     path('me/', views.ManageUserView.as_view(), name = 'me'),
 ]
@@ -1,7 +1,20 @@
 # from django.shortcuts import render
-from rest_framework import generics, authentication, permissions
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication, \
+                                SignedTokenAuthentication, \
+                                create_signed_token, read_signed_token
 
 from .serializers import UserSerializer, AuthTokenSerializer
 
@@ -16,13 +29,57 @@ class CreateTokenView(ObtainAuthToken): # used to generate the auth token
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES # this sets the renderer so we can view this endpoint in the browser with the browsable api
 
+    def post(self, request, *args, **kwargs):
+        if settings.AUTH_TOKEN_MODE != 'signed':
+            return super().post(request, *args, **kwargs) # a token stored in the db
+
+        serializer = self.serializer_class(
+            data = request.data, context = {'request': request}
+        )
+        serializer.is_valid(raise_exception = True)
+        return signed_token_response(serializer.validated_data['user'])
+
+
+class RefreshTokenView(APIView):
+    """Exchange a valid signed token for a new one"""
+    authentication_classes = (SignedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        user_id, token_version, issued_at = read_signed_token(request.auth)
+        # a leaked token can't be renewed for ever, after
+        # AUTH_SIGNED_TOKEN_REFRESH_MAX_AGE the user has to log in again
+        if time.time() - issued_at > settings.AUTH_SIGNED_TOKEN_REFRESH_MAX_AGE:
+            raise AuthenticationFailed(_('Token too old to refresh, log in again.'))
+        # not the cached user, a revoked token or a disabled user is refused
+        # here even while the caches of other processes still have them
+        user = get_user_model().objects.filter(
+            pk = user_id, token_version = token_version, is_active = True,
+        ).first()
+        if user is None:
+            raise AuthenticationFailed(SignedTokenAuthentication.invalid_message)
+
+        return signed_token_response(user, issued_at)
+
+
+def signed_token_response(user, issued_at = None):
+    """Return the response holding a new signed token for a user"""
+    return Response({
+        'token': create_signed_token(user, issued_at),
+        'expires_in': settings.AUTH_SIGNED_TOKEN_MAX_AGE, # seconds, refresh it before that
+    })
+
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication, SignedTokenAuthentication) # keeps the token's user in memory instead of reading it on every request
     permission_classes = (permissions.IsAuthenticated,) # to specify the level of access the user has. here the user must be authenticated to use the API
 
     def get_object(self): # used to get the model for the authenticated (loggen in) user. we are overriding the default method which return the object that the view is displaying
         """Retrieve and return the authenticated user"""
-        return self.request.user # the authentication class (in authentication_classes variable) takes care of assigning the user to the request
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user # the authentication class (in authentication_classes variable) takes care of assigning the user to the request
+        # the user of the request may come from the token caches, saving it
+        # would write its (maybe stale) columns back over the db ones
+        return get_user_model().objects.get(pk = self.request.user.pk)